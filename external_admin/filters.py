@@ -1,7 +1,12 @@
 from django.db import connection
+from django.utils.encoding import force_str
+from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
 
-from products.filters import BaseSQLProductsFilter
+from products.filters import BaseSQLProductsFilter, ProductFilter
+from products.models import ArchivedProduct
+from service.filters import SiteFilter
 from service.utils import get_tuple_from_query_param
 
 
@@ -27,7 +32,8 @@ class ProductAdminSQLFilter(BaseSQLProductsFilter):
             SELECT 
                 JSONB_BUILD_OBJECT(
                     ('image')::text, img.image, 
-                    ('url')::text, img.url
+                    ('url')::text, img.url, 
+                    ('derivatives')::text, img.derivatives
                 ) AS image_info 
             FROM products_productimage AS img 
             WHERE img.product_id = (p.id) LIMIT 1
@@ -74,7 +80,8 @@ class SearchProductAdminSQLFilter(ProductAdminSQLFilter):
             SELECT 
                 JSONB_BUILD_OBJECT(
                     ('image')::text, img.image, 
-                    ('url')::text, img.url
+                    ('url')::text, img.url, 
+                    ('derivatives')::text, img.derivatives
                 ) AS image_info 
             FROM products_productimage AS img 
             WHERE img.product_id = (p.id) LIMIT 1
@@ -105,7 +112,8 @@ class SearchProductAdminSQLFilter(ProductAdminSQLFilter):
             SELECT 
                 JSONB_BUILD_OBJECT(
                     ('image')::text, img.image, 
-                    ('url')::text, img.url
+                    ('url')::text, img.url, 
+                    ('derivatives')::text, img.derivatives
                 ) AS image_info 
             FROM products_productimage AS img 
             WHERE img.product_id = (p.id) LIMIT 1
@@ -137,3 +145,50 @@ class SearchProductAdminSQLFilter(ProductAdminSQLFilter):
             case _:
                 raise ValidationError({'detail': 'unsupported search type!'})
         return sql, params
+
+
+class ProductTierFilter(BaseFilterBackend):
+    """
+    hot: the serving tables (default), cold: the archived products, all: both,
+    goes after ProductFilter, the archived products get the same site, category and ids filters
+    """
+    param = 'tier'
+    description = _('Products tier: hot, cold or all')
+    tiers = ('hot', 'cold', 'all')
+
+    def get_tier(self, request) -> str:
+        tier = request.query_params.get(self.param, 'hot')
+        if tier not in self.tiers:
+            raise ValidationError({self.param: _("Unsupported tier!")})
+        return tier
+
+    def get_archived_queryset(self, request, view):
+        queryset = SiteFilter().filter_queryset(request, ArchivedProduct.objects.all(), view)
+        filters = ProductFilter().get_query_filters(request)
+        if 'categories__id' in filters:
+            filters['category_ids__contains'] = [filters.pop('categories__id')]
+        return queryset.filter(**filters).short_values()
+
+    def filter_queryset(self, request, queryset, view):
+        tier = self.get_tier(request)
+        if tier == 'hot' or view.action != 'list':
+            return queryset
+
+        archived = self.get_archived_queryset(request, view)
+        if tier == 'cold':
+            return archived.order_by('-archived_at')
+        return queryset.order_by().union(archived, all=True).order_by('id')
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.description),
+                'schema': {
+                    'type': 'string',
+                    'enum': list(self.tiers)
+                }
+            }
+        ]
@@ -1,4 +1,7 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
 
 from users.permissions import IsDirector, IsStaffUser
 
@@ -9,3 +12,20 @@ class DirectorViewMixin:
 
 class StaffViewMixin:
     permission_classes = (permissions.IsAuthenticated, IsStaffUser,)
+
+
+class BulkActionMixin:
+    def get_bulk_queryset(self, data):
+        """
+        data: validated BulkActionSerializer data, select_all applies the list filters of the query params
+        """
+        queryset = self.get_queryset()
+        if data['select_all']:
+            queryset = self.filter_queryset(queryset)
+            if queryset.count() > settings.ADMIN_BULK_MAX_OBJECTS:
+                raise ValidationError(
+                    {'select_all': _('Too many objects, max %s') % settings.ADMIN_BULK_MAX_OBJECTS}
+                )
+        if data.get('ids'):
+            queryset = queryset.filter(id__in=data['ids'])
+        return queryset
@@ -8,14 +8,16 @@ from rest_framework import serializers
 
 from orders.serializers import OrderConversionField
 from orders.utils import order_currencies_price_per
-from products.models import Product, Category, Tag, ProductImage, ProductReview, ProductInventory
+from products.models import ArchivedProduct, Product, Category, Tag, ProductImage, ProductReview, ProductInventory
 from products.serializers import ShortProductSerializer
+from products.signals import schedule_image_derivatives
 from promotions.models import Banner, Promotion, Discount
+from promotions.utils import active_promotion_index
 from orders.models import Order, Customer, DeliveryAddress, Receipt, OrderShipping, OrderConversion, Payment
-from service.models import Conversion, Currencies
+from service.models import Conversion, CrawlJob, Currencies
 from service.serializers import ConversionField, AnalyticsSerializer
 from service.utils import get_currencies_price_per, recursive_single_tree, get_currency_by_id, uid_generate, \
-    convert_price
+    convert_price, get_rate_snapshot
 from users.models import User
 
 
@@ -73,7 +75,7 @@ class CategoryAdminSerializer(serializers.ModelSerializer):
 class ShortProductAdminSerializer(ShortProductSerializer):
     class Meta:
         model = Product
-        fields = ('id', 'name', 'avg_rating', 'reviews_count', 'prices', "image", "is_active")
+        fields = ('id', 'name', 'avg_rating', 'reviews_count', 'prices', "image", "image_set", "is_active")
 
 
 class ProductInventorySerializer(serializers.ModelSerializer):
@@ -155,14 +157,7 @@ class ProductDetailAdminSerializer(serializers.ModelSerializer):
         }
 
     def get_discount(self, instance):
-        promotion = instance.promotions.active_promotions().first()
-        if not promotion:
-            return
-
-        try:
-            return promotion.discount.percentage
-        except ObjectDoesNotExist:
-            return
+        return active_promotion_index.discount(instance.id)
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
@@ -187,7 +182,8 @@ class ProductDetailAdminSerializer(serializers.ModelSerializer):
         if tags:
             product.tags.add(*tags)
         if images:
-            ProductImage.objects.bulk_create([ProductImage(product=product, image=image) for image in images])
+            images = ProductImage.objects.bulk_create([ProductImage(product=product, image=image) for image in images])
+            schedule_image_derivatives([image.id for image in images])
         return product
 
     def update(self, instance, validated_data):
@@ -203,10 +199,98 @@ class ProductDetailAdminSerializer(serializers.ModelSerializer):
             instance.tags.add(*tags)
         if images:
             ProductImage.objects.filter(product=instance).delete()
-            ProductImage.objects.bulk_create([ProductImage(product=instance, image=image) for image in images])
+            images = ProductImage.objects.bulk_create([ProductImage(product=instance, image=image) for image in images])
+            schedule_image_derivatives([image.id for image in images])
         return super().update(instance, validated_data)
 
 
+class ArchivedProductAdminSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedProduct
+        fields = (
+            'id', 'name', 'description', 'avg_rating', 'reviews_count', 'is_active', 'created_at', 'category_ids',
+            'inventories', 'images', 'can_choose_tags', 'reason', 'archived_at'
+        )
+        read_only_fields = fields
+
+
+class BulkActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.ADMIN_BULK_MAX_OBJECTS
+    )
+    select_all = serializers.BooleanField(
+        default=False,
+        help_text=_('Apply to all objects matching the list filters of the query params')
+    )
+
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs['select_all']:
+            raise serializers.ValidationError({'ids': _('Pass the ids or select_all')})
+        return attrs
+
+
+class ProductsActivitySerializer(BulkActionSerializer):
+    is_active = serializers.BooleanField()
+
+
+class CategoriesActivitySerializer(BulkActionSerializer):
+    deactivated = serializers.BooleanField()
+
+
+class ReviewsModerationSerializer(BulkActionSerializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.ADMIN_BULK_MAX_OBJECTS
+    )
+    moderated = serializers.BooleanField()
+
+
+class BulkActionResultSerializer(serializers.Serializer):
+    updated = serializers.IntegerField()
+
+
+class CrawlJobAdminSerializer(serializers.ModelSerializer):
+    targets_count = serializers.SerializerMethodField()
+    throughput = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = CrawlJob
+        fields = ('id', 'spider', 'site', 'kind', 'targets_count', 'scrapyd_job_id', 'status', 'error',
+                  'planned_requests', 'requests_count', 'items_count', 'throttled_count', 'throughput',
+                  'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+    def get_targets_count(self, instance) -> int:
+        return len(instance.target_ids)
+
+
+class CrawlJobReportSerializer(serializers.Serializer):
+    items = serializers.IntegerField(min_value=0)
+    requests = serializers.IntegerField(min_value=0)
+    throttled = serializers.IntegerField(min_value=0, default=0, help_text=_('429 responses'))
+    error = serializers.CharField(required=False, allow_blank=True)
+
+
+class IngestionErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    error = serializers.CharField()
+
+
+class ProductIngestionReportSerializer(serializers.Serializer):
+    lines = serializers.IntegerField()
+    rejected = serializers.IntegerField()
+    new = serializers.IntegerField()
+    changed = serializers.IntegerField()
+    unchanged = serializers.IntegerField()
+    batches = serializers.IntegerField()
+    errors = IngestionErrorSerializer(many=True)
+
+
 class ProductReviewAdminSerializer(serializers.ModelSerializer):
     user = UserAdminSerializer(read_only=True)
     product = ShortProductAdminSerializer(many=False, read_only=True)
@@ -372,12 +456,9 @@ class ReceiptAdminSerializer(serializers.ModelSerializer):
         if inventory:
             attrs['unit_price'] = inventory.price
             product = inventory.product
-            promotion = product.promotions.active_promotions().first()
-            if promotion:
-                try:
-                    attrs['discount'] = promotion.discount.percentage
-                except ObjectDoesNotExist:
-                    attrs['discount'] = 0.0
+            discount = active_promotion_index.discount(product.id)
+            if discount is not None:
+                attrs['discount'] = discount
 
             image = product.images.first()
             attrs['shop_url'] = product.shop_url
@@ -428,7 +509,8 @@ class BaseOrderAdminSerializer(serializers.ModelSerializer):
                 price_per = order_currencies_price_per(
                     order_id=receipt.order_id,
                     currency_from=receipt.site_currency,
-                    currency_to=Currencies.yen
+                    currency_to=Currencies.yen,
+                    rate_snapshot_id=instance.rate_snapshot_id
                 )
                 price = convert_price(price, price_per) if price_per else 0.0
 
@@ -450,13 +532,29 @@ class OrderAdminSerializer(BaseOrderAdminSerializer):
     shipping_detail = OrderShippingSerializer(many=False, read_only=True)
     delivery_address = DeliveryAddressAdminSerializer(read_only=True, many=False)
     receipts = ReceiptAdminSerializer(many=True, read_only=True)
-    conversions = OrderConversionSerializer(many=True, read_only=True)
+    conversions = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Order
         fields = ('id', 'status', 'comment', 'customer', 'receipts', 'delivery_address', 'shipping_detail',
                   "conversions", "total_price", "created_at", 'payment')
 
+    def get_conversions(self, instance):
+        if instance.rate_snapshot_id is None:
+            return OrderConversionSerializer(instance.conversions.all(), many=True).data
+
+        return [
+            # price_per as a string, like the DecimalField of OrderConversion
+            {
+                "order": instance.id,
+                "currency_from": currency_from,
+                "currency_to": currency_to,
+                "price_per": str(price_per)
+            }
+            for currency_from, prices in get_rate_snapshot(instance.rate_snapshot_id).items()
+            for currency_to, price_per in prices.items()
+        ]
+
 
 # ------------------------------------------------- Analytics ----------------------------------------------------------
 class OrderAnalyticsSerializer(AnalyticsSerializer):
@@ -6,7 +6,7 @@ from .views import (
     ProductAdminViewSet, ProductReviewAdminViewSet,
     CategoryAdminViewSet, PromotionAdminViewSet,
     OrderAdminViewSet, ConversionAdminViewSet, UserAdminViewSet, ProductInventoryViewSet, TagGroupAdminViewSet,
-    ProductListView, ProductSearchListView
+    ProductListView, ProductSearchListView, ProductIngestionView, CrawlJobAdminViewSet
 )
 
 router = SimpleRouter()
@@ -18,6 +18,7 @@ router.register('orders', OrderAdminViewSet, basename='admin-orders')
 router.register('promotions', PromotionAdminViewSet, basename='admin-promotions')
 router.register('users', UserAdminViewSet, basename='admin-users')
 router.register('conversions', ConversionAdminViewSet, basename='admin-conversions')
+router.register('crawl-jobs', CrawlJobAdminViewSet, basename='admin-crawl-jobs')
 
 analytics_urlpatterns = [
     path('analytics/orders/', OrderAnalyticsView.as_view(), name='admin-analytics-orders'),
@@ -28,6 +29,7 @@ analytics_urlpatterns = [
 urlpatterns = analytics_urlpatterns + [
     path('products/list/', ProductListView.as_view()),
     path('products/search/', ProductSearchListView.as_view()),
+    path('products/ingest/', ProductIngestionView.as_view(), name='admin-products-ingest'),
 
     path('tags/', TagGroupAdminViewSet.as_view(), name="admin-grouped-tags"),
     path('', include(router.urls)),
@@ -1,5 +1,6 @@
 from django.db import transaction
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import generics, mixins, viewsets, status, filters, parsers
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter, OrderingFilter
@@ -8,25 +9,38 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 
 from products.filters import CategoryLevelFilter, ProductFilter
-from service.models import Conversion
-from products.models import Product, ProductReview, Tag, Category, ProductInventory, ProductImage
+from service.crawling import report_job
+from service.models import Conversion, CrawlJob
+from products.archive import restore_products
+from products.ingestion import ingest_products
+from products.models import (
+    ArchivedProduct, Product, ProductReview, Tag, Category, ProductInventory, ProductImage, clear_products_content_hash
+)
+from products.signals import schedule_image_derivatives
+from products.tasks import (
+    category_cache_clear, delete_categories_products, products_activity_changed, products_cache_clear
+)
+from products.utils import set_categories_deactivated, set_products_active, set_reviews_moderated
 from promotions.models import Promotion
 from service.utils import recursive_single_tree
 from users.models import User
 from orders.models import Order
 from service.mixins import CachingMixin
 from service.filters import FilterByFields, DateRangeFilter, ListFilter, SiteFilter
-from .filters import ProductAdminSQLFilter, SearchProductAdminSQLFilter
+from .filters import ProductAdminSQLFilter, ProductTierFilter, SearchProductAdminSQLFilter
 
-from .mixins import DirectorViewMixin, StaffViewMixin
+from .mixins import BulkActionMixin, DirectorViewMixin, StaffViewMixin
 from .paginators import UserListPagination, AdminPagePagination
+from .parsers import NDJSONParser
 from .serializers import (
     ConversionAdminSerializer, PromotionAdminSerializer,
-    ShortProductAdminSerializer, ProductDetailAdminSerializer,
+    ShortProductAdminSerializer, ProductDetailAdminSerializer, ArchivedProductAdminSerializer,
     ProductImageAdminSerializer, UserAdminSerializer, TagAdminSerializer,
     ProductReviewAdminSerializer, OrderAnalyticsSerializer, UserAnalyticsSerializer, ReviewAnalyticsSerializer,
     OrderAdminSerializer, CategoryAdminSerializer, ReceiptAdminSerializer, ProductInventorySerializer,
-    BaseOrderAdminSerializer, ProductImageLoaderSerializer
+    BaseOrderAdminSerializer, ProductImageLoaderSerializer, ProductsActivitySerializer, CategoriesActivitySerializer,
+    ReviewsModerationSerializer, BulkActionResultSerializer, ProductIngestionReportSerializer,
+    CrawlJobAdminSerializer, CrawlJobReportSerializer
 )
 
 
@@ -46,7 +60,7 @@ class UserAdminViewSet(DirectorViewMixin, viewsets.ModelViewSet):
 
 
 # ------------------------------------------------ Categories ----------------------------------------------------------
-class CategoryAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
+class CategoryAdminViewSet(StaffViewMixin, BulkActionMixin, viewsets.ModelViewSet):
     queryset = Category.objects.filter(level__gt=0)
     serializer_class = CategoryAdminSerializer
     pagination_class = AdminPagePagination
@@ -63,6 +77,21 @@ class CategoryAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
         category.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(responses={status.HTTP_200_OK: BulkActionResultSerializer}, request=CategoriesActivitySerializer)
+    @action(methods=['POST'], detail=False, url_path='bulk-activity')
+    def bulk_activity(self, request, **kwargs):
+        serializer = CategoriesActivitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deactivated = serializer.validated_data['deactivated']
+        with transaction.atomic():
+            category_ids = set_categories_deactivated(self.get_bulk_queryset(serializer.validated_data), deactivated)
+
+        if category_ids:
+            if deactivated:
+                delete_categories_products.delay(category_ids)
+            category_cache_clear.delay()
+        return Response({'updated': len(category_ids)})
+
     @action(methods=['GET'], detail=True, url_path='children')
     def children(self, request, **kwargs):
         category = self.get_object()
@@ -103,7 +132,7 @@ class TagGroupAdminViewSet(CachingMixin, StaffViewMixin, generics.ListAPIView):
 
 
 # ----------------------------------------------- Product --------------------------------------------------------------
-class ProductAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
+class ProductAdminViewSet(StaffViewMixin, BulkActionMixin, viewsets.ModelViewSet):
     parser_classes = (parsers.JSONParser, parsers.FormParser, parsers.MultiPartParser)
     queryset = Product.objects.all()
     serializer_class = ShortProductAdminSerializer
@@ -111,7 +140,7 @@ class ProductAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
     pagination_class = AdminPagePagination
     lookup_url_kwarg = "product_id"
     lookup_field = "id"
-    filter_backends = (SiteFilter, OrderingFilter, ProductFilter)
+    filter_backends = (SiteFilter, OrderingFilter, ProductFilter, ProductTierFilter)
     ordering_fields = ("created_at",)
     search_fields = ('id', 'name', 'categories__name')
 
@@ -120,14 +149,64 @@ class ProductAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
             return self.serializer_class
         return self.retrieve_serializer_class
 
+    @extend_schema(
+        responses={status.HTTP_200_OK: ProductDetailAdminSerializer},
+        parameters=[OpenApiParameter(name=ProductTierFilter.param, type=OpenApiTypes.STR, required=False)]
+    )
+    def retrieve(self, request, *args, **kwargs):
+        product_id = kwargs[self.lookup_url_kwarg]
+        if ProductTierFilter().get_tier(request) != 'hot' and not Product.objects.filter(id=product_id).exists():
+            archived_product = get_object_or_404(ArchivedProduct.objects.all(), id=product_id)
+            return Response(ArchivedProductAdminSerializer(archived_product).data)
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(responses={status.HTTP_204_NO_CONTENT: None}, request=None)
+    @action(methods=['POST'], detail=True, url_path='restore')
+    def restore(self, request, **kwargs):
+        product_ids = restore_products([kwargs['product_id']])
+        if not product_ids:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        products_activity_changed.delay(product_ids)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @extend_schema(responses={status.HTTP_204_NO_CONTENT: None})
     @action(methods=['GET'], detail=True, url_path='change-activity')
     def activate_or_deactivate_product(self, request, **kwargs):
+        # an archived product is inactive, the change brings it back active
+        with transaction.atomic():
+            product_ids = restore_products([kwargs['product_id']])
+            if product_ids:
+                set_products_active(Product.objects.filter(id__in=product_ids), True)
+        if product_ids:
+            products_activity_changed.delay(product_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
         product = self.get_object()
         product.is_active = not product.is_active
         product.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(responses={status.HTTP_200_OK: BulkActionResultSerializer}, request=ProductsActivitySerializer)
+    @action(methods=['POST'], detail=False, url_path='bulk-activity')
+    def bulk_activity(self, request, **kwargs):
+        serializer = ProductsActivitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            # the reactivated products come back from the archive first
+            restored_ids = []
+            if serializer.validated_data['is_active'] and serializer.validated_data.get('ids'):
+                restored_ids = restore_products(serializer.validated_data['ids'])
+            product_ids = set_products_active(
+                self.get_bulk_queryset(serializer.validated_data),
+                serializer.validated_data['is_active']
+            )
+            product_ids = list(set(product_ids) | set(restored_ids))
+
+        if product_ids:
+            products_activity_changed.delay(product_ids)
+        return Response({'updated': len(product_ids)})
+
     @extend_schema(responses={status.HTTP_200_OK: None}, request=ProductImageLoaderSerializer)
     @action(methods=['POST'], detail=True, url_path='add-images')
     def add_new_image(self, request, **kwargs):
@@ -137,6 +216,9 @@ class ProductAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
         images = ProductImage.objects.bulk_create(
             [ProductImage(product=product, image=image) for image in serializer.validated_data['images']]
         )
+        # bulk_create doesn't save the images one by one
+        clear_products_content_hash([product.id])
+        schedule_image_derivatives([image.id for image in images])
         return Response(
             ProductImageAdminSerializer(instance=images, many=True, context=self.get_serializer_context()).data,
             status=status.HTTP_200_OK
@@ -192,6 +274,20 @@ class ProductAdminViewSet(StaffViewMixin, viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class ProductIngestionView(StaffViewMixin, generics.GenericAPIView):
+    """
+    NDJSON body, one product per line, see products.ingestion for the line format
+    """
+    parser_classes = (NDJSONParser,)
+
+    @extend_schema(
+        request={NDJSONParser.media_type: OpenApiTypes.BINARY},
+        responses={status.HTTP_200_OK: ProductIngestionReportSerializer}
+    )
+    def post(self, request, *args, **kwargs):
+        return Response(ingest_products(request.data))
+
+
 class ProductInventoryViewSet(StaffViewMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin,
                               mixins.DestroyModelMixin, viewsets.GenericViewSet):
     queryset = ProductInventory.objects.all()
@@ -201,6 +297,7 @@ class ProductInventoryViewSet(StaffViewMixin, mixins.CreateModelMixin, mixins.Up
 # ---------------------------------------------- Reviews ---------------------------------------------------------------
 class ProductReviewAdminViewSet(
     StaffViewMixin,
+    BulkActionMixin,
     mixins.RetrieveModelMixin,
     mixins.DestroyModelMixin,
     mixins.ListModelMixin,
@@ -227,6 +324,20 @@ class ProductReviewAdminViewSet(
         review.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(responses={status.HTTP_200_OK: BulkActionResultSerializer}, request=ReviewsModerationSerializer)
+    @action(methods=['POST'], detail=False, url_path='bulk-moderation')
+    def bulk_moderation(self, request, **kwargs):
+        serializer = ReviewsModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = set_reviews_moderated(
+            self.get_bulk_queryset(serializer.validated_data),
+            serializer.validated_data['moderated']
+        )
+        if updated:
+            # product pages show the ratings
+            products_cache_clear.delay()
+        return Response({'updated': updated})
+
     @action(methods=['GET'], detail=False, url_path='count')
     def new_count(self, request, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -367,6 +478,31 @@ class ConversionAdminViewSet(
     lookup_field = 'id'
 
 
+# ------------------------------------------------ Crawling ------------------------------------------------------------
+class CrawlJobAdminViewSet(StaffViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = CrawlJob.objects.order_by('-created_at')
+    serializer_class = CrawlJobAdminSerializer
+    pagination_class = AdminPagePagination
+    filter_backends = (FilterByFields,)
+    filter_fields = {
+        'site': {'db_field': 'site', 'type': 'string'},
+        'status': {'db_field': 'status', 'type': 'string'},
+    }
+    lookup_url_kwarg = 'job_id'
+    lookup_field = 'id'
+
+    @extend_schema(responses={status.HTTP_204_NO_CONTENT: None}, request=CrawlJobReportSerializer)
+    @action(methods=['POST'], detail=True, url_path='report')
+    def report(self, request, **kwargs):
+        """
+        counters of the crawler at the end of the job, the 429 responses pause the site crawling
+        """
+        serializer = CrawlJobReportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        report_job(self.get_object(), **serializer.validated_data)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # ------------------------------------------------ Analytics -----------------------------------------------------------
 class AnalyticsView(StaffViewMixin, generics.GenericAPIView):
     parser_classes = (parsers.FormParser, parsers.MultiPartParser, parsers.JSONParser)
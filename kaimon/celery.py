@@ -31,4 +31,49 @@ app.conf.task_routes = {
     'products.tasks.*': DEFAULT_QUEUE_ROUTE,
     'orders.tasks.*': DEFAULT_QUEUE_ROUTE,
     'service.tasks.*': DEFAULT_QUEUE_ROUTE,
+    'promotions.tasks.*': DEFAULT_QUEUE_ROUTE,
+}
+
+app.conf.beat_schedule = {
+    'poll-payment-statuses': {
+        'task': 'orders.tasks.poll_payment_statuses',
+        'schedule': 10.0,
+    },
+    'relay-outbox-events': {
+        'task': 'orders.tasks.relay_outbox_events',
+        'schedule': 60.0,
+    },
+    'fit-shipping-rate-models': {
+        'task': 'orders.tasks.fit_shipping_rate_models',
+        'schedule': 3600.0,
+    },
+    # catches product data changes (names, ratings, activity) that don't go through the promotion signals
+    'rebuild-promotion-feeds': {
+        'task': 'promotions.tasks.rebuild_all_promotion_feeds',
+        'schedule': 3600.0,
+    },
+    'reconcile-product-reviews-data': {
+        'task': 'products.tasks.reconcile_product_reviews_data',
+        'schedule': 86400.0,
+    },
+    'enforce-catalog-retention': {
+        'task': 'products.tasks.enforce_catalog_retention',
+        'schedule': 86400.0,
+    },
+    'archive-inactive-products': {
+        'task': 'products.tasks.archive_inactive_products',
+        'schedule': 3600.0,
+    },
+    'crawl-scheduled-targets': {
+        'task': 'service.tasks.crawl_scheduled_targets',
+        'schedule': 300.0,
+    },
+    'refresh-crawl-targets': {
+        'task': 'service.tasks.refresh_crawl_targets',
+        'schedule': 86400.0,
+    },
+    'generate-missing-derivatives': {
+        'task': 'products.tasks.generate_missing_derivatives',
+        'schedule': 600.0,
+    },
 }
@@ -247,13 +247,155 @@ SHIPPER_POSTAL_CODE = "658-0032"
 SHIPPER_CITY = "Kobe"
 SHIPPER_COUNTRY_CODE = "JP"
 FEDEX_DEFAULT_AVG_WEIGHT = 0.300
+# quotes are shared by shipments that fall into the same weight (kg), dimension (cm) and value (yen) buckets
+FEDEX_QUOTE_CACHE = {
+    "TIMEOUT": 3600,
+    "WEIGHT_STEP": 0.5,
+    "DIMENSION_STEP": 5,
+    "VALUE_STEP": 1000,
+    # unit yen prices of the products used for the declared value
+    "PRICE_TIMEOUT": 600,
+}
+SHIPPING_RATE_ESTIMATOR = {
+    # FedEx international volumetric weight: L x W x H (cm) / 5000
+    "VOLUMETRIC_DIVISOR": 5000,
+    "BREAKPOINTS": [0.5, 1, 2, 3, 5, 10, 20, 30, 50],
+    "MIN_SAMPLES": 20,
+    "HISTORY_DAYS": 30,
+    "STALE_HOURS": 48,
+    # confidence: (max relative error, min samples), checked in order
+    "CONFIDENCE": {
+        "high": (0.05, 100),
+        "medium": (0.15, 40),
+    },
+}
 
 DEFAULT_INCREASE_PRICE_PER = 15
+# products per sale prices UPDATE of the promotions recomputation
+PROMOTION_SALE_PRICES_CHUNK_SIZE = 2000
+# max staleness of the per-process active promotions index
+PROMOTION_INDEX_CHECK_SECONDS = 5
+PRODUCT_PRUNING = {
+    # products per transaction, with all their dependent rows
+    "BATCH_SIZE": 1000,
+    "BATCH_SLEEP_SECONDS": 0,
+    # the batches wait for the replicas above this lag, at most MAX_LAG_WAIT_SECONDS per batch
+    "MAX_REPLICATION_LAG_SECONDS": 10,
+    "MAX_LAG_WAIT_SECONDS": 300,
+    "CHECKPOINT_SECONDS": 7 * 24 * 60 * 60,
+}
+
+PRODUCT_RETENTION = {
+    # products evicted per task run
+    "CHUNK_SIZE": 5000,
+    # site limits without a RetentionPolicy, shared by the level 1 categories, no limit for the other sites
+    "SITE_MAX_PRODUCTS": {"rakuten": 1_000_000},
+    # eviction score: days since the last modification plus the inactivity and no orders penalties (in days)
+    "WEIGHTS": {"STALE_DAY": 1, "INACTIVE": 365, "NO_ORDERS": 90},
+}
+
+PRODUCT_ARCHIVE = {
+    # the inactive products stay in the serving tables for a while, a quick reactivation doesn't move them
+    "ARCHIVE_INACTIVE_AFTER_SECONDS": 24 * 60 * 60,
+}
+
+PRODUCT_INGESTION = {
+    # NDJSON lines merged per transaction
+    "BATCH_SIZE": 5000,
+    "MAX_REPORTED_ERRORS": 100,
+}
+# objects per bulk action of the external admin
+ADMIN_BULK_MAX_OBJECTS = 10_000
+PRODUCT_REVIEWS_AGGREGATES = {
+    "CHUNK_SIZE": 2000,
+}
+OUTBOX = {
+    # the commit hook sends the events right away, the sweeper only takes the older ones
+    "SWEEP_AFTER_SECONDS": 60,
+    # a dispatched event not processed after it (lost message, dead worker, exhausted retries) is sent again,
+    # above the retries countdowns of the outbox tasks
+    "REDISPATCH_AFTER_SECONDS": 30 * 60,
+    "MAX_ATTEMPTS": 5,
+    "BATCH_SIZE": 500,
+    "KEEP_DAYS": 7,
+}
+# seconds the signal-triggered tasks wait for the changes to be coalesced into one run (see service.dispatchers)
+DISPATCH_WINDOWS = {
+    "CATEGORY_CACHE_CLEAR": 30,
+    "CATEGORY_PRODUCTS_DELETE": 30,
+    "SALE_PRICES": 10,
+    "REVIEWS_DATA": 30,
+    "IMAGE_DERIVATIVES": 10,
+    "TAG_TRANSLATION": 30,
+}
 
 CRAWLER_URL = config("CRAWLER_URL")
 CRAWLER_USER = config("CRAWLER_USER")
 CRAWLER_PWD = config("CRAWLER_PWD")
 
+CRAWL_SCHEDULER = {
+    "PROJECT": "default",
+    # requests budget of every site, a target costs REQUESTS_PER_TARGET
+    "REQUESTS_PER_HOUR": 20_000,
+    "REQUESTS_PER_TARGET": {"product": 1, "category": 30},
+    "MAX_CONCURRENT_JOBS": 4,
+    # targets per scrapyd job
+    "SHARD_SIZE": {"product": 500, "category": 10},
+    # refresh interval: MAX_INTERVAL without popularity down to MIN_INTERVAL from HOT_POPULARITY,
+    # popularity = REVIEWS * ln(1 + site reviews) + ORDERS * ln(1 + orders)
+    "MIN_INTERVAL_SECONDS": 60 * 60,
+    "MAX_INTERVAL_SECONDS": 7 * 24 * 60 * 60,
+    "HOT_POPULARITY": 10,
+    "WEIGHTS": {"REVIEWS": 1, "ORDERS": 3},
+    # pause of a throttled (429) site, doubled up to MAX_BACKOFF_SECONDS while the throttling goes on
+    "BACKOFF_SECONDS": 5 * 60,
+    "MAX_BACKOFF_SECONDS": 60 * 60,
+    # a running job unknown to scrapyd or older than this is failed, its targets are due again
+    "JOB_TIMEOUT_SECONDS": 6 * 60 * 60,
+    # one scheduler run at a time, longer than a run
+    "LOCK_SECONDS": 10 * 60,
+}
+# service.translation: the texts missing from the translation memory are joined by lines, many per request
+TRANSLATION = {
+    "BASE_URL": "https://translate.googleapis.com/",
+    "BATCH_MAX_TEXTS": 50,
+    # the texts go in the query string
+    "BATCH_MAX_CHARS": 600,
+}
+# resized copies of the product images (see products.images), WebP and JPEG of every size
+IMAGE_DERIVATIVES = {
+    # bounding box of every size (px), the images are never upscaled
+    "SIZES": {"thumbnail": 150, "card": 400, "detail": 1000},
+    # Pillow save options of every format
+    "FORMATS": {
+        "webp": {"quality": 80, "method": 4},
+        "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    },
+    "STORAGE_PATH": "products/derivatives",
+    # rendering processes, 1 renders in the calling process
+    "PROCESSES": config("IMAGE_DERIVATIVES_PROCESSES", cast=int, default=2),
+    # the crawled images (url) are downloaded and rendered too
+    "FETCH_REMOTE": config("IMAGE_DERIVATIVES_FETCH_REMOTE", cast=bool, default=False),
+    "FETCH_TIMEOUT": 10,
+    "MAX_SOURCE_BYTES": 20 * 1024 * 1024,
+    # images per run, the sweep runs up to SWEEP_BATCHES
+    "BATCH_SIZE": 100,
+    "SWEEP_BATCHES": 20,
+}
+# bulk item search of the Rakuten API, straight into the products ingestion (see products.fetching)
+RAKUTEN_FETCHER = {
+    "APP_ID": config("RAKUTEN_APP_ID", default=""),
+    "AFFILIATE_ID": config("RAKUTEN_AFFILIATE_ID", default=None),
+    # quota of the app id, shared by the concurrent requests of one process
+    "REQUESTS_PER_SECOND": 1,
+    "CONCURRENCY": 4,
+    # retries of a throttled (429, 503) page, the backoff doubles from BACKOFF_SECONDS
+    "RETRIES": 5,
+    "BACKOFF_SECONDS": 2,
+    # an interrupted walk continues from the saved genre cursors
+    "CURSOR_SECONDS": 7 * 24 * 60 * 60,
+}
+
 QR_URL_TEMPLATE = config("QR_URL_TEMPLATE")
 PRODUCT_URL_TEMPLATE = config("PRODUCT_URL_TEMPLATE")
 
@@ -275,6 +417,24 @@ PRODUCT_URL_TEMPLATE = config("PRODUCT_URL_TEMPLATE")
 #     }
 # }
 
+# service.clients transport: per-host pools, (connect, read) timeouts and retries of idempotent calls
+HTTP_CLIENTS = {
+    "POOL_CONNECTIONS": 10,
+    "POOL_MAXSIZE": config("HTTP_CLIENTS_POOL_MAXSIZE", cast=int, default=10),
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 30,
+    "RETRIES": 2,
+    "BACKOFF_FACTOR": 0.3,
+    # simultaneous requests per provider of the asyncio clients (service.clients.aio)
+    "CONCURRENCY": 10,
+    "CLIENTS": {
+        "FedexAPIClient": {"READ_TIMEOUT": 20},
+        "PayboxAPI": {"READ_TIMEOUT": 15},
+        "MonetaAPI": {"READ_TIMEOUT": 15},
+        "GoogleTranslateClient": {"READ_TIMEOUT": 15, "CONCURRENCY": 4},
+    }
+}
+
 PAYBOX_ID = config("PAYBOX_ID")
 PAYBOX_SECRET_KEY = config("PAYBOX_SECRET_KEY")
 PAYBOX_SALT = config("PAYBOX_SALT")
@@ -282,6 +442,26 @@ PAYBOX_RESULT_URL = config("PAYBOX_RESULT_URL")
 PAYBOX_SUCCESS_URL = config("PAYBOX_SUCCESS_URL")
 PAYBOX_FAILURE_URL = config("PAYBOX_FAILURE_URL")
 
+PAYMENT_INIT_LOCK_SECONDS = 60
+PAYMENT_INIT_RETRY_SECONDS = 10
+# the payment endpoint reports a failed initiation that long, unless it is retried
+PAYMENT_INIT_FAILURE_SECONDS = 24 * 60 * 60
+PAYMENT_STATUS_POLLER = {
+    "BATCH_SIZE": 500,
+    "LOCK_SECONDS": 120,
+    "DEFAULT": {
+        "FIRST_CHECK_SECONDS": 15,
+        "RETRY_SECONDS": 15,
+        "BACKOFF_FACTOR": 1.5,
+        "MAX_RETRY_SECONDS": 300,
+        "MAX_TRIES": 10,
+    },
+    "paybox": {"RETRY_SECONDS": 30, "MAX_TRIES": 7},
+    "moneta": {"MAX_TRIES": 8},
+}
+
 
 MONETA_MERCHANT_ID = config("MONETA_MERCHANT_ID")
 MONETA_PRIVATE_KEY = config("MONETA_PRIVATE_KEY")
+# verify every own signature after signing, the pooled client always runs a one-time check on startup
+MONETA_VERIFY_SIGNATURES = config("MONETA_VERIFY_SIGNATURES", cast=bool, default=False)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Customer, DeliveryAddress, Order, OrderConversion, OrderShipping, Receipt, Payment
+from .models import Customer, DeliveryAddress, Order, OrderConversion, OrderShipping, Receipt, Payment, \
+    ShippingRateModel
 
 
 @admin.register(Customer)
@@ -20,7 +21,7 @@ class DeliveryAddressAdmin(admin.ModelAdmin):
 
 class OrderConversionInline(admin.StackedInline):
     model = OrderConversion
-    extra = 1
+    extra = 0
 
 
 class OrderShippingDetailInline(admin.StackedInline):
@@ -41,7 +42,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'delivery_address')
     search_fields = ('id', 'customer__email', 'customer__name', 'delivery_address_id')
     list_filter = ('status', 'created_at')
-    readonly_fields = ('id', 'created_at', 'modified_at')
+    readonly_fields = ('id', 'rate_snapshot', 'created_at', 'modified_at')
 
 
 @admin.register(Receipt)
@@ -50,3 +51,9 @@ class ReceiptAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'product_code')
     search_fields = ('id', 'order_id', 'product_code', "product_name", "shop_code")
     readonly_fields = ("id",)
+
+
+@admin.register(ShippingRateModel)
+class ShippingRateModelAdmin(admin.ModelAdmin):
+    list_display = ('country_code', 'currency', 'samples', 'relative_error', 'min_weight', 'max_weight', 'fitted_at')
+    readonly_fields = ('breakpoints', 'coefficients', 'fitted_at')
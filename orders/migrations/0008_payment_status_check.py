@@ -0,0 +1,23 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_payment_remove_paymenttransactionreceipt_order_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentStatusCheck',
+            fields=[
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status_check', serialize=False, to='orders.payment')),
+                ('tries', models.PositiveIntegerField(default=0)),
+                ('next_check_at', models.DateTimeField(db_index=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
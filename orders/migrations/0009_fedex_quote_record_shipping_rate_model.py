@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_payment_status_check'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FedexQuoteRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_code', models.CharField(db_index=True, max_length=10)),
+                ('postal_code', models.CharField(blank=True, max_length=50, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('packages_count', models.PositiveIntegerField(default=1)),
+                ('weight', models.FloatField()),
+                ('volumetric_weight', models.FloatField()),
+                ('chargeable_weight', models.FloatField()),
+                ('declared_value', models.FloatField(default=0)),
+                ('total_net_charge', models.FloatField()),
+                ('currency', models.CharField(max_length=10)),
+                ('surcharges', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShippingRateModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_code', models.CharField(max_length=10, unique=True)),
+                ('currency', models.CharField(max_length=10)),
+                ('breakpoints', models.JSONField(default=list)),
+                ('coefficients', models.JSONField(default=list)),
+                ('min_weight', models.FloatField()),
+                ('max_weight', models.FloatField()),
+                ('samples', models.PositiveIntegerField()),
+                ('relative_error', models.FloatField()),
+                ('fitted_at', models.DateTimeField()),
+            ],
+        ),
+    ]
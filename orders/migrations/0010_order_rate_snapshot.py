@@ -0,0 +1,20 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0004_rate_snapshot'),
+        ('orders', '0009_fedex_quote_record_shipping_rate_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='rate_snapshot',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='service.ratesnapshot'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_rate_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['product_code'], name='orders_rece_product_d9284b_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-19 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_receipt_product_code_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentstatuscheck',
+            name='errors',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
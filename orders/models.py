@@ -3,7 +3,8 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from service.models import Currencies
+from service.models import Currencies, RateSnapshot
+from service.utils import current_rate_snapshot_id
 from users.utils import get_sentinel_user
 
 from .querysets import OrderAnalyticsQuerySet
@@ -75,11 +76,18 @@ class Order(BaseModel):
     delivery_address = models.ForeignKey(DeliveryAddress, on_delete=models.RESTRICT, related_name='orders')
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.wait_payment)
     comment = models.TextField(null=True, blank=True)
+    # conversions in effect at the order creation, the orders before the snapshots have OrderConversion rows
+    rate_snapshot = models.ForeignKey(RateSnapshot, on_delete=models.PROTECT, related_name='orders', null=True)
 
     @property
     def bayer_code(self):
         return getattr(self.customer, 'bayer_code')
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.rate_snapshot_id is None:
+            self.rate_snapshot_id = current_rate_snapshot_id()
+        super().save(*args, **kwargs)
+
 
 class OrderShipping(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='shipping_detail')
@@ -89,6 +97,7 @@ class OrderShipping(models.Model):
 
 
 class OrderConversion(models.Model):
+    # legacy: per order copy of the conversions, replaced with Order.rate_snapshot
     objects = models.Manager()
 
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='conversions')
@@ -117,6 +126,12 @@ class Receipt(BaseModel):
     )
     tags = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = (
+            # the catalog retention looks up the ordered products
+            models.Index(fields=("product_code",)),
+        )
+
     @property
     def total_price(self):
         discount = getattr(self, 'discount')
@@ -149,3 +164,54 @@ class Payment(models.Model):
     payment_meta = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+
+
+class PaymentStatusCheck(models.Model):
+    """
+    scheduling table of the payment status poller, a row lives while the payment waits for a final status
+    """
+    objects = models.Manager()
+
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, primary_key=True, related_name='status_check')
+    tries = models.PositiveIntegerField(default=0)
+    # failed checks in a row (provider errors), they don't count as tries
+    errors = models.PositiveIntegerField(default=0)
+    next_check_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+
+class FedexQuoteRecord(models.Model):
+    """
+    history of the live FedEx quotes, training data of the shipping rate estimator
+    """
+    objects = models.Manager()
+
+    country_code = models.CharField(max_length=10, db_index=True)
+    postal_code = models.CharField(max_length=50, blank=True, null=True)
+    city = models.CharField(max_length=100, blank=True, null=True)
+    packages_count = models.PositiveIntegerField(default=1)
+    weight = models.FloatField()
+    volumetric_weight = models.FloatField()
+    chargeable_weight = models.FloatField()
+    declared_value = models.FloatField(default=0)
+    total_net_charge = models.FloatField()
+    currency = models.CharField(max_length=10)
+    surcharges = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class ShippingRateModel(models.Model):
+    """
+    piecewise linear rate by chargeable weight per country, fitted from FedexQuoteRecord
+    """
+    objects = models.Manager()
+
+    country_code = models.CharField(max_length=10, unique=True)
+    currency = models.CharField(max_length=10)
+    breakpoints = models.JSONField(default=list)
+    coefficients = models.JSONField(default=list)
+    min_weight = models.FloatField()
+    max_weight = models.FloatField()
+    samples = models.PositiveIntegerField()
+    relative_error = models.FloatField()
+    fitted_at = models.DateTimeField()
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+
+from service.clients import aio, AsyncPayboxAPI
+from service.clients.moneta import AsyncMonetaAPI
+from service.models import Currencies
+from service.utils import convert_price, get_currencies_price_per
+
+from .models import Order, Payment, PaymentStatusCheck
+from .utils import (
+    qrcode_for_url, get_health_usd_price_per, get_moneta_client, get_paybox_client, get_async_paybox_client,
+    get_async_moneta_client
+)
+
+
+class PaymentNotCreated(Exception):
+    """
+    the provider invoice can't be created for the order: nothing to pay or no exchange rate
+    """
+
+
+def payment_lock_key(order_id) -> str:
+    return "order_payment_init:%s" % order_id
+
+
+def payment_failure_key(order_id) -> str:
+    return "order_payment_failure:%s" % order_id
+
+
+def payment_failure(order_id) -> str | None:
+    return caches["default"].get(payment_failure_key(order_id))
+
+
+def set_payment_failure(order_id, reason: str | None) -> None:
+    """
+    the reason the payment of the order isn't created (None clears it), reported by the payment endpoint
+    until a new attempt
+    """
+    if reason is None:
+        caches["default"].delete(payment_failure_key(order_id))
+        return
+    logging.error("Payment for order %s is not created: %s" % (order_id, reason))
+    caches["default"].set(payment_failure_key(order_id), reason, timeout=settings.PAYMENT_INIT_FAILURE_SECONDS)
+
+
+def get_receipts_amount(receipts, target_currency: str, intermediate_currency: str = None):
+    if intermediate_currency:
+        assert target_currency != intermediate_currency
+
+    amount = 0
+    for receipt in receipts:
+        if receipt.site_currency == target_currency:
+            amount += receipt.total_price
+            continue
+
+        if not intermediate_currency:
+            amount += convert_price(
+                receipt.total_price,
+                get_currencies_price_per(
+                    currency_from=receipt.site_currency,
+                    currency_to=target_currency
+                )
+            )
+            continue
+
+        # ex: yen -> usd -> moneta
+        if receipt.site_currency != intermediate_currency:
+            main_price_per = get_currencies_price_per(
+                currency_from=receipt.site_currency,
+                currency_to=intermediate_currency
+            )
+            price = convert_price(receipt.total_price, main_price_per)
+        else:
+            price = receipt.total_price
+
+        price_per = get_currencies_price_per(
+            currency_from=target_currency,
+            currency_to=intermediate_currency
+        )
+        amount += convert_price(price, price_per, divide=True)
+    return amount
+
+
+def make_paybox_payment(order, receipts) -> Payment:
+    usd_amount = get_receipts_amount(receipts, target_currency=Currencies.usd)
+    if usd_amount <= 0:
+        raise PaymentNotCreated("the order amount is %s USD" % usd_amount)
+
+    payment_client = get_paybox_client()
+    invoice_data = payment_client.init_transaction(
+        order_id=order.id,
+        amount=usd_amount,
+        description="Payment for Kaimono order No.%s via Paybox" % order.id,
+        currency="USD",
+        salt=settings.PAYBOX_SALT,
+        result_url=settings.PAYBOX_RESULT_URL,
+        success_url=settings.PAYBOX_SUCCESS_URL,
+        failure_url=settings.PAYBOX_FAILURE_URL
+    )['response']
+    return Payment.objects.create(
+        order=order,
+        payment_id=invoice_data["pg_payment_id"],
+        payment_type=Payment.PaymentType.paybox,
+        payment_link=invoice_data["pg_redirect_url"],
+        payment_meta=invoice_data
+    )
+
+
+def make_moneta_payment(order, receipts) -> Payment:
+    usd_amount = get_receipts_amount(receipts, target_currency=Currencies.usd)
+    if usd_amount <= 0:
+        raise PaymentNotCreated("the order amount is %s USD" % usd_amount)
+
+    client = get_moneta_client()
+    health_price_per = get_health_usd_price_per(client)
+    health_amount = convert_price(usd_amount, price_per=health_price_per) if health_price_per else 0
+    if health_amount <= 0:
+        raise PaymentNotCreated("no HEALTH amount for %s USD" % usd_amount)
+
+    data = client.invoice(
+        amount=health_amount,
+        meta={"title": "Payment for Kaimono order No.%s via Moneta Today" % order.id},
+        coin="HEALTH"
+    )
+    invoice_data = data.get("result", {})
+    payment_link = invoice_data["paymentLink"]
+    payment_id = invoice_data["invoiceId"]
+    return Payment.objects.create(
+        order=order,
+        payment_id=payment_id,
+        payment_type=Payment.PaymentType.moneta,
+        payment_link=payment_link,
+        payment_meta=invoice_data,
+        qrcode=qrcode_for_url(f"moneta:{payment_id}", url=payment_link)
+    )
+
+
+def init_order_payment(order: Order, payment_type: str) -> tuple[Payment | None, bool]:
+    """
+    Creates the provider invoice for an already committed order.
+    Safe to call repeatedly: an existing payment is returned as is and concurrent calls for
+    the same order are serialized through a short-lived cache lock, so provider calls never
+    run inside a database transaction.
+    Raises PaymentNotCreated when there is nothing the provider can invoice.
+    """
+    try:
+        return order.payment, False
+    except ObjectDoesNotExist:
+        pass
+
+    cache = caches["default"]
+    lock_key = payment_lock_key(order.id)
+    if not cache.add(lock_key, 1, timeout=settings.PAYMENT_INIT_LOCK_SECONDS):
+        logging.info("Payment initiation for order %s is already in progress" % order.id)
+        return None, False
+
+    try:
+        payment = Payment.objects.filter(order_id=order.id).first()
+        if payment:
+            return payment, False
+
+        receipts = list(order.receipts.all())
+        match payment_type:
+            case Payment.PaymentType.paybox:
+                payment = make_paybox_payment(order, receipts)
+            case Payment.PaymentType.moneta:
+                payment = make_moneta_payment(order, receipts)
+            case _:
+                raise ValueError("Payment type %s not supported!" % payment_type)
+        return payment, True
+    finally:
+        cache.delete(lock_key)
+
+
+def poller_settings(payment_type: str) -> dict:
+    poller = settings.PAYMENT_STATUS_POLLER
+    return {**poller["DEFAULT"], **poller.get(payment_type, {})}
+
+
+def get_payment_expiration(payment: Payment) -> datetime | None:
+    expired_date_string = (payment.payment_meta or {}).get("expiredBy", "")
+    try:
+        return datetime.strptime(expired_date_string, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def schedule_status_check(payment: Payment) -> PaymentStatusCheck:
+    first_check_seconds = poller_settings(payment.payment_type)["FIRST_CHECK_SECONDS"]
+    check, _ = PaymentStatusCheck.objects.get_or_create(
+        payment=payment,
+        defaults={
+            "next_check_at": timezone.now() + timedelta(seconds=first_check_seconds),
+            "expires_at": get_payment_expiration(payment)
+        }
+    )
+    return check
+
+
+async def get_paybox_status(client: AsyncPayboxAPI, payment: Payment) -> str | None:
+    response_data = await client.get_transaction_status(
+        payment_id=str(payment.payment_id),
+        order_id=str(payment.order_id),
+        salt=settings.PAYBOX_SALT
+    )
+    if response_data.get("response", {}).get("pg_status", "") == "ok":
+        return Order.Status.pending
+    return None
+
+
+async def get_moneta_status(client: AsyncMonetaAPI, payment: Payment) -> str | None:
+    response_data = await client.status(payment.payment_id)
+    match response_data.get("result", {}).get("status", ""):
+        case "PAID":
+            return Order.Status.pending
+        case "EXPIRED":
+            return Order.Status.payment_rejected
+    return None
+
+
+async def fetch_payment_statuses_async(payments: list[Payment]) -> dict[int, str | Exception | None]:
+    clients = {
+        Payment.PaymentType.paybox: (get_async_paybox_client(), get_paybox_status),
+        Payment.PaymentType.moneta: (get_async_moneta_client(), get_moneta_status),
+    }
+
+    async def fetch(payment):
+        client, get_status = clients[payment.payment_type]
+        try:
+            return payment.order_id, await get_status(client, payment)
+        except Exception as e:
+            logging.error("Payment status check for order %s failed: %s" % (payment.order_id, e))
+            return payment.order_id, e
+
+    return dict(await asyncio.gather(*(fetch(payment) for payment in payments)))
+
+
+def fetch_payment_statuses(payments: list[Payment]) -> dict[int, str | Exception | None]:
+    """
+    Queries the providers concurrently, bounded by the per-provider HTTP_CLIENTS concurrency.
+    Returns the new order status per order id, None means that the payment is still pending,
+    an exception that the status is unknown (the provider failed).
+    """
+    return aio.run(fetch_payment_statuses_async(payments))
+
+
+def next_status_check(check: PaymentStatusCheck, now: datetime) -> tuple[str | None, datetime | None]:
+    """
+    Returns the final order status if the payment must be rejected, otherwise the time of the next check
+    """
+    config = poller_settings(check.payment.payment_type)
+    if check.expires_at and now >= check.expires_at:
+        return Order.Status.payment_rejected, None
+
+    if check.tries > config["MAX_TRIES"]:
+        if check.expires_at:
+            # the last check right after the invoice expiration
+            return None, check.expires_at + timedelta(seconds=5)
+        return Order.Status.payment_rejected, None
+
+    return None, now + retry_delay(config, check.tries)
+
+
+def retry_delay(config: dict, attempts: int) -> timedelta:
+    delay = config["RETRY_SECONDS"] * config["BACKOFF_FACTOR"] ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, config["MAX_RETRY_SECONDS"]))
+
+
+def poll_due_payments(batch_size: int) -> dict[str, int]:
+    now = timezone.now()
+    waiting = {"payment__order__status": Order.Status.wait_payment}
+    PaymentStatusCheck.objects.exclude(**waiting).delete()
+
+    checks = list(
+        PaymentStatusCheck.objects.select_related("payment")
+                                  .filter(next_check_at__lte=now, **waiting)
+                                  .order_by("next_check_at")[:batch_size]
+    )
+    if not checks:
+        return {}
+
+    statuses = fetch_payment_statuses([check.payment for check in checks])
+    now = timezone.now()
+    final_statuses = {}
+    rescheduled = []
+
+    for check in checks:
+        order_id = check.payment.order_id
+        status = statuses.get(order_id)
+        if isinstance(status, Exception):
+            # an outage says nothing of the payment: checked again with a backoff, never rejected for it
+            check.errors += 1
+            check.next_check_at = now + retry_delay(poller_settings(check.payment.payment_type), check.errors)
+            status = None
+        elif status is None:
+            check.tries += 1
+            check.errors = 0
+            status, check.next_check_at = next_status_check(check, now)
+
+        if status is None:
+            rescheduled.append(check)
+        else:
+            final_statuses.setdefault(status, []).append(order_id)
+
+    for status, order_ids in final_statuses.items():
+        Order.objects.filter(id__in=order_ids, status=Order.Status.wait_payment).update(status=status, modified_at=now)
+        PaymentStatusCheck.objects.filter(payment_id__in=order_ids).delete()
+
+    if rescheduled:
+        PaymentStatusCheck.objects.bulk_update(rescheduled, fields=("tries", "errors", "next_check_at"))
+    return {status: len(order_ids) for status, order_ids in final_statuses.items()}
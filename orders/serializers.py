@@ -1,25 +1,26 @@
-import logging
 from collections import OrderedDict
 
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import caches
 from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from requests import HTTPError
-from rest_framework import serializers, status
+from rest_framework import serializers
 
 from products.models import Product, ProductInventory
-from service.clients import fedex, PayboxAPI
-from service.clients.moneta import MonetaAPI
-from service.models import Currencies
+from promotions.utils import active_promotion_index
+from service.clients import fedex
+from service.outbox import publish
 from service.serializers import ConversionField
-from service.utils import get_currency_by_id, convert_price, get_currencies_price_per
+from service.utils import get_currency_by_id, convert_price
 
 from .models import DeliveryAddress, Order, Receipt, Payment
-from .tasks import check_paybox_status_for_order, check_moneta_status
-from .utils import duplicate_delivery_address, get_product_yen_price, order_currencies_price_per, create_customer, \
-    qrcode_for_url, get_health_usd_price_per
+from .shipping import build_fedex_shipment, estimate_quote, record_quote
+from .tasks import init_payment_for_order
+from .utils import (
+    duplicate_delivery_address, order_currencies_price_per, create_customer, get_fedex_client, fedex_quote_cache_key
+)
 
 
 class DeliveryAddressSerializer(serializers.ModelSerializer):
@@ -46,16 +47,20 @@ class OrderConversionField(ConversionField):
         super().__init__(*args, **kwargs)
         self.order_id_field = order_id_field
         self.order_id = None
+        self.rate_snapshot_id = None
 
     def _init_instance_currency(self, instance):
         self._instance_currency = instance.site_currency
         self.order_id = getattr(instance, self.order_id_field)
+        # the receipts of order.receipts have the order cached
+        self.rate_snapshot_id = instance.order.rate_snapshot_id
 
     def _convert(self, value, target_currency):
         price_per = order_currencies_price_per(
             order_id=self.order_id,
             currency_from=self._instance_currency,
-            currency_to=target_currency
+            currency_to=target_currency,
+            rate_snapshot_id=self.rate_snapshot_id
         )
         return convert_price(value, price_per) if price_per else None
 
@@ -93,12 +98,9 @@ class ReceiptSerializer(serializers.ModelSerializer):
 
         attrs['unit_price'] = inventory.price
         product = inventory.product
-        promotion = product.promotions.active_promotions().first()
-        if promotion:
-            try:
-                attrs['discount'] = promotion.discount.percentage
-            except ObjectDoesNotExist:
-                attrs['discount'] = 0.0
+        discount = active_promotion_index.discount(product.id)
+        if discount is not None:
+            attrs['discount'] = discount
 
         image = product.images.first()
         image_url = None
@@ -136,7 +138,11 @@ class PaymentSerializer(serializers.ModelSerializer):
 
 
 class OrderSerializer(serializers.ModelSerializer):
-    payment_type = serializers.ChoiceField(choices=("paybox", "moneta"), default="paybox", write_only=True)
+    payment_type = serializers.ChoiceField(
+        choices=Payment.PaymentType.choices,
+        default=Payment.PaymentType.paybox,
+        write_only=True
+    )
     address_id = serializers.PrimaryKeyRelatedField(
         queryset=DeliveryAddress.objects.all(),
         write_only=True,
@@ -144,7 +150,7 @@ class OrderSerializer(serializers.ModelSerializer):
     )
     delivery_address = DeliveryAddressSerializer(many=False, read_only=True)
     receipts = ReceiptSerializer(many=True, required=True)
-    payment = PaymentSerializer(read_only=True, many=False)
+    payment = PaymentSerializer(read_only=True, many=False, allow_null=True)
 
     class Meta:
         model = Order
@@ -168,7 +174,6 @@ class OrderSerializer(serializers.ModelSerializer):
         validated_data['delivery_address'] = validated_data.pop('address_id')
 
         products_data = validated_data.pop('receipts')
-        payment = None
 
         with transaction.atomic():
             order = super().create(validated_data)
@@ -181,136 +186,19 @@ class OrderSerializer(serializers.ModelSerializer):
                 receipt = Receipt(**product_data)
                 new_receipts.append(receipt)
 
-            receipts = Receipt.objects.bulk_create(new_receipts)
-            try:
-                match payment_type:
-                    case "paybox":
-                        payment = self._make_paybox(order, receipts)
-                    case "moneta":
-                        payment = self._make_moneta(order, receipts)
-            except Exception as e:
-                payment = None
-                logging.error(e)
-
-        if not payment:
-            raise serializers.ValidationError(
-                {"detail": "Something went wrong. Please try again another time."},
-                code=status.HTTP_402_PAYMENT_REQUIRED
-            )
+            Receipt.objects.bulk_create(new_receipts)
+            # provider calls must not hold the order transaction open
+            publish(init_payment_for_order, order.id, payment_type)
         return order
 
-    @staticmethod
-    def _get_receipts_amount(receipts, target_currency: str, intermediate_currency: str = None):
-        if intermediate_currency:
-            assert target_currency != intermediate_currency
-
-        amount = 0
-        for receipt in receipts:
-            if receipt.site_currency == target_currency:
-                amount += receipt.total_price
-                continue
-
-            if not intermediate_currency:
-                amount += convert_price(
-                    receipt.total_price,
-                    get_currencies_price_per(
-                        currency_from=receipt.site_currency,
-                        currency_to=target_currency
-                    )
-                )
-                continue
-
-            # ex: yen -> usd -> moneta
-            if receipt.site_currency != intermediate_currency:
-                main_price_per = get_currencies_price_per(
-                    currency_from=receipt.site_currency,
-                    currency_to=intermediate_currency
-                )
-                price = convert_price(receipt.total_price, main_price_per)
-            else:
-                price = receipt.total_price
-
-            price_per = get_currencies_price_per(
-                currency_from=target_currency,
-                currency_to=intermediate_currency
-            )
-            amount += convert_price(price, price_per, divide=True)
-        return amount
-
-    def _make_paybox(self, order, receipts) -> Payment | None:
-        usd_amount = self._get_receipts_amount(receipts, target_currency=Currencies.usd)
-        if usd_amount <= 0:
-            return
 
-        payment_client = PayboxAPI(
-            merchant_id=settings.PAYBOX_ID,
-            secret_key=settings.PAYBOX_SECRET_KEY
-        )
-        invoice_data = payment_client.init_transaction(
-            order_id=order.id,
-            amount=usd_amount,
-            description="Payment for Kaimono order No.%s via Paybox" % order.id,
-            currency="USD",
-            salt=settings.PAYBOX_SALT,
-            result_url=settings.PAYBOX_RESULT_URL,
-            success_url=settings.PAYBOX_SUCCESS_URL,
-            failure_url=settings.PAYBOX_FAILURE_URL
-        )['response']
-        payment_client.session.close()
-        payment_link = invoice_data["pg_redirect_url"]
-        payment = Payment.objects.create(
-            order=order,
-            payment_id=invoice_data["pg_payment_id"],
-            payment_type=Payment.PaymentType.paybox,
-            payment_link=payment_link,
-            payment_meta=invoice_data
-        )
-        check_paybox_status_for_order.apply_async(
-            eta=timezone.now() + timezone.timedelta(seconds=15),
-            args=(order.id, 1, 7, 30)
-        )
-        return payment
-
-    def _make_moneta(self, order, receipts) -> Payment | None:
-        usd_amount = self._get_receipts_amount(receipts, target_currency=Currencies.usd)
-        if usd_amount <= 0:
-            return
-
-        client = MonetaAPI(merchant_id=settings.MONETA_MERCHANT_ID, private_key=settings.MONETA_PRIVATE_KEY)
-        health_price_per = get_health_usd_price_per(client)
-        health_amount = convert_price(usd_amount, price_per=health_price_per) if health_price_per else 0
-        if health_amount <= 0:
-            return
-
-        data = client.invoice(
-            amount=health_amount,
-            meta={"title": "Payment for Kaimono order No.%s via Moneta Today" % order.id},
-            coin="HEALTH"
-        )
-        invoice_data = data.get("result", {})
-        payment_link = invoice_data["paymentLink"]
-        payment_id = invoice_data["invoiceId"]
-        payment = Payment.objects.create(
-            order=order,
-            payment_id=payment_id,
-            payment_type=Payment.PaymentType.moneta,
-            payment_link=payment_link,
-            payment_meta=invoice_data,
-            qrcode=qrcode_for_url(f"moneta:{payment_id}", url=payment_link)
-        )
-        check_moneta_status.apply_async(
-            eta=timezone.now() + timezone.timedelta(seconds=15),
-            args=(order.id, 1, 8, 15)  # order_id, tries, max_tries, retry_sec
-        )
-        return payment
+class PaymentInitSerializer(serializers.Serializer):
+    payment_type = serializers.ChoiceField(choices=Payment.PaymentType.choices, default=Payment.PaymentType.paybox)
 
 
 class ProductQuantitySerializer(serializers.Serializer):
-    product = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.filter(is_active=True),
-        write_only=True,
-        required=True
-    )
+    # resolved for all products at once in FedexQuoteRateSerializer.validate_products
+    product = serializers.CharField(write_only=True, required=True)
     quantity = serializers.IntegerField(write_only=True, default=1)
     width = serializers.IntegerField(write_only=True, required=True)
     length = serializers.IntegerField(write_only=True, required=True)
@@ -326,70 +214,70 @@ class FedexQuoteRateSerializer(serializers.Serializer):
     postal_code = serializers.CharField(required=False, write_only=True)
     city = serializers.CharField(required=False, write_only=True)
     products = ProductQuantitySerializer(many=True, write_only=True, required=True)
+    # estimate: answer from the fitted rate model, live quote only if the model can't answer
+    mode = serializers.ChoiceField(choices=('live', 'estimate'), default='live', write_only=True)
+
+    def validate_products(self, products):
+        product_ids = {data['product'] for data in products}
+        found_ids = set(Product.objects.filter(id__in=product_ids, is_active=True).values_list('id', flat=True))
+        missing_ids = product_ids - found_ids
+        if missing_ids:
+            raise serializers.ValidationError(
+                _("Invalid pk \"%s\" - object does not exist.") % ", ".join(sorted(missing_ids))
+            )
+        return products
 
     def validate(self, attrs):
         try:
             country_code = attrs['country_code']
             postal_code = attrs.get('postal_code') or "0000"
             city = attrs.get("city")
+            commodities, package_line_items = build_fedex_shipment(attrs['products'])
 
-            commodities = []
-            package_line_items = []
-            for data in attrs['products']:
-                product = data['product']
-                category = product.categories.filter(avg_weight__isnull=False).first()
-                avg_weight = settings.FEDEX_DEFAULT_AVG_WEIGHT
-                if category and category.avg_weight > 0:
-                    avg_weight = category.avg_weight
-
-                quantity = data['quantity']
-                width, length, height = data['width'], data['length'], data['height']
-                commodities.append(
-                    fedex.FedexCommodity(
-                        weight=fedex.FedexWeight(units="KG", value=avg_weight),
-                        currency_amount=fedex.FedexCurrencyAmount(
-                            currency='JYE',
-                            amount=float(get_product_yen_price(product, quantity))
-                        ),
-                        quantity=quantity
-                    )
-                )
-                package_line_items.append(
-                    fedex.FedexRequestedPackageLineItem(
-                        weight=fedex.FedexWeight(units="KG", value=avg_weight),
-                        dimensions=fedex.FedexDimension(width=width, length=length, height=height)
-                    )
-                )
-
-            client = fedex.FedexAPIClient(
-                client_id=settings.FEDEX_CLIENT_ID,
-                client_secret=settings.FEDEX_SECRET,
-                account_number=settings.FEDEX_ACCOUNT_NUMBER
+            recipient = fedex.FedexAddress(
+                postal_code=postal_code,
+                country_code=country_code,
+                city=city,
+                residential=False
             )
+            if attrs['mode'] == 'estimate':
+                estimate = estimate_quote(country_code, package_line_items)
+                if estimate:
+                    return {"mode": "estimate", **estimate}
+
+            ship_date = timezone.localtime(timezone.now()).date()
+            cache = caches["default"]
+            cache_key = fedex_quote_cache_key(recipient, commodities, package_line_items, ship_date)
+            output = cache.get(cache_key)
+            if output is not None:
+                return output
+
+            client = get_fedex_client()
             fedex_response = client.international_rate_quotes(
                 shipper=fedex.FedexAddress(
                     postal_code=settings.SHIPPER_POSTAL_CODE,
                     country_code=settings.SHIPPER_COUNTRY_CODE,
                     residential=False
                 ),
-                recipient=fedex.FedexAddress(
-                    postal_code=postal_code,
-                    country_code=country_code,
-                    city=city,
-                    residential=False
-                ),
+                recipient=recipient,
                 commodities=commodities,
                 package_line_items=package_line_items,
-                ship_date=timezone.localtime(timezone.now()).date()
+                ship_date=ship_date
             )
         except HTTPError as http_exc:
             error_data = http_exc.response.json()
             raise serializers.ValidationError({'detail': error_data['errors']})
         else:
+            cache.set(cache_key, fedex_response['output'], timeout=settings.FEDEX_QUOTE_CACHE["TIMEOUT"])
+            record_quote(recipient, commodities, package_line_items, fedex_response['output'])
             return fedex_response['output']
 
     def to_representation(self, validated_data):
+        if validated_data.get('mode') == 'estimate':
+            return validated_data
+
         data = OrderedDict()
+        data['mode'] = 'live'
         rate_details = validated_data['rateReplyDetails'][0]
         data['service_name'] = rate_details['serviceName']
         data['arrives_on'] = rate_details['commit']['dateDetail']['dayFormat']
@@ -0,0 +1,247 @@
+import logging
+from datetime import timedelta
+from typing import Any
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.utils import timezone
+
+from products.models import Category, ProductInventory
+from service.clients.fedex import (
+    FedexAddress, FedexCommodity, FedexCurrencyAmount, FedexDimension, FedexRequestedPackageLineItem, FedexWeight
+)
+from service.models import Currencies
+from service.utils import get_currency_by_id, get_currencies_price_per, convert_price
+
+from .models import FedexQuoteRecord, ShippingRateModel
+
+
+def get_products_avg_weights(product_ids: list[str]) -> dict[str, float]:
+    """
+    avg_weight of the deepest product category that has it, one query for all products
+    """
+    weights = {}
+    categories = (
+        Category.objects.filter(products__id__in=product_ids, avg_weight__gt=0)
+                        .order_by('products__id', '-level')
+                        .values_list('products__id', 'avg_weight')
+    )
+    for product_id, avg_weight in categories:
+        weights.setdefault(product_id, avg_weight)
+    return weights
+
+
+def yen_price_cache_key(product_id: str) -> str:
+    return "product_yen_price:%s" % product_id
+
+
+def get_products_yen_prices(product_ids: list[str]) -> dict[str, float]:
+    """
+    unit yen price of the products (first inventory), kept by product id in the cache for a short time
+    """
+    cache = caches["default"]
+    cached = cache.get_many([yen_price_cache_key(product_id) for product_id in product_ids])
+    prices = {product_id: cached[yen_price_cache_key(product_id)] for product_id in product_ids
+              if yen_price_cache_key(product_id) in cached}
+
+    missing_ids = [product_id for product_id in product_ids if product_id not in prices]
+    if not missing_ids:
+        return prices
+
+    inventories = (
+        ProductInventory.objects.filter(product_id__in=missing_ids)
+                                .order_by('product_id', 'id')
+                                .distinct('product_id')
+                                .only('product_id', 'site_price', 'sale_price', 'increase_per')
+    )
+    prices_per = {}
+    new_prices = {}
+    for inventory in inventories:
+        currency = get_currency_by_id(inventory.product_id)
+        price = inventory.sale_price or inventory.price
+        if currency != Currencies.yen:
+            if currency not in prices_per:
+                prices_per[currency] = get_currencies_price_per(currency_from=currency, currency_to=Currencies.yen)
+            price = convert_price(price, prices_per[currency])
+        new_prices[inventory.product_id] = float(price)
+
+    cache.set_many(
+        {yen_price_cache_key(product_id): price for product_id, price in new_prices.items()},
+        timeout=settings.FEDEX_QUOTE_CACHE["PRICE_TIMEOUT"]
+    )
+    return {**prices, **new_prices}
+
+
+def build_fedex_shipment(
+    products_data: list[dict[str, Any]]
+) -> tuple[list[FedexCommodity], list[FedexRequestedPackageLineItem]]:
+    """
+    products_data: product (id), quantity and package dimensions per product
+    """
+    product_ids = list({data['product'] for data in products_data})
+    weights = get_products_avg_weights(product_ids)
+    prices = get_products_yen_prices(product_ids)
+
+    commodities = []
+    package_line_items = []
+    for data in products_data:
+        product_id, quantity = data['product'], data['quantity']
+        avg_weight = weights.get(product_id, settings.FEDEX_DEFAULT_AVG_WEIGHT)
+        commodities.append(
+            FedexCommodity(
+                weight=FedexWeight(units="KG", value=avg_weight),
+                currency_amount=FedexCurrencyAmount(currency='JYE', amount=prices.get(product_id, 0) * quantity),
+                quantity=quantity
+            )
+        )
+        package_line_items.append(
+            FedexRequestedPackageLineItem(
+                weight=FedexWeight(units="KG", value=avg_weight),
+                dimensions=FedexDimension(width=data['width'], length=data['length'], height=data['height'])
+            )
+        )
+    return commodities, package_line_items
+
+
+def shipment_weights(package_line_items: list[FedexRequestedPackageLineItem]) -> tuple[float, float, float]:
+    """
+    returns actual, volumetric and chargeable (billed by FedEx, max of both per package) weights in kg
+    """
+    divisor = settings.SHIPPING_RATE_ESTIMATOR["VOLUMETRIC_DIVISOR"]
+    weight = volumetric_weight = chargeable_weight = 0
+    for item in package_line_items:
+        dimensions = item.dimensions
+        package_volumetric_weight = dimensions.width * dimensions.length * dimensions.height / divisor
+        weight += item.weight.value
+        volumetric_weight += package_volumetric_weight
+        chargeable_weight += max(item.weight.value, package_volumetric_weight)
+    return weight, volumetric_weight, chargeable_weight
+
+
+def record_quote(
+    recipient: FedexAddress,
+    commodities: list[FedexCommodity],
+    package_line_items: list[FedexRequestedPackageLineItem],
+    output: dict[str, Any]
+) -> FedexQuoteRecord | None:
+    try:
+        rate = output['rateReplyDetails'][0]['ratedShipmentDetails'][0]
+    except (KeyError, IndexError):
+        return None
+
+    weight, volumetric_weight, chargeable_weight = shipment_weights(package_line_items)
+    return FedexQuoteRecord.objects.create(
+        country_code=recipient.country_code,
+        postal_code=recipient.postal_code,
+        city=recipient.city,
+        packages_count=len(package_line_items),
+        weight=weight,
+        volumetric_weight=volumetric_weight,
+        chargeable_weight=chargeable_weight,
+        declared_value=sum(commodity.currency_amount.amount for commodity in commodities),
+        total_net_charge=rate['totalNetCharge'],
+        currency=rate['currency'],
+        surcharges=[
+            {"name": surcharge['description'], "amount": surcharge['amount']}
+            for surcharge in rate.get('shipmentRateDetail', {}).get('surCharges') or []
+        ]
+    )
+
+
+def hinge_features(weights: np.ndarray, breakpoints: list[float]) -> np.ndarray:
+    # intercept, slope and one slope change per breakpoint
+    return np.column_stack([np.ones_like(weights), weights, *(np.maximum(weights - point, 0) for point in breakpoints)])
+
+
+def fit_rate_model(country_code: str, since) -> ShippingRateModel | None:
+    config = settings.SHIPPING_RATE_ESTIMATOR
+    records = FedexQuoteRecord.objects.filter(country_code=country_code, created_at__gte=since)
+    currency = (
+        records.values('currency').annotate(count=Count('id')).order_by('-count').values_list('currency', flat=True)
+                                                                                .first()
+    )
+    rows = list(records.filter(currency=currency).values_list('chargeable_weight', 'total_net_charge'))
+    if len(rows) < config["MIN_SAMPLES"]:
+        return None
+
+    weights, charges = np.array(rows, dtype=float).T
+    min_weight, max_weight = float(weights.min()), float(weights.max())
+    # a breakpoint is only meaningful with observations on both sides
+    breakpoints = [point for point in config["BREAKPOINTS"] if min_weight < point < max_weight]
+    features = hinge_features(weights, breakpoints)
+    coefficients, *_ = np.linalg.lstsq(features, charges, rcond=None)
+    residuals = features @ coefficients - charges
+    relative_error = float(np.sqrt(np.mean(residuals ** 2)) / max(float(np.mean(charges)), 1e-9))
+
+    rate_model, _ = ShippingRateModel.objects.update_or_create(
+        country_code=country_code,
+        defaults={
+            "currency": currency,
+            "breakpoints": breakpoints,
+            "coefficients": coefficients.tolist(),
+            "min_weight": min_weight,
+            "max_weight": max_weight,
+            "samples": len(rows),
+            "relative_error": relative_error,
+            "fitted_at": timezone.now()
+        }
+    )
+    return rate_model
+
+
+def fit_rate_models() -> list[str]:
+    since = timezone.now() - timedelta(days=settings.SHIPPING_RATE_ESTIMATOR["HISTORY_DAYS"])
+    country_codes = (
+        FedexQuoteRecord.objects.filter(created_at__gte=since)
+                                .values_list('country_code', flat=True)
+                                .distinct()
+    )
+    fitted = []
+    for country_code in country_codes:
+        try:
+            rate_model = fit_rate_model(country_code, since)
+        except np.linalg.LinAlgError as e:
+            logging.error("Shipping rate model for %s is not fitted: %s" % (country_code, e))
+            continue
+
+        if rate_model:
+            fitted.append(country_code)
+    return fitted
+
+
+def get_confidence(rate_model: ShippingRateModel) -> str:
+    for confidence, (max_error, min_samples) in settings.SHIPPING_RATE_ESTIMATOR["CONFIDENCE"].items():
+        if rate_model.relative_error <= max_error and rate_model.samples >= min_samples:
+            return confidence
+    return "low"
+
+
+def estimate_quote(country_code: str, package_line_items: list[FedexRequestedPackageLineItem]) -> dict[str, Any] | None:
+    """
+    returns None when there is no fresh model for the country or the shipment is out of its range
+    """
+    config = settings.SHIPPING_RATE_ESTIMATOR
+    rate_model = ShippingRateModel.objects.filter(
+        country_code=country_code,
+        fitted_at__gte=timezone.now() - timedelta(hours=config["STALE_HOURS"])
+    ).first()
+    if not rate_model:
+        return None
+
+    *_, chargeable_weight = shipment_weights(package_line_items)
+    if not rate_model.min_weight <= chargeable_weight <= rate_model.max_weight:
+        return None
+
+    features = hinge_features(np.array([chargeable_weight]), rate_model.breakpoints)
+    total = float((features @ np.array(rate_model.coefficients))[0])
+    if total <= 0:
+        return None
+
+    return {
+        "total_estimate": round(total, 2),
+        "currency": rate_model.currency,
+        "confidence": get_confidence(rate_model),
+        "fitted_at": rate_model.fitted_at
+    }
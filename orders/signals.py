@@ -2,11 +2,11 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 from orders.models import Order
-from orders.tasks import create_order_shipping_details, create_order_conversions
+from orders.tasks import create_order_shipping_details
+from service.outbox import publish
 
 
 @receiver(post_save, sender=Order)
 def create_order_details(sender, instance, created, **kwargs):
     if created:
-        create_order_conversions(instance.id)
-        create_order_shipping_details.delay(instance.id)
+        publish(create_order_shipping_details, instance.id)
@@ -1,55 +1,24 @@
 import logging
-from datetime import timedelta, datetime
 
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ObjectDoesNotExist
-from django.utils import timezone
 
 from kaimon.celery import app
-from orders.models import Order, OrderConversion, OrderShipping
-from orders.utils import generate_shipping_code, get_order, qrcode_for_url
-from service.clients import PayboxAPI
-from service.clients.moneta import MonetaAPI
+from orders.models import Order, OrderShipping, Payment
+from orders.payments import (
+    PaymentNotCreated, init_order_payment, schedule_status_check, poll_due_payments, set_payment_failure
+)
+from orders.shipping import fit_rate_models
+from orders.utils import generate_shipping_code, qrcode_for_url
 
-from service.models import Currencies
-from service.utils import get_currencies_price_per
+from service.outbox import OutboxTask, relay_pending_events
 
 
-@app.task()
-def create_order_conversions(order_id):
-    order = get_order(order_id)
-
-    if not order:
-        logging.error("Not found order with id %s" % order_id)
-        return
-
-    new_conversions = []
-
-    for conversion_from in Currencies:
-        for conversion_to in Currencies:
-            if conversion_from == conversion_to:
-                continue
-
-            price_per = get_currencies_price_per(conversion_from, conversion_to)
-            if not price_per:
-                continue
-
-            new_conversions.append(
-                OrderConversion(
-                    order=order,
-                    currency_from=conversion_from,
-                    currency_to=conversion_to,
-                    price_per=price_per
-                )
-            )
-
-    if new_conversions:
-        OrderConversion.objects.bulk_create(new_conversions)
-
-
-@app.task()
+@app.task(base=OutboxTask)
 def create_order_shipping_details(order_id: str):
-    order = get_order(order_id)
+    # published through the outbox: the order is committed when the task runs
+    order = Order.objects.filter(id=order_id).first()
     if not order:
         logging.error("Not found order with id %s" % order_id)
         return
@@ -64,85 +33,70 @@ def create_order_shipping_details(order_id: str):
         shipping_detail.save()
 
 
-@app.task()
-def check_paybox_status_for_order(order_id, tries: int = 0, max_tries: int = 10, retry_sec: int = 15):
-    order = Order.objects.get(id=order_id)
-    if order.status != Order.Status.wait_payment:
+@app.task(base=OutboxTask, bind=True, max_retries=5, soft_time_limit=60)
+def init_payment_for_order(self, order_id, payment_type: str = Payment.PaymentType.paybox):
+    order = Order.objects.filter(id=order_id, status=Order.Status.wait_payment).first()
+    if not order:
+        logging.error("Not found order with id %s waiting for payment" % order_id)
         return
 
-    payment_client = PayboxAPI(settings.PAYBOX_ID, secret_key=settings.PAYBOX_SECRET_KEY)
-    response_data = payment_client.get_transaction_status(
-        payment_id=str(order.payment.payment_id),
-        order_id=str(order_id),
-        salt=settings.PAYBOX_SALT
-    )
-
-    if response_data.get("response", {}).get("pg_status", "") == "ok":
-        order.status = Order.Status.pending
-        order.save()
-        logging.info("Success")
-    else:
-        if tries <= max_tries:
-            tries += 1
-            check_paybox_status_for_order.apply_async(eta=timezone.now() + timedelta(seconds=retry_sec),
-                                                      args=(order_id, tries, max_tries, retry_sec))
-            return
-
-        order.status = Order.Status.payment_rejected
-        order.save()
-        logging.error("Max tries to check paybox status")
+    try:
+        payment, created = init_order_payment(order, payment_type)
+    except PaymentNotCreated as e:
+        # a retry gives the same answer, the customer is told by the payment endpoint
+        set_payment_failure(order_id, str(e))
+        return
+    except Exception as e:
+        logging.error(e)
+        if self.request.retries >= self.max_retries:
+            set_payment_failure(order_id, "the payment provider is unavailable")
+        raise self.retry(exc=e, countdown=settings.PAYMENT_INIT_RETRY_SECONDS * (self.request.retries + 1))
 
+    if created:
+        schedule_status_check(payment)
 
-@app.task()
-def check_moneta_status(order_id, tries: int = 0, max_tries: int = 10, retry_sec: int = 15):
-    order = Order.objects.get(id=order_id)
-    if order.status != Order.Status.wait_payment:
-        return
 
-    payment = order.payment
-    client = MonetaAPI(merchant_id=settings.MONETA_MERCHANT_ID, private_key=settings.MONETA_PRIVATE_KEY)
-    status = client.status(payment.payment_id).get("result", {}).get("status", "")
-
-    save = False
-    match status:
-        case "PAID":
-            order.status = Order.Status.pending
-            save = True
-        case "EXPIRED":
-            order.status = Order.Status.payment_rejected
-            save = True
-
-    if save:
-        order.save()
-        logging.info(f"Success moneta status of invoice {payment.payment_id} for order {order_id}.")
+@app.task()
+def poll_payment_statuses():
+    cache = caches["default"]
+    lock_key = "payment_status_poller"
+    if not cache.add(lock_key, 1, timeout=settings.PAYMENT_STATUS_POLLER["LOCK_SECONDS"]):
+        logging.info("Payment status poller is already running")
         return
 
-    tries += 1
     try:
-        expired_date_string = payment.payment_meta.get("expiredBy", "")
-        expired = datetime.strptime(expired_date_string, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
-
-        if timezone.now() >= expired:
-            order.status = Order.Status.payment_rejected
-            order.save()
-            return
-
-        if tries > max_tries:
-            check_moneta_status.apply_async(
-                eta=expired + timedelta(seconds=5),
-                args=(order_id, tries, max_tries, retry_sec)
-            )
-
-            logging.info(
-                f"Max tries to check moneta status of invoice {payment.payment_id} for order {order_id}. "
-                f"Last check will be on {expired}"
-            )
-            return
-
-    except ValueError:
-        pass
-
-    check_moneta_status.apply_async(
-        eta=timezone.now() + timedelta(seconds=retry_sec),
-        args=(order_id, tries, max_tries, retry_sec)
-    )
+        result = poll_due_payments(batch_size=settings.PAYMENT_STATUS_POLLER["BATCH_SIZE"])
+    finally:
+        cache.delete(lock_key)
+
+    if result:
+        logging.info("Payment statuses updated: %s" % result)
+
+
+@app.task()
+def check_paybox_status_for_order(order_id, *args):
+    # deprecated: kept to drain the self-rescheduling tasks queued before the batched poller
+    payment = Payment.objects.filter(order_id=order_id, order__status=Order.Status.wait_payment).first()
+    if payment:
+        schedule_status_check(payment)
+
+
+@app.task()
+def check_moneta_status(order_id, *args):
+    # deprecated: kept to drain the self-rescheduling tasks queued before the batched poller
+    payment = Payment.objects.filter(order_id=order_id, order__status=Order.Status.wait_payment).first()
+    if payment:
+        schedule_status_check(payment)
+
+
+@app.task()
+def relay_outbox_events():
+    relayed = relay_pending_events()
+    if relayed:
+        logging.warning("Outbox events relayed by the sweeper: %s" % relayed)
+
+
+@app.task()
+def fit_shipping_rate_models():
+    fitted = fit_rate_models()
+    logging.info("Shipping rate models fitted for: %s" % ", ".join(fitted))
@@ -1,6 +1,7 @@
+import json
 import logging
+import math
 import os
-import time
 from functools import lru_cache
 from typing import Any
 import hashlib
@@ -8,24 +9,14 @@ from uuid import uuid4
 
 from django.conf import settings
 from django.core.cache import caches
-from django.core.exceptions import ObjectDoesNotExist
 from django.utils.timezone import now
 
-from service.clients.moneta import MonetaAPI
-from service.models import Currencies
-from service.utils import get_currency_by_id, get_currencies_price_per, convert_price, generate_qrcode
+from service.clients import FedexAPIClient, PayboxAPI, AsyncPayboxAPI, shared_client
+from service.clients.fedex import FedexAddress, FedexCacheTokenStore, FedexCommodity, FedexRequestedPackageLineItem
+from service.clients.moneta import MonetaAPI, AsyncMonetaAPI
+from service.utils import generate_qrcode, snapshot_price_per
 
-from .models import DeliveryAddress, OrderConversion, Customer, Order
-
-
-def get_order(order_id):
-    for _ in range(3):
-        try:
-            order = Order.objects.get(id=order_id)
-        except ObjectDoesNotExist:
-            time.sleep(1)
-        else:
-            return order
+from .models import DeliveryAddress, OrderConversion, Customer
 
 
 def duplicate_delivery_address(delivery_address, updates: dict[str, Any]):
@@ -51,18 +42,15 @@ def generate_shipping_code():
     return sha256_hash.hexdigest()
 
 
-@lru_cache(maxsize=50)
-def get_product_yen_price(product, quantity):
-    product_currency = get_currency_by_id(product.id)
-    if product_currency == Currencies.yen:
-        return (product.sale_price or product.price) * quantity
-
-    price_per = get_currencies_price_per(currency_from=product_currency, currency_to=Currencies.yen)
-    return convert_price(product.sale_price or product.price, price_per) * quantity
+def order_currencies_price_per(order_id, currency_from: str, currency_to: str, rate_snapshot_id: int = None):
+    if rate_snapshot_id is not None:
+        return snapshot_price_per(rate_snapshot_id, currency_from, currency_to)
+    return legacy_order_currencies_price_per(order_id, currency_from, currency_to)
 
 
 @lru_cache(maxsize=100)
-def order_currencies_price_per(order_id, currency_from: str, currency_to: str):
+def legacy_order_currencies_price_per(order_id, currency_from: str, currency_to: str):
+    # the orders created before the rate snapshots
     conversion = OrderConversion.objects.filter(
         order_id=order_id,
         currency_from=currency_from,
@@ -96,6 +84,78 @@ def qrcode_for_url(filename: str, url: str):
     return f'qrcodes/{png}'
 
 
+def get_moneta_client() -> MonetaAPI:
+    return shared_client(
+        MonetaAPI,
+        merchant_id=settings.MONETA_MERCHANT_ID,
+        private_key=settings.MONETA_PRIVATE_KEY,
+        verify_signatures=settings.MONETA_VERIFY_SIGNATURES
+    )
+
+
+def get_paybox_client() -> PayboxAPI:
+    return shared_client(PayboxAPI, merchant_id=settings.PAYBOX_ID, secret_key=settings.PAYBOX_SECRET_KEY)
+
+
+def get_async_moneta_client() -> AsyncMonetaAPI:
+    return shared_client(
+        AsyncMonetaAPI,
+        merchant_id=settings.MONETA_MERCHANT_ID,
+        private_key=settings.MONETA_PRIVATE_KEY,
+        verify_signatures=settings.MONETA_VERIFY_SIGNATURES
+    )
+
+
+def get_async_paybox_client() -> AsyncPayboxAPI:
+    return shared_client(AsyncPayboxAPI, merchant_id=settings.PAYBOX_ID, secret_key=settings.PAYBOX_SECRET_KEY)
+
+
+def get_fedex_client() -> FedexAPIClient:
+    return shared_client(
+        FedexAPIClient,
+        client_id=settings.FEDEX_CLIENT_ID,
+        client_secret=settings.FEDEX_SECRET,
+        account_number=settings.FEDEX_ACCOUNT_NUMBER,
+        token_store=FedexCacheTokenStore(caches["default"], key="fedex_token:%s" % settings.FEDEX_CLIENT_ID)
+    )
+
+
+def round_up_to(value: float | int, step: float | int) -> float:
+    return math.ceil(round(value / step, 6)) * step
+
+
+def fedex_quote_cache_key(
+    recipient: FedexAddress,
+    commodities: list[FedexCommodity],
+    package_line_items: list[FedexRequestedPackageLineItem],
+    ship_date
+) -> str:
+    """
+    canonical shipment: similar packages to the same destination share the quote
+    """
+    config = settings.FEDEX_QUOTE_CACHE
+    packages = sorted(
+        [
+            round_up_to(item.weight.value, config["WEIGHT_STEP"]),
+            *sorted(
+                round_up_to(value, config["DIMENSION_STEP"])
+                for value in (item.dimensions.width, item.dimensions.length, item.dimensions.height)
+            )
+        ]
+        for item in package_line_items
+    )
+    shipment = [
+        recipient.country_code,
+        str(recipient.postal_code or "").replace(" ", "").upper(),
+        (recipient.city or "").strip().lower(),
+        str(ship_date),
+        packages,
+        sum(commodity.quantity for commodity in commodities),
+        round_up_to(sum(commodity.currency_amount.amount for commodity in commodities), config["VALUE_STEP"])
+    ]
+    return "fedex_quote:%s" % hashlib.md5(json.dumps(shipment).encode()).hexdigest()
+
+
 def get_health_usd_price_per(moneta_client: MonetaAPI) -> int | float | None:
     cache = caches["scraping"]
     cache_key = "moneta_health_usd"
@@ -7,6 +7,7 @@ from django.http import HttpResponseNotFound
 from django.shortcuts import get_object_or_404, render
 from drf_spectacular.utils import extend_schema
 from rest_framework import views, viewsets, generics, mixins, parsers, permissions, status
+from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -14,14 +15,18 @@ from rest_framework.response import Response
 from service.filters import ListFilter
 from service.mixins import CurrencyMixin
 from service.models import Currencies
+from service.outbox import publish
 from service.paginations import PagePagination
 from service.utils import convert_price
 from users.permissions import RegistrationPayedPermission, EmailConfirmedPermission
 from users.utils import get_sentinel_user
 
 from .models import DeliveryAddress, Order, Payment
+from .payments import payment_failure, set_payment_failure
 from .permissions import OrderPermission
-from .serializers import DeliveryAddressSerializer, OrderSerializer, FedexQuoteRateSerializer
+from .serializers import DeliveryAddressSerializer, OrderSerializer, FedexQuoteRateSerializer, PaymentSerializer, \
+    PaymentInitSerializer
+from .tasks import init_payment_for_order
 from .utils import order_currencies_price_per
 
 
@@ -65,6 +70,36 @@ class OrderViewSet(
     def get_queryset(self):
         return super().get_queryset().filter(delivery_address__user=self.request.user)
 
+    @extend_schema(
+        request=PaymentInitSerializer,
+        responses={status.HTTP_200_OK: PaymentSerializer, status.HTTP_202_ACCEPTED: None,
+                   status.HTTP_402_PAYMENT_REQUIRED: None}
+    )
+    @action(methods=['GET', 'POST'], detail=True, url_path='payment')
+    def payment(self, request, **kwargs):
+        """
+        GET polls the payment of the order (402 when it can't be created), POST retries the payment initiation
+        """
+        order = self.get_object()
+        payment = Payment.objects.filter(order_id=order.id).first()
+        if payment:
+            return Response(PaymentSerializer(instance=payment, context=self.get_serializer_context()).data)
+
+        if order.status != Order.Status.wait_payment:
+            return Response({"detail": "Order is not waiting for payment."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'POST':
+            serializer = PaymentInitSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            set_payment_failure(order.id, None)
+            publish(init_payment_for_order, order.id, serializer.validated_data['payment_type'])
+        elif failure := payment_failure(order.id):
+            return Response(
+                {"detail": "Something went wrong. Please try again another time.", "reason": failure},
+                status=status.HTTP_402_PAYMENT_REQUIRED
+            )
+        return Response({"detail": "Payment is being prepared."}, status=status.HTTP_202_ACCEPTED)
+
 
 class FedexQuoteRateView(generics.GenericAPIView):
     permission_classes = (permissions.AllowAny,)
@@ -105,7 +140,8 @@ def order_info(request, order_id):
             price_per = order_currencies_price_per(
                 order_id=receipt.order_id,
                 currency_from=receipt.site_currency,
-                currency_to=Currencies.yen
+                currency_to=Currencies.yen,
+                rate_snapshot_id=order.rate_snapshot_id
             )
             price = convert_price(price, price_per) if price_per else 0.0
             unit_price = convert_price(unit_price, price_per) if price_per else 0.0
@@ -3,7 +3,10 @@ from django.template.defaultfilters import truncatechars
 from django.utils.translation import gettext_lazy as _
 
 from service.enums import Site
-from .models import Category, Tag, Product, ProductImage, ProductInventory, ProductReview
+from .models import (
+    Category, Tag, Product, ProductImage, ProductInventory, ProductReview, RetentionPolicy, ArchivedProduct
+)
+from .utils import set_reviews_moderated
 
 
 class SiteFilter(admin.SimpleListFilter):
@@ -171,6 +174,15 @@ class ProductReviewAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'user', 'product_id')
     search_fields = ('id', 'user__email', 'user__full_name')
     list_filter = ('rating', 'created_at', 'moderated')
+    actions = ('moderate', 'unmoderate')
+
+    @admin.action(description=_('Moderate selected reviews'))
+    def moderate(self, request, queryset):
+        set_reviews_moderated(queryset, moderated=True)
+
+    @admin.action(description=_('Unmoderate selected reviews'))
+    def unmoderate(self, request, queryset):
+        set_reviews_moderated(queryset, moderated=False)
 
     def product_id(self, obj):
         return obj.product.id
@@ -183,3 +195,31 @@ class ProductReviewAdmin(admin.ModelAdmin):
 
     short_comment.admin_order_field = 'comment'
     short_comment.short_description = _('Comment')
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    autocomplete_fields = ("category",)
+    list_display = ("id", "site", "category", "max_products")
+    list_filter = ("site",)
+    list_per_page = 15
+
+
+@admin.register(ArchivedProduct)
+class ArchivedProductAdmin(admin.ModelAdmin):
+    list_display = ("id", "product_name", "reason", "archived_at")
+    search_fields = ("id", "name")
+    list_filter = (SiteFilter, "reason", "archived_at")
+    list_per_page = 15
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def product_name(self, obj):
+        return truncatechars(obj.name, 35)
+
+    product_name.admin_order_field = 'name'
+    product_name.short_description = _('Product Name')
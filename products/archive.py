@@ -0,0 +1,104 @@
+import logging
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedProduct, Product, ProductImage, ProductInventory, ProductReview
+from .pruning import prune_products
+
+
+# the archived products back into the serving tables, a product recreated meanwhile (by the crawlers) wins
+RESTORE_PRODUCTS_SQL = """
+INSERT INTO products_product (%(columns)s)
+SELECT %(columns)s FROM products_archivedproduct WHERE id = ANY(%%(product_ids)s)
+ON CONFLICT (id) DO NOTHING
+RETURNING id
+"""
+
+# the categories and tags deleted meanwhile are skipped
+RESTORE_CATEGORIES_SQL = """
+INSERT INTO products_product_categories (product_id, category_id)
+SELECT archived.id, category.id
+FROM products_archivedproduct AS archived
+CROSS JOIN unnest(archived.category_ids) AS category_id
+JOIN products_category AS category ON category.id = category_id
+WHERE archived.id = ANY(%(product_ids)s)
+ON CONFLICT DO NOTHING
+"""
+
+RESTORE_ROWS_SQL = """
+INSERT INTO %(table)s (%(columns)s)
+SELECT %(row_columns)s
+FROM products_archivedproduct AS archived
+CROSS JOIN jsonb_populate_recordset(NULL::%(table)s, archived.%(field)s) AS archived_row
+%(join)s
+WHERE archived.id = ANY(%%(product_ids)s)
+ON CONFLICT DO NOTHING
+"""
+
+RESTORE_INVENTORY_TAGS_SQL = """
+INSERT INTO products_productinventory_tags (productinventory_id, tag_id)
+SELECT inventory ->> 'id', tag.id
+FROM products_archivedproduct AS archived
+CROSS JOIN jsonb_array_elements(archived.inventories) AS inventory
+CROSS JOIN jsonb_array_elements_text(inventory -> 'tag_ids') AS tag_id
+JOIN products_tag AS tag ON tag.id = tag_id
+WHERE archived.id = ANY(%(product_ids)s)
+ON CONFLICT DO NOTHING
+"""
+
+
+def columns(model) -> list[str]:
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def restore_rows_sql(model, field: str, join: str = "") -> str:
+    model_columns = columns(model)
+    return RESTORE_ROWS_SQL % {
+        "table": model._meta.db_table,
+        "columns": ", ".join(model_columns),
+        "row_columns": ", ".join("archived_row.%s" % column for column in model_columns),
+        "field": field,
+        "join": join
+    }
+
+
+def restore_products(product_ids: list[str]) -> list[str]:
+    """
+    Moves the archived products back to the serving tables with their dependent rows, in one transaction.
+    The promotions memberships are not archived, they are not restored.
+    Returns the ids of the restored products.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(RESTORE_PRODUCTS_SQL % {"columns": ", ".join(columns(Product))}, {"product_ids": product_ids})
+        params = {"product_ids": [row[0] for row in cursor.fetchall()]}
+        if params["product_ids"]:
+            cursor.execute(RESTORE_CATEGORIES_SQL, params)
+            cursor.execute(restore_rows_sql(ProductInventory, "inventories"), params)
+            cursor.execute(RESTORE_INVENTORY_TAGS_SQL, params)
+            cursor.execute(restore_rows_sql(ProductImage, "images"), params)
+            # the reviews of the deleted users are dropped
+            reviews_join = "JOIN users_user AS author ON author.id = archived_row.user_id"
+            cursor.execute(restore_rows_sql(ProductReview, "reviews", join=reviews_join), params)
+        ArchivedProduct.objects.filter(id__in=product_ids).delete()
+
+    logging.info("%s archived products restored" % len(params["product_ids"]))
+    return params["product_ids"]
+
+
+def archive_inactive(limit: int = None) -> dict[str, Any]:
+    """
+    moves the products inactive for more than ARCHIVE_INACTIVE_AFTER_SECONDS out of the serving tables
+    """
+    archive_after = timedelta(seconds=settings.PRODUCT_ARCHIVE["ARCHIVE_INACTIVE_AFTER_SECONDS"])
+    inactive_products = Product.objects.filter(is_active=False, modified_at__lt=timezone.now() - archive_after)
+    return prune_products(
+        inactive_products,
+        limit=limit,
+        job="archive_inactive",
+        archive_query=Product.objects.all(),
+        archive_reason=ArchivedProduct.Reason.inactive
+    )
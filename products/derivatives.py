@@ -0,0 +1,53 @@
+import io
+from typing import Any
+
+from PIL import Image, ImageOps
+
+
+# Pillow names of the derivative formats
+PIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def flatten(image: Image.Image) -> Image.Image:
+    # JPEG has no alpha channel, the transparent parts become white
+    if image.mode != "RGBA":
+        return image
+    flat = Image.new("RGB", image.size, (255, 255, 255))
+    flat.paste(image, mask=image.getchannel("A"))
+    return flat
+
+
+def render(data: bytes, sizes: dict[str, int], formats: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """
+    Encoded derivatives of the source image: {size: {"width": ..., "height": ..., format: bytes}}.
+    The sizes are rendered from the largest one down, every size is resized from the previous one.
+    No django here: the function runs in the pool processes, only bytes cross the processes boundary.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        # a JPEG is decoded at a reduced scale when it is much larger than the largest size
+        largest = max(sizes.values())
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    derivatives = {}
+    for size, box in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image = image.copy()
+        image.thumbnail((box, box), Image.Resampling.LANCZOS)
+        derivative = {"width": image.width, "height": image.height}
+        for image_format, options in formats.items():
+            output = io.BytesIO()
+            frame = flatten(image) if image_format == "jpeg" else image
+            frame.save(output, PIL_FORMATS[image_format], **options)
+            derivative[image_format] = output.getvalue()
+        derivatives[size] = derivative
+    return derivatives
+
+
+def render_safely(data: bytes, sizes: dict[str, int], formats: dict[str, dict[str, Any]]) -> dict | Exception:
+    # a broken source fails alone, not the whole pool map
+    try:
+        return render(data, sizes, formats)
+    except Exception as e:
+        return e
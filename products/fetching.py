@@ -0,0 +1,105 @@
+import json
+import logging
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+
+from service.clients import AsyncRakutenClient, RakutenBulkFetcher
+from service.crawling import register_throttling
+from service.enums import Site
+
+from .ingestion import ingest_products
+from .models import Category
+
+
+CURSOR_KEY = "rakuten_fetch:%s"
+
+
+def leaf_genre_ids() -> list[str]:
+    categories = Category.objects.filter(id__startswith="%s_" % Site.rakuten.value, deactivated=False,
+                                         children__isnull=True)
+    return [category_id.split("_", 1)[1] for category_id in categories.values_list("id", flat=True)]
+
+
+def item_line(genre_id: str, item: dict[str, Any]) -> str:
+    """
+    the ingestion line of an item search result (formatVersion=2), one inventory per item
+    """
+    product_id = "%s_%s" % (Site.rakuten.value, item["itemCode"])
+    # formatVersion=1 nests the urls in objects
+    images = [image["imageUrl"] if isinstance(image, dict) else image for image in item.get("mediumImageUrls", [])]
+    return json.dumps({
+        "id": product_id,
+        "name": item.get("itemName"),
+        "shop_code": item.get("shopCode"),
+        "shop_url": item.get("shopUrl"),
+        "description": item.get("itemCaption"),
+        "catch_copy": item.get("catchcopy"),
+        "site_avg_rating": item.get("reviewAverage", 0),
+        "site_reviews_count": item.get("reviewCount", 0),
+        "is_active": item.get("availability", 1) == 1,
+        "categories": ["%s_%s" % (Site.rakuten.value, genre_id)],
+        "images": images,
+        "inventories": [{
+            "id": product_id,
+            "item_code": item["itemCode"],
+            "site_price": item.get("itemPrice"),
+            "product_url": item.get("itemUrl"),
+            "name": item.get("itemName"),
+        }]
+    }, ensure_ascii=False)
+
+
+def fetch_rakuten_products(genre_ids: list[str] = None, restart: bool = False) -> dict[str, Any]:
+    """
+    Walks the items of the genres (the active leaf categories by default) into the products ingestion.
+    The genre cursors are saved once the ingestion batch of their pages is committed,
+    a walk continues from them unless restart.
+    """
+    config = settings.RAKUTEN_FETCHER
+    ingestion_config = settings.PRODUCT_INGESTION
+    cache = caches["default"]
+    genre_ids = [str(genre_id) for genre_id in genre_ids or leaf_genre_ids()]
+    keys = {genre_id: CURSOR_KEY % genre_id for genre_id in genre_ids}
+    if restart:
+        cache.delete_many(list(keys.values()))
+    saved = cache.get_many(list(keys.values()))
+    cursors = {genre_id: saved[key] for genre_id, key in keys.items() if key in saved}
+
+    fetcher = RakutenBulkFetcher(
+        AsyncRakutenClient(app_id=config["APP_ID"], partner_id=config["AFFILIATE_ID"]),
+        requests_per_second=config["REQUESTS_PER_SECOND"],
+        concurrency=config["CONCURRENCY"],
+        retries=config["RETRIES"],
+        backoff=config["BACKOFF_SECONDS"],
+        on_throttled=lambda: register_throttling(Site.rakuten.value)
+    )
+    report = {"pages": 0, "lines": 0, "rejected": 0, "new": 0, "changed": 0, "unchanged": 0, "batches": 0,
+              "errors": []}
+
+    def flush(lines: list[str], pages: dict[str, int]) -> None:
+        batch_report = ingest_products(lines)
+        for key in ("lines", "rejected", "new", "changed", "unchanged", "batches"):
+            report[key] += batch_report[key]
+        free = ingestion_config["MAX_REPORTED_ERRORS"] - len(report["errors"])
+        report["errors"].extend(batch_report["errors"][:max(free, 0)])
+        cache.set_many({keys[genre_id]: cursor for genre_id, cursor in pages.items()},
+                       timeout=config["CURSOR_SECONDS"])
+
+    lines, pages = [], {}
+    for page in fetcher.iter_pages(genre_ids, cursors):
+        lines.extend(item_line(page.genre_id, item) for item in page.items)
+        pages[page.genre_id] = page.cursor
+        report["pages"] += 1
+        if len(lines) >= ingestion_config["BATCH_SIZE"]:
+            flush(lines, pages)
+            lines, pages = [], {}
+    flush(lines, pages)
+
+    report["failed_genres"] = fetcher.failed
+    logging.info("Rakuten fetching: %s pages, %s new, %s changed, %s unchanged, %s genres failed" % (
+        report["pages"], report["new"], report["changed"], report["unchanged"], len(fetcher.failed)
+    ))
+    return report
+
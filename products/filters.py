@@ -102,7 +102,8 @@ class ProductFilter(BaseFilterBackend):
                             .annotate(
                                 image_info=JSONObject(
                                     image=F('image'),
-                                    url=F('url')
+                                    url=F('url'),
+                                    derivatives=F('derivatives')
                                 )
                             ).values('image_info')[:1]
     )
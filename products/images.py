@@ -0,0 +1,141 @@
+import hashlib
+import logging
+from typing import Any, Callable, Iterable
+
+import requests
+from billiard import Pool
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .derivatives import render_safely
+from .models import ProductImage
+
+
+def derivative_name(source_hash: str, size: str, image_format: str) -> str:
+    # content addressed: the same source gives the same names, whatever the image row
+    path = settings.IMAGE_DERIVATIVES["STORAGE_PATH"]
+    return "%s/%s/%s/%s.%s" % (path, source_hash[:2], source_hash, size, image_format)
+
+
+def source_bytes(image: ProductImage) -> bytes | None:
+    config = settings.IMAGE_DERIVATIVES
+    if image.image:
+        with image.image.open("rb") as file:
+            return file.read()
+
+    if not image.url or not config["FETCH_REMOTE"]:
+        return None
+
+    with requests.get(image.url, timeout=config["FETCH_TIMEOUT"], stream=True) as response:
+        response.raise_for_status()
+        data = response.raw.read(config["MAX_SOURCE_BYTES"] + 1, decode_content=True)
+    if len(data) > config["MAX_SOURCE_BYTES"]:
+        raise ValueError("the image is larger than %s bytes" % config["MAX_SOURCE_BYTES"])
+    return data
+
+
+def render_sources(sources: dict[str, bytes]) -> dict[str, dict | Exception]:
+    """
+    the derivatives (or the error) of every source hash, rendered by a pool of processes.
+    billiard, not multiprocessing: the prefork workers of celery are daemonic and may not have children otherwise.
+    When the pool itself fails, the sources are rendered in process.
+    """
+    config = settings.IMAGE_DERIVATIVES
+    args = (config["SIZES"], config["FORMATS"])
+    if config["PROCESSES"] <= 1 or len(sources) <= 1:
+        return {source_hash: render_safely(data, *args) for source_hash, data in sources.items()}
+
+    try:
+        with Pool(processes=min(config["PROCESSES"], len(sources))) as pool:
+            rendered = pool.starmap(render_safely, [(data, *args) for data in sources.values()])
+        return dict(zip(sources, rendered))
+    except Exception as e:
+        logging.warning("Image derivatives pool failed, rendering in process: %s" % e)
+        return {source_hash: render_safely(data, *args) for source_hash, data in sources.items()}
+
+
+def store_derivatives(source_hash: str, rendered: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    derivatives = {}
+    for size, derivative in rendered.items():
+        stored = {"width": derivative["width"], "height": derivative["height"]}
+        for image_format in settings.IMAGE_DERIVATIVES["FORMATS"]:
+            name = derivative_name(source_hash, size, image_format)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(derivative[image_format]))
+            stored[image_format] = name
+        derivatives[size] = stored
+    return derivatives
+
+
+def generate_derivatives(image_ids: Iterable[int] = None, limit: int = None) -> dict[str, int]:
+    """
+    Renders the derivatives of the images without them (the given ones or the oldest), limit images per call.
+    A source already rendered for another image (same sha256) is reused as is, nothing is rendered nor stored.
+    The unreadable sources get empty derivatives, they are not tried again until the image is saved.
+    """
+    config = settings.IMAGE_DERIVATIVES
+    images = ProductImage.objects.filter(derivatives__isnull=True)
+    if image_ids is not None:
+        images = images.filter(id__in=list(image_ids))
+    if not config["FETCH_REMOTE"]:
+        images = images.exclude(Q(image__isnull=True) | Q(image=""))
+    images = list(images.order_by("id")[:limit or config["BATCH_SIZE"]])
+
+    report = {"images": len(images), "rendered": 0, "reused": 0, "failed": 0}
+    sources, source_hashes = {}, {}
+    for image in images:
+        try:
+            data = source_bytes(image)
+        except Exception as e:
+            logging.warning("Image %s is not readable: %s" % (image.id, e))
+            data = None
+        if data:
+            source_hashes[image.id] = hashlib.sha256(data).hexdigest()
+            sources.setdefault(source_hashes[image.id], data)
+
+    known = dict(
+        ProductImage.objects.filter(source_hash__in=list(sources), derivatives__isnull=False)
+                            .exclude(derivatives={})
+                            .values_list("source_hash", "derivatives")
+    )
+    report["reused"] = len(known)
+    for source_hash, rendered in render_sources({key: sources[key] for key in sources.keys() - known.keys()}).items():
+        if isinstance(rendered, Exception):
+            logging.warning("Image %s is not rendered: %s" % (source_hash, rendered))
+            continue
+        known[source_hash] = store_derivatives(source_hash, rendered)
+        report["rendered"] += 1
+
+    for image in images:
+        image.source_hash = source_hashes.get(image.id)
+        image.derivatives = known.get(image.source_hash, {})
+        report["failed"] += not image.derivatives
+    ProductImage.objects.bulk_update(images, fields=("source_hash", "derivatives"))
+
+    logging.info("Image derivatives: %s" % report)
+    return report
+
+
+def image_set(derivatives: dict[str, Any] | None, build_url: Callable[[str], str]) -> dict[str, Any] | None:
+    """
+    srcset of every format and the urls of every size:
+    {"webp": "<url> 150w, <url> 400w, ...", "jpeg": "...", "sizes": {"card": {"width": 400, "height": 300,
+    "webp": <url>, "jpeg": <url>}, ...}}
+    """
+    if not derivatives:
+        return None
+
+    sizes = {
+        size: {key: build_url(value) if key in settings.IMAGE_DERIVATIVES["FORMATS"] else value
+               for key, value in derivative.items()}
+        for size, derivative in derivatives.items()
+    }
+    ordered = sorted(sizes.values(), key=lambda derivative: derivative["width"])
+    srcsets = {
+        image_format: ", ".join("%s %sw" % (derivative[image_format], derivative["width"]) for derivative in ordered)
+        for image_format in settings.IMAGE_DERIVATIVES["FORMATS"]
+        if all(image_format in derivative for derivative in ordered)
+    }
+    return {**srcsets, "sizes": sizes}
@@ -0,0 +1,72 @@
+import io
+import shutil
+import tempfile
+
+from billiard import Pool
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .images import generate_derivatives, render_sources
+from .models import Product, ProductImage
+
+
+def png(color, size=(600, 300), mode="RGB") -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, "PNG")
+    return output.getvalue()
+
+
+class TestImageDerivatives(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        config = {**settings.IMAGE_DERIVATIVES, "SIZES": {"thumbnail": 50, "card": 200}, "PROCESSES": 2}
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_DERIVATIVES=config)
+        self.settings_override.enable()
+        self.product = Product.objects.create(name="Bag", shop_code="shop", shop_url="https://shop.example.com/")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def add_image(self, name, data):
+        image = ProductImage(product=self.product)
+        image.image.save(name, ContentFile(data))
+        return image
+
+    def test_generate_derivatives(self):
+        red = self.add_image("red.png", png("red"))
+        copy = self.add_image("copy.png", png("red"))
+        blue = self.add_image("blue.png", png((0, 0, 255, 128), (100, 300), "RGBA"))
+        broken = self.add_image("broken.png", b"not an image")
+
+        report = generate_derivatives()
+        self.assertEqual(report, {"images": 4, "rendered": 2, "reused": 0, "failed": 1})
+
+        for image in (red, copy, blue, broken):
+            image.refresh_from_db()
+        self.assertEqual(red.source_hash, copy.source_hash)
+        self.assertEqual(red.derivatives, copy.derivatives)
+        self.assertEqual(red.derivatives["card"]["width"], 200)
+        self.assertEqual(red.derivatives["card"]["height"], 100)
+        self.assertEqual(blue.derivatives["thumbnail"]["height"], 50)
+        self.assertTrue(default_storage.exists(blue.derivatives["card"]["webp"]))
+        self.assertTrue(default_storage.exists(blue.derivatives["card"]["jpeg"]))
+        self.assertEqual(broken.derivatives, {})
+
+        # nothing left, a new image of a known source is not rendered again
+        self.assertEqual(generate_derivatives()["images"], 0)
+        self.add_image("again.png", png("red"))
+        self.assertEqual(generate_derivatives(), {"images": 1, "rendered": 0, "reused": 1, "failed": 0})
+
+    def test_render_in_daemonic_process(self):
+        # a celery prefork worker is a daemonic process, its renders must still be pooled
+        sources = {"red": png("red"), "green": png("green"), "broken": b"not an image"}
+        with Pool(processes=1) as pool:
+            rendered = pool.apply(render_sources, (sources,))
+
+        self.assertEqual(rendered["red"]["card"]["width"], 200)
+        self.assertEqual(rendered["green"]["thumbnail"]["width"], 50)
+        self.assertIsInstance(rendered["broken"], Exception)
@@ -0,0 +1,400 @@
+import hashlib
+import io
+import json
+import logging
+import math
+from itertools import islice
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from promotions.tasks import recompute_sale_prices_batch
+from service.dispatchers import dispatch_once
+from service.enums import Site
+
+from . import tasks  # the module: products.tasks imports the ingestion (through products.fetching)
+from .models import Product, ProductImage, ProductInventory, Tag
+
+
+# One NDJSON line per product, the lists are optional, a missing list leaves the stored rows as they are:
+# {"id": "rakuten_...", "name": "...", "shop_code": "...", "shop_url": "...", "description": "...", "catch_copy": "...",
+#  "site_avg_rating": 4.5, "site_reviews_count": 10, "can_choose_tags": false, "is_active": true,
+#  "categories": ["rakuten_100"], "images": ["https://..."],
+#  "tags": [{"id": "rakuten_1", "name": "Color"}, {"id": "rakuten_2", "name": "Red", "group_id": "rakuten_1"}],
+#  "inventories": [{"id": "...", "item_code": "...", "site_price": 1000, "product_url": "...", "name": "...",
+#                   "quantity": 1, "status_code": "...", "color_image": "...", "tag_ids": ["rakuten_2"]}]}
+REQUIRED_FIELDS = ("id", "name", "shop_code", "shop_url")
+LIST_FIELDS = ("categories", "images", "tags", "inventories")
+INVENTORY_REQUIRED_FIELDS = ("id", "item_code", "site_price", "product_url", "name")
+# a value out of its column fails the statement of the whole batch, the lines are checked against the models
+PRODUCT_TEXT_FIELDS = ("id", "name", "shop_code", "shop_url", "description", "catch_copy")
+INVENTORY_TEXT_FIELDS = ("id", "item_code", "product_url", "name", "status_code", "color_image")
+TAG_TEXT_FIELDS = ("id", "name", "group_id")
+INTEGER_MAX = 2 ** 31 - 1
+
+# temporary tables are never WAL-logged and are dropped with the batch transaction
+STAGING_SQL = """
+CREATE TEMPORARY TABLE ingest_staging (position serial, line jsonb) ON COMMIT DROP
+"""
+
+# raw json lines: the quote and delimiter characters can't appear in the json.dumps output
+COPY_SQL = """
+COPY ingest_staging (line) FROM STDIN WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')
+"""
+
+# the last line of a product wins, a statement can't update the same row twice.
+# the fingerprints are compared with the stored ones in bulk, the unchanged products are not written at all
+STAGING_PRODUCTS_SQL = """
+CREATE TEMPORARY TABLE ingest_products ON COMMIT DROP AS
+SELECT staged.id, staged.line, CASE
+    WHEN product.id IS NULL THEN 'new'
+    WHEN product.content_hash = staged.line ->> 'content_hash' THEN 'unchanged'
+    ELSE 'changed'
+END AS status
+FROM (
+    SELECT DISTINCT ON (line ->> 'id') line ->> 'id' AS id, line
+    FROM ingest_staging
+    ORDER BY line ->> 'id', position DESC
+) AS staged
+LEFT JOIN products_product AS product ON product.id = staged.id
+"""
+
+STAGING_STATUS_SQL = """
+SELECT status, COUNT(*) FROM ingest_products GROUP BY status
+"""
+
+SKIP_UNCHANGED_SQL = """
+DELETE FROM ingest_products WHERE status = 'unchanged'
+"""
+
+# the changed and new inventories of the written products
+STAGING_INVENTORIES_SQL = """
+CREATE TEMPORARY TABLE ingest_inventories ON COMMIT DROP AS
+SELECT DISTINCT ON (inventory ->> 'id') inventory ->> 'id' AS id, ingest_products.id AS product_id, inventory
+FROM ingest_products
+CROSS JOIN jsonb_array_elements(line -> 'inventories') AS inventory
+LEFT JOIN products_productinventory AS stored ON stored.id = inventory ->> 'id'
+WHERE stored.content_hash IS DISTINCT FROM inventory ->> 'content_hash'
+ORDER BY inventory ->> 'id'
+"""
+
+# the reviews aggregates, increase_per and sale_price belong to this project, the crawlers don't overwrite them
+UPSERT_PRODUCTS_SQL = """
+INSERT INTO products_product AS product (
+    id, name, description, site_avg_rating, site_reviews_count, can_choose_tags, avg_rating, reviews_count,
+    reviews_rating_sum, is_active, created_at, modified_at, shop_code, shop_url, catch_copy, content_hash
+)
+SELECT id, line ->> 'name', line ->> 'description',
+       COALESCE((line ->> 'site_avg_rating')::float, 0), COALESCE((line ->> 'site_reviews_count')::float, 0),
+       COALESCE((line ->> 'can_choose_tags')::boolean, false), 0, 0, 0,
+       COALESCE((line ->> 'is_active')::boolean, true), NOW(), NOW(),
+       line ->> 'shop_code', line ->> 'shop_url', line ->> 'catch_copy', line ->> 'content_hash'
+FROM ingest_products
+ON CONFLICT (id) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    site_avg_rating = EXCLUDED.site_avg_rating,
+    site_reviews_count = EXCLUDED.site_reviews_count,
+    can_choose_tags = EXCLUDED.can_choose_tags,
+    is_active = EXCLUDED.is_active,
+    modified_at = EXCLUDED.modified_at,
+    shop_code = EXCLUDED.shop_code,
+    shop_url = EXCLUDED.shop_url,
+    catch_copy = EXCLUDED.catch_copy,
+    content_hash = EXCLUDED.content_hash
+RETURNING id
+"""
+
+# a tag group must be stored or come with the batch.
+# the stored names are the translations of the crawled (japanese) ones, they are not overwritten,
+# the groups of the new tags are returned for the translation (xmax = 0: the row is inserted)
+UPSERT_TAGS_SQL = """
+WITH tags AS (
+    SELECT DISTINCT ON (tag ->> 'id') tag ->> 'id' AS id, tag ->> 'name' AS name, tag ->> 'group_id' AS group_id
+    FROM ingest_products
+    CROSS JOIN jsonb_array_elements(line -> 'tags') AS tag
+    ORDER BY tag ->> 'id'
+),
+upserted AS (
+    INSERT INTO products_tag (id, name, group_id)
+    SELECT id, name, group_id FROM tags
+    WHERE group_id IS NULL
+       OR group_id IN (SELECT id FROM tags)
+       OR EXISTS(SELECT 1 FROM products_tag AS tag_group WHERE tag_group.id = tags.group_id)
+    ON CONFLICT (id) DO UPDATE SET group_id = EXCLUDED.group_id
+    RETURNING id, group_id, xmax = 0 AS inserted
+)
+SELECT DISTINCT COALESCE(group_id, id) FROM upserted WHERE inserted
+"""
+
+REPLACE_CATEGORIES_SQL = """
+DELETE FROM products_product_categories AS target
+USING ingest_products
+WHERE target.product_id = ingest_products.id AND ingest_products.line ? 'categories';
+
+INSERT INTO products_product_categories (product_id, category_id)
+SELECT DISTINCT ingest_products.id, category.id
+FROM ingest_products
+CROSS JOIN jsonb_array_elements_text(line -> 'categories') AS category_id
+JOIN products_category AS category ON category.id = category_id
+ON CONFLICT DO NOTHING
+"""
+
+# the inventories missing from the line are removed with their tags, only the changed ones are written
+REPLACE_INVENTORIES_SQL = """
+WITH stale AS (
+    SELECT inventory.id
+    FROM products_productinventory AS inventory
+    JOIN ingest_products ON inventory.product_id = ingest_products.id
+    WHERE line ? 'inventories'
+      AND NOT line -> 'inventories' @> jsonb_build_array(jsonb_build_object('id', inventory.id))
+),
+stale_tags AS (
+    DELETE FROM products_productinventory_tags AS target USING stale WHERE target.productinventory_id = stale.id
+)
+DELETE FROM products_productinventory AS target USING stale WHERE target.id = stale.id;
+
+INSERT INTO products_productinventory AS target (
+    id, product_id, item_code, site_price, product_url, name, quantity, status_code, increase_per, sale_price,
+    color_image, content_hash
+)
+SELECT id, product_id, inventory ->> 'item_code', (inventory ->> 'site_price')::numeric,
+       inventory ->> 'product_url', inventory ->> 'name', (inventory ->> 'quantity')::integer,
+       inventory ->> 'status_code', %(increase_per)s, NULL, inventory ->> 'color_image', inventory ->> 'content_hash'
+FROM ingest_inventories
+ON CONFLICT (id) DO UPDATE SET
+    product_id = EXCLUDED.product_id,
+    item_code = EXCLUDED.item_code,
+    site_price = EXCLUDED.site_price,
+    product_url = EXCLUDED.product_url,
+    name = EXCLUDED.name,
+    quantity = EXCLUDED.quantity,
+    status_code = EXCLUDED.status_code,
+    color_image = EXCLUDED.color_image,
+    content_hash = EXCLUDED.content_hash;
+
+DELETE FROM products_productinventory_tags AS target
+USING ingest_inventories
+WHERE target.productinventory_id = ingest_inventories.id AND inventory ? 'tag_ids';
+
+INSERT INTO products_productinventory_tags (productinventory_id, tag_id)
+SELECT DISTINCT ingest_inventories.id, tag.id
+FROM ingest_inventories
+CROSS JOIN jsonb_array_elements_text(inventory -> 'tag_ids') AS tag_id
+JOIN products_tag AS tag ON tag.id = tag_id
+ON CONFLICT DO NOTHING
+"""
+
+# only the crawled (url) images are replaced, the uploaded ones stay, the new urls keep the line order
+REPLACE_IMAGES_SQL = """
+DELETE FROM products_productimage AS target
+USING ingest_products
+WHERE target.product_id = ingest_products.id
+  AND line ? 'images'
+  AND target.url IS NOT NULL
+  AND NOT line -> 'images' ? target.url;
+
+INSERT INTO products_productimage (product_id, url)
+SELECT product_id, url FROM (
+    SELECT ingest_products.id AS product_id, image.url, MIN(image.position) AS position
+    FROM ingest_products
+    CROSS JOIN jsonb_array_elements_text(line -> 'images') WITH ORDINALITY AS image(url, position)
+    GROUP BY ingest_products.id, image.url
+) AS images
+WHERE NOT EXISTS(
+    SELECT 1 FROM products_productimage AS image WHERE image.product_id = images.product_id AND image.url = images.url
+)
+ORDER BY product_id, position
+"""
+
+# the crawlers brought the products back, their archived copies are outdated
+DROP_ARCHIVED_SQL = """
+DELETE FROM products_archivedproduct WHERE id IN (SELECT id FROM ingest_products)
+"""
+
+
+def text_error(model, data: dict[str, Any], fields: Iterable[str], prefix: str = "") -> str | None:
+    for field in fields:
+        value = data.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return "%s%s must be a string" % (prefix, field)
+        # jsonb has no NUL character
+        if "\x00" in value:
+            return "%s%s has a NUL character" % (prefix, field)
+        # a foreign key column is the one of the key it points to
+        column = model._meta.get_field(field)
+        max_length = getattr(column, "target_field", column).max_length
+        if max_length and len(value) > max_length:
+            return "%s%s is longer than %s characters" % (prefix, field, max_length)
+    return None
+
+
+def is_number(value: Any) -> bool:
+    # bool is an int, NaN and infinity are not json for postgres
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def strings_error(values: list, max_length: int, field: str) -> str | None:
+    if not all(isinstance(value, str) and "\x00" not in value for value in values):
+        return "%s must be strings" % field
+    if max_length and any(len(value) > max_length for value in values):
+        return "%s must be up to %s characters" % (field, max_length)
+    return None
+
+
+def inventory_error(inventory: Any) -> str | None:
+    if not isinstance(inventory, dict) or not all(inventory.get(field) for field in INVENTORY_REQUIRED_FIELDS):
+        return "inventories require %s" % ", ".join(INVENTORY_REQUIRED_FIELDS)
+    if error := text_error(ProductInventory, inventory, INVENTORY_TEXT_FIELDS, prefix="inventory "):
+        return error
+
+    site_price = ProductInventory._meta.get_field("site_price")
+    price_digits = site_price.max_digits - site_price.decimal_places
+    if not is_number(inventory["site_price"]) or not 0 <= inventory["site_price"] < 10 ** price_digits:
+        return "inventory site_price must be a number from 0 with up to %s integer digits" % price_digits
+    quantity = inventory.get("quantity")
+    if quantity is not None and (not isinstance(quantity, int) or isinstance(quantity, bool)
+                                 or not 0 <= quantity <= INTEGER_MAX):
+        return "inventory quantity must be a positive integer"
+    if "tag_ids" in inventory:
+        if not isinstance(inventory["tag_ids"], list):
+            return "inventory tag_ids must be a list"
+        return strings_error(inventory["tag_ids"], None, "inventory tag_ids")
+    return None
+
+
+def line_error(data: Any) -> str | None:
+    if not isinstance(data, dict):
+        return "not an object"
+    for field in REQUIRED_FIELDS:
+        if not isinstance(data.get(field), str) or not data[field]:
+            return "%s is required" % field
+    if error := text_error(Product, data, PRODUCT_TEXT_FIELDS):
+        return error
+    try:
+        Site.from_instance_id(data["id"])
+    except KeyError:
+        return "unsupported site of %s" % data["id"]
+    for field in LIST_FIELDS:
+        if field in data and not isinstance(data[field], list):
+            return "%s must be a list" % field
+    for field in ("site_avg_rating", "site_reviews_count"):
+        if data.get(field) is not None and not is_number(data[field]):
+            return "%s must be a number" % field
+    for field in ("can_choose_tags", "is_active"):
+        if data.get(field) is not None and not isinstance(data[field], bool):
+            return "%s must be a boolean" % field
+    if error := strings_error(data.get("categories", []), None, "categories"):
+        return error
+    if error := strings_error(data.get("images", []), ProductImage._meta.get_field("url").max_length, "images"):
+        return error
+    for tag in data.get("tags", []):
+        if not isinstance(tag, dict) or not isinstance(tag.get("id"), str) or not isinstance(tag.get("name"), str):
+            return "tags must be objects with id and name"
+        if error := text_error(Tag, tag, TAG_TEXT_FIELDS, prefix="tag "):
+            return error
+    for inventory in data.get("inventories", []):
+        if error := inventory_error(inventory):
+            return error
+    return None
+
+
+def content_hash(data: dict[str, Any]) -> str:
+    # stable over the keys order, the lists order is kept (the first image is the main one)
+    return hashlib.md5(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def fingerprinted(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    the line with the content_hash of the product (everything of the line) and of every inventory
+    """
+    inventories = [
+        {**inventory, "content_hash": content_hash({**inventory, "product_id": data["id"]})}
+        for inventory in data.get("inventories", [])
+    ]
+    fingerprinted_data = {**data, "content_hash": content_hash(data)}
+    if "inventories" in data:
+        fingerprinted_data["inventories"] = inventories
+    return fingerprinted_data
+
+
+def merge_batch(lines: list[str]) -> dict[str, int]:
+    """
+    COPY of the batch lines into the staging table, then one set-based statement per table,
+    the unchanged products (same fingerprint) are skipped.
+    Returns the count of the new, changed and unchanged products.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(STAGING_SQL)
+        cursor.copy_expert(COPY_SQL, io.StringIO("\n".join(lines)))
+        cursor.execute(STAGING_PRODUCTS_SQL)
+        cursor.execute(STAGING_STATUS_SQL)
+        counts = {"new": 0, "changed": 0, "unchanged": 0, **dict(cursor.fetchall())}
+        cursor.execute(SKIP_UNCHANGED_SQL)
+        cursor.execute(STAGING_INVENTORIES_SQL)
+
+        cursor.execute(UPSERT_PRODUCTS_SQL)
+        product_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(UPSERT_TAGS_SQL)
+        tag_group_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(REPLACE_CATEGORIES_SQL)
+        cursor.execute(REPLACE_INVENTORIES_SQL, {"increase_per": settings.DEFAULT_INCREASE_PRICE_PER})
+        cursor.execute(REPLACE_IMAGES_SQL)
+        cursor.execute(DROP_ARCHIVED_SQL)
+
+        # sale prices, promotion feeds and the products cache of the touched products only
+        dispatch_once(recompute_sale_prices_batch, "promotions-sale-prices", settings.DISPATCH_WINDOWS["SALE_PRICES"],
+                      args=[["product", product_id] for product_id in product_ids])
+        if tag_group_ids:
+            dispatch_once(tasks.translated_tag_groups, "translate-tag-groups",
+                          settings.DISPATCH_WINDOWS["TAG_TRANSLATION"], args=tag_group_ids)
+        # ON COMMIT doesn't happen before the next batch inside an outer transaction
+        cursor.execute("DROP TABLE ingest_inventories, ingest_products, ingest_staging")
+    return counts
+
+
+def ingest_products(lines: Iterable[str | bytes], batch_size: int = None) -> dict[str, Any]:
+    """
+    Upserts the products of the NDJSON lines with their categories, tags, inventories and images.
+    Every batch is merged in its own transaction, the invalid lines are skipped and reported.
+    """
+    config = settings.PRODUCT_INGESTION
+    batch_size = batch_size or config["BATCH_SIZE"]
+    report = {"lines": 0, "rejected": 0, "new": 0, "changed": 0, "unchanged": 0, "batches": 0, "errors": []}
+
+    def valid_lines():
+        for number, line in enumerate(lines, start=1):
+            report["lines"] = number
+            if isinstance(line, bytes):
+                line = line.decode()
+            if not line.strip():
+                continue
+
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                error = "invalid json: %s" % e
+            else:
+                error = line_error(data)
+
+            if error is None:
+                yield json.dumps(fingerprinted(data))
+                continue
+
+            report["rejected"] += 1
+            if len(report["errors"]) < config["MAX_REPORTED_ERRORS"]:
+                report["errors"].append({"line": number, "error": error})
+
+    valid = valid_lines()
+    while batch := list(islice(valid, batch_size)):
+        for status, count in merge_batch(batch).items():
+            report[status] += count
+        report["batches"] += 1
+
+    logging.info("Ingestion: %s lines, %s rejected, %s new, %s changed, %s unchanged" % (
+        report["lines"], report["rejected"], report["new"], report["changed"], report["unchanged"]
+    ))
+    return report
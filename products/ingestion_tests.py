@@ -0,0 +1,111 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from .ingestion import ingest_products
+from .models import Category, Product, ProductInventory, Tag
+
+
+def product_line(product_id, **fields):
+    data = {
+        "id": product_id,
+        "name": "Bag %s" % product_id,
+        "shop_code": "shop",
+        "shop_url": "https://shop.example.com/",
+        "categories": ["rakuten_100"],
+        "images": ["https://image.example.com/%s.jpg" % product_id],
+        "tags": [{"id": "rakuten_1", "name": "Color"}, {"id": "rakuten_2", "name": "Red", "group_id": "rakuten_1"}],
+        "inventories": [
+            inventory_data("%s_red" % product_id, tag_ids=["rakuten_2"]),
+            inventory_data("%s_blue" % product_id),
+        ],
+        **fields
+    }
+    return json.dumps(data)
+
+
+def inventory_data(inventory_id, **fields):
+    return {
+        "id": inventory_id,
+        "item_code": "item",
+        "site_price": 1000,
+        "product_url": "https://shop.example.com/item",
+        "name": "Bag",
+        "quantity": 3,
+        **fields
+    }
+
+
+class TestIngestion(TestCase):
+    def setUp(self):
+        Category.objects.create(id="rakuten_100", name="Bags")
+        Category.objects.create(id="rakuten_200", name="Wallets")
+
+    def test_new_changed_and_rejected_lines(self):
+        report = ingest_products([
+            product_line("rakuten_a"),
+            product_line("rakuten_b"),
+            "{not json",
+            product_line("rakuten_c", name="x" * 256),
+            product_line("rakuten_d", inventories=[inventory_data("rakuten_d_1", site_price=10 ** 18)]),
+            product_line("rakuten_e", inventories=[inventory_data("rakuten_e_1", quantity=-1)]),
+            product_line("rakuten_f", images=["https://image.example.com/" + "x" * 700]),
+        ], batch_size=2)
+
+        self.assertEqual(report["new"], 2)
+        self.assertEqual(report["rejected"], 5)
+        self.assertEqual([error["line"] for error in report["errors"]], [3, 4, 5, 6, 7])
+        self.assertEqual(report["errors"][1]["error"], "name is longer than 255 characters")
+        self.assertEqual(set(Product.objects.values_list("id", flat=True)), {"rakuten_a", "rakuten_b"})
+        self.assertEqual(Tag.objects.get(id="rakuten_2").group_id, "rakuten_1")
+        self.assertEqual(list(ProductInventory.objects.get(id="rakuten_a_red").tags.values_list("id", flat=True)),
+                         ["rakuten_2"])
+
+        report = ingest_products([
+            product_line("rakuten_a", categories=["rakuten_200"],
+                         inventories=[inventory_data("rakuten_a_red", site_price=1200, tag_ids=[])]),
+            product_line("rakuten_b"),
+        ])
+
+        self.assertEqual((report["new"], report["changed"], report["unchanged"]), (0, 1, 1))
+        product = Product.objects.get(id="rakuten_a")
+        self.assertEqual(list(product.categories.values_list("id", flat=True)), ["rakuten_200"])
+        # the missing inventory is removed, the tags are replaced by the empty list
+        inventories = list(product.inventories.all())
+        self.assertEqual([inventory.id for inventory in inventories], ["rakuten_a_red"])
+        self.assertEqual(inventories[0].site_price, 1200)
+        self.assertFalse(inventories[0].tags.exists())
+        self.assertEqual(ProductInventory.objects.filter(product_id="rakuten_b").count(), 2)
+
+    def test_rows_changed_outside_are_rewritten(self):
+        line = product_line("rakuten_a")
+        ingest_products([line])
+        inventory = ProductInventory.objects.get(id="rakuten_a_red")
+        inventory.site_price = 1
+        inventory.save()
+        product = Product.objects.get(id="rakuten_a")
+        product.categories.set(["rakuten_200"])
+        product.images.all().delete()
+
+        report = ingest_products([line])
+
+        self.assertEqual(report["changed"], 1)
+        inventory.refresh_from_db()
+        self.assertEqual(inventory.site_price, 1000)
+        self.assertEqual(list(product.categories.values_list("id", flat=True)), ["rakuten_100"])
+        self.assertEqual(product.images.count(), 1)
+        self.assertEqual(ingest_products([line])["unchanged"], 1)
+
+    def test_new_tags_are_translated(self):
+        with mock.patch("products.ingestion.dispatch_once") as dispatch_once:
+            ingest_products([product_line("rakuten_a")])
+            translations = [call for call in dispatch_once.call_args_list if call.args[1] == "translate-tag-groups"]
+            self.assertEqual(translations[0].kwargs["args"], ["rakuten_1"])
+
+            # the translated names stay, the known tags are not translated again
+            Tag.objects.filter(id="rakuten_2").update(name="Red (en)")
+            dispatch_once.reset_mock()
+            ingest_products([product_line("rakuten_a", name="Red bag")])
+            self.assertEqual(Tag.objects.get(id="rakuten_2").name, "Red (en)")
+            self.assertFalse([call for call in dispatch_once.call_args_list if call.args[1] == "translate-tag-groups"])
@@ -0,0 +1,22 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.ingestion import ingest_products
+
+
+class Command(BaseCommand):
+    help = "Upserts the products of a NDJSON file (one product per line) in set-based batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON file, - for stdin")
+        parser.add_argument("--batch-size", type=int, help="lines per transaction")
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            report = ingest_products(sys.stdin, batch_size=options["batch_size"])
+        else:
+            with open(options["path"], encoding="utf-8") as file:
+                report = ingest_products(file, batch_size=options["batch_size"])
+        self.stdout.write(json.dumps(report, indent=2))
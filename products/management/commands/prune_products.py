@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Product
+from products.pruning import prune_products
+from products.tasks import products_pruned
+
+
+class Command(BaseCommand):
+    help = "Deletes products with their dependent rows in committed batches, --dry-run only reports the rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--category", action="append", default=[], help="category id, repeatable")
+        parser.add_argument("--site", help="products of the site only")
+        parser.add_argument("--inactive", action="store_true", help="inactive products only")
+        parser.add_argument("--limit", type=int, help="max products to delete")
+        parser.add_argument("--job", help="checkpoint name, a failed run with the same name continues")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["category"]:
+            products = products.filter(categories__id__in=options["category"])
+        if options["site"]:
+            products = products.filter_by_site(options["site"])
+        if options["inactive"]:
+            products = products.filter(is_active=False)
+        if not products.query.where:
+            raise CommandError("Pass at least one of --category, --site or --inactive")
+
+        report = prune_products(products, limit=options["limit"], job=options["job"], dry_run=options["dry_run"])
+        if not options["dry_run"]:
+            products_pruned(report)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_remove_product_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reviews_rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+            UPDATE products_product AS product
+            SET reviews_count = aggregates.reviews_count,
+                reviews_rating_sum = aggregates.rating_sum,
+                avg_rating = aggregates.rating_sum / aggregates.reviews_count
+            FROM (
+                SELECT product_id, COUNT(id) AS reviews_count, SUM(rating) AS rating_sum
+                FROM products_productreview
+                WHERE moderated
+                GROUP BY product_id
+            ) AS aggregates
+            WHERE product.id = aggregates.product_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:37
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_reviews_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(choices=[('rakuten', 'Rakuten'), ('uniqlo', 'Uniqlo'), ('kaimono', 'Kaimono')], max_length=50)),
+                ('max_products', models.PositiveIntegerField()),
+                ('category', models.ForeignKey(blank=True, limit_choices_to={'level': 1}, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retention_policies', to='products.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Retention policies',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('site_avg_rating', models.FloatField(default=0)),
+                ('site_reviews_count', models.FloatField(default=0)),
+                ('can_choose_tags', models.BooleanField(default=False)),
+                ('avg_rating', models.FloatField(default=0)),
+                ('reviews_count', models.PositiveIntegerField(default=0)),
+                ('reviews_rating_sum', models.FloatField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('modified_at', models.DateTimeField()),
+                ('shop_code', models.CharField(max_length=100)),
+                ('shop_url', models.URLField(max_length=700)),
+                ('catch_copy', models.CharField(blank=True, max_length=300, null=True)),
+                ('category_ids', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('inventories', models.JSONField(default=list)),
+                ('images', models.JSONField(default=list)),
+                ('reviews', models.JSONField(default=list)),
+                ('reason', models.CharField(choices=[('evicted', 'Evicted')], max_length=20)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reason', 'archived_at'], name='products_ar_reason_55e3a1_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='retentionpolicy',
+            constraint=models.UniqueConstraint(fields=('site', 'category'), name='unique_site_category_retention_policy'),
+        ),
+        migrations.AddConstraint(
+            model_name='retentionpolicy',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('site',), name='unique_site_retention_policy'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_retention_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_id_c8f845_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_id_78e68a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_id_6d995e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_id_be8089_idx',
+        ),
+        migrations.AlterField(
+            model_name='archivedproduct',
+            name='reason',
+            field=models.CharField(choices=[('evicted', 'Evicted'), ('inactive', 'Inactive')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id', 'name'], name='product_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id', 'site_avg_rating', 'site_reviews_count'], name='product_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id', 'created_at'], name='product_active_created_idx'),
+        ),
+    ]
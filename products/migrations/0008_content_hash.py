@@ -0,0 +1,28 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_serving_tier_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='productinventory',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
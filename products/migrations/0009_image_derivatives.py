@@ -0,0 +1,31 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['source_hash'], name='products_pr_source__45b8c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(condition=models.Q(('derivatives__isnull', True)), fields=['id'], name='productimage_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 04:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_id_e0f669_idx',
+        ),
+    ]
@@ -1,11 +1,16 @@
+from typing import Iterable
+
 from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.fields.json import KeyTransform
 from django.db.models.functions import JSONObject, Round
 from django.template.defaultfilters import truncatechars
 from django.utils.translation import gettext_lazy as _
 
+from service.enums import Site
 from service.querysets import BaseAnalyticsQuerySet, AnalyticsFilterBy
 from service.utils import increase_price, uid_generate
 
@@ -24,6 +29,18 @@ class BaseModel(models.Model):
         abstract = True
 
 
+def clear_content_hash(instance, save_kwargs):
+    # the row is changed outside the ingestion, the next crawl of the same data must rewrite it
+    instance.content_hash = ''
+    if save_kwargs.get('update_fields') is not None:
+        save_kwargs['update_fields'] = {*save_kwargs['update_fields'], 'content_hash'}
+
+
+def clear_products_content_hash(product_ids: Iterable[str]) -> None:
+    # the product fingerprint covers its whole line: a changed inventory, image or category rewrites the product too
+    Product.objects.filter(id__in=list(product_ids)).exclude(content_hash='').update(content_hash='')
+
+
 class Category(BaseModel):
     name = models.CharField(max_length=100)
     level = models.PositiveIntegerField(default=0)
@@ -93,6 +110,8 @@ class Product(BaseModel):
 
     avg_rating = models.FloatField(default=0)
     reviews_count = models.PositiveIntegerField(default=0)
+    # sum of the moderated reviews ratings, avg_rating = reviews_rating_sum / reviews_count
+    reviews_rating_sum = models.FloatField(default=0)
 
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -101,17 +120,24 @@ class Product(BaseModel):
     shop_code = models.CharField(max_length=100)
     shop_url = models.URLField(max_length=700)
     catch_copy = models.CharField(max_length=300, blank=True, null=True)
+    # fingerprint of the last ingested crawler data, see products.ingestion
+    content_hash = models.CharField(max_length=32, blank=True, default='')
 
     def __str__(self):
         return self.id
 
+    def save(self, *args, **kwargs):
+        clear_content_hash(self, kwargs)
+        super().save(*args, **kwargs)
+
     class Meta:
         indexes = (
-            models.Index(fields=("id", "name")),
-            models.Index(fields=("id", "is_active")),
-            models.Index(fields=("id", "is_active", "name")),
-            models.Index(fields=("id", "site_avg_rating", "site_reviews_count")),
-            models.Index(fields=("id", "created_at"))
+            # the serving tier: the public queries only read the active products
+            models.Index(fields=("id", "name"), condition=models.Q(is_active=True), name="product_active_name_idx"),
+            models.Index(fields=("id", "site_avg_rating", "site_reviews_count"), condition=models.Q(is_active=True),
+                         name="product_active_rating_idx"),
+            models.Index(fields=("id", "created_at"), condition=models.Q(is_active=True),
+                         name="product_active_created_idx"),
         )
 
 
@@ -121,6 +147,23 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     url = models.URLField(max_length=700, blank=True, null=True)
+    # sha256 of the source and the resized copies (see products.images), empty derivatives: unreadable source
+    source_hash = models.CharField(max_length=64, blank=True, null=True)
+    derivatives = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("source_hash",)),
+            models.Index(fields=("id",), condition=models.Q(derivatives__isnull=True), name="productimage_pending_idx"),
+        )
+
+    def save(self, *args, **kwargs):
+        # the image may be another file now, the derivatives are rendered again
+        self.source_hash, self.derivatives = None, None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'source_hash', 'derivatives'}
+        super().save(*args, **kwargs)
+        clear_products_content_hash([self.product_id])
 
 
 class ProductInventory(BaseModel):
@@ -141,6 +184,12 @@ class ProductInventory(BaseModel):
     )
     sale_price = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
     color_image = models.URLField(max_length=700, blank=True, null=True)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+
+    def save(self, *args, **kwargs):
+        clear_content_hash(self, kwargs)
+        super().save(*args, **kwargs)
+        clear_products_content_hash([self.product_id])
 
     @property
     def price(self):
@@ -182,3 +231,102 @@ class ProductReview(models.Model):
     comment = models.TextField(blank=True, null=True)
     moderated = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # None: unknown (a new review or loaded with deferred fields)
+    _aggregate_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_aggregate_state()
+        return instance
+
+    def remember_aggregate_state(self):
+        # what the stored row contributes to the product aggregates, the signals apply the difference
+        if {'product_id', 'moderated', 'rating'} & self.get_deferred_fields():
+            self._aggregate_state = None
+        else:
+            self._aggregate_state = self.aggregate_state
+
+    @property
+    def aggregate_state(self) -> tuple[str, int, float]:
+        return (self.product_id, 1, self.rating) if self.moderated else (self.product_id, 0, 0)
+
+
+class RetentionPolicy(models.Model):
+    """
+    max products kept in the level 1 categories of the site: per category,
+    or without a category the site limit shared equally between its level 1 categories
+    """
+    objects = models.Manager()
+
+    site = models.CharField(max_length=50, choices=[(site.value, site.value.title()) for site in Site])
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='retention_policies',
+                                 null=True, blank=True, limit_choices_to={'level': 1})
+    max_products = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name_plural = _('Retention policies')
+        constraints = (
+            models.UniqueConstraint(fields=("site", "category"), name="unique_site_category_retention_policy"),
+            models.UniqueConstraint(fields=("site",), condition=models.Q(category__isnull=True),
+                                    name="unique_site_retention_policy"),
+        )
+
+    def __str__(self):
+        return f"{self.site}: {self.category_id or 'all'} <= {self.max_products}"
+
+
+class ArchivedProductQuerySet(QuerySet):
+    def short_values(self):
+        # the shape of the admin products list, see products.filters.ProductFilter
+        return self.values('id', 'name', 'avg_rating', 'reviews_count', 'is_active').annotate(
+            inventory_info=KeyTransform('0', 'inventories'),
+            image_info=KeyTransform('0', 'images')
+        )
+
+
+class ArchivedProduct(models.Model):
+    """
+    cold copy of a product removed from the catalog (evicted or inactive), it can be restored with its
+    categories, inventories, images and reviews, the receipts keep referencing it by product_code
+    """
+    objects = ArchivedProductQuerySet.as_manager()
+
+    class Reason(models.TextChoices):
+        evicted = 'evicted', _('Evicted')
+        inactive = 'inactive', _('Inactive')
+
+    id = models.CharField(primary_key=True, max_length=100)
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    site_avg_rating = models.FloatField(default=0)
+    site_reviews_count = models.FloatField(default=0)
+    can_choose_tags = models.BooleanField(default=False)
+    avg_rating = models.FloatField(default=0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    reviews_rating_sum = models.FloatField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    shop_code = models.CharField(max_length=100)
+    shop_url = models.URLField(max_length=700)
+    catch_copy = models.CharField(max_length=300, blank=True, null=True)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+
+    # the dependent rows as they were, the inventories with their tag_ids
+    category_ids = ArrayField(models.CharField(max_length=100), default=list)
+    inventories = models.JSONField(default=list)
+    images = models.JSONField(default=list)
+    reviews = models.JSONField(default=list)
+
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("reason", "archived_at")),
+        )
+
+    def __str__(self):
+        return self.id
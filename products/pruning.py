@@ -0,0 +1,191 @@
+import logging
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from products.models import Product
+
+
+# (table, joined table, condition): the tables referencing the products, children first, the products last.
+# Every statement deletes the rows of one batch of product ids with a single set-based query.
+PRUNING_STEPS = (
+    (
+        "products_productinventory_tags",
+        "products_productinventory AS inventory",
+        "target.productinventory_id = inventory.id AND inventory.product_id = ANY(%(product_ids)s)"
+    ),
+    ("products_product_categories", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("promotions_promotion_products", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("promotions_promotionfeeditem", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("products_productreview", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("products_productinventory", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("products_productimage", None, "target.product_id = ANY(%(product_ids)s)"),
+    ("products_product", None, "target.id = ANY(%(product_ids)s)"),
+)
+
+PROMOTION_IDS_SQL = """
+SELECT DISTINCT promotion_id FROM promotions_promotion_products WHERE product_id = ANY(%(product_ids)s)
+"""
+
+# copies the products with their dependent rows into the archive, before the batch deletes them.
+# the *_row aliases don't clash with the column names (to_jsonb(image) would take the image column)
+ARCHIVE_SQL = """
+INSERT INTO products_archivedproduct (%(columns)s, category_ids, inventories, images, reviews, reason, archived_at)
+SELECT %(product_columns)s,
+       ARRAY(SELECT category_id FROM products_product_categories WHERE product_id = product.id),
+       COALESCE((
+           SELECT jsonb_agg(to_jsonb(inventory_row) || jsonb_build_object('tag_ids', ARRAY(
+               SELECT tag_id FROM products_productinventory_tags WHERE productinventory_id = inventory_row.id
+           )))
+           FROM products_productinventory AS inventory_row WHERE inventory_row.product_id = product.id
+       ), '[]'),
+       COALESCE((
+           SELECT jsonb_agg(to_jsonb(image_row)) FROM products_productimage AS image_row
+           WHERE image_row.product_id = product.id
+       ), '[]'),
+       COALESCE((
+           SELECT jsonb_agg(to_jsonb(review_row)) FROM products_productreview AS review_row
+           WHERE review_row.product_id = product.id
+       ), '[]'),
+       %%(reason)s,
+       NOW()
+FROM products_product AS product
+WHERE product.id = ANY(%%(archive_ids)s)
+ON CONFLICT (id) DO UPDATE SET %(updates)s
+"""
+
+# max replay lag of the streaming replicas, nothing without replicas or the pg_monitor role
+REPLICATION_LAG_SQL = """
+SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0) FROM pg_stat_replication
+"""
+
+
+def delete_sql(table: str, joined_table: str | None, condition: str) -> str:
+    using = " USING %s" % joined_table if joined_table else ""
+    return "DELETE FROM %s AS target%s WHERE %s" % (table, using, condition)
+
+
+def count_sql(table: str, joined_table: str | None, condition: str) -> str:
+    joined = ", %s" % joined_table if joined_table else ""
+    return "SELECT COUNT(*) FROM %s AS target%s WHERE %s" % (table, joined, condition)
+
+
+def archive_sql() -> str:
+    columns = [field.column for field in Product._meta.concrete_fields]
+    updated = columns + ["category_ids", "inventories", "images", "reviews", "reason", "archived_at"]
+    return ARCHIVE_SQL % {
+        "columns": ", ".join(columns),
+        "product_columns": ", ".join("product.%s" % column for column in columns),
+        "updates": ", ".join("%s = EXCLUDED.%s" % (column, column) for column in updated if column != "id")
+    }
+
+
+def replication_lag() -> float:
+    with connection.cursor() as cursor:
+        cursor.execute(REPLICATION_LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def wait_for_replicas(max_lag: float, max_wait: float) -> None:
+    started_at = time.monotonic()
+    while (lag := replication_lag()) > max_lag:
+        if time.monotonic() - started_at > max_wait:
+            logging.warning("Pruning goes on with replication lag %.1fs" % lag)
+            return
+        time.sleep(min(lag, max_lag) or 1)
+
+
+def checkpoint_key(job: str) -> str:
+    return "products_pruning:%s" % job
+
+
+def prune_batch(product_ids: list[str], dry_run: bool = False, archive_ids: list[str] = None,
+                archive_reason: str = None) -> tuple[dict[str, int], set[int]]:
+    """
+    deletes (or counts) the rows of all steps in one transaction, returns the rows per table and the promotions,
+    the archive_ids products are archived first
+    """
+    params = {"product_ids": product_ids, "archive_ids": archive_ids or [], "reason": archive_reason}
+    rows = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PROMOTION_IDS_SQL, params)
+        promotion_ids = {row[0] for row in cursor.fetchall()}
+
+        if archive_ids and not dry_run:
+            cursor.execute(archive_sql(), params)
+            rows["products_archivedproduct"] = cursor.rowcount
+        else:
+            rows["products_archivedproduct"] = len(archive_ids or [])
+
+        for step in PRUNING_STEPS:
+            if dry_run:
+                cursor.execute(count_sql(*step), params)
+                rows[step[0]] = cursor.fetchone()[0]
+            else:
+                cursor.execute(delete_sql(*step), params)
+                rows[step[0]] = cursor.rowcount
+    return rows, promotion_ids
+
+
+def prune_products(products_query, limit: int = None, job: str = None, dry_run: bool = False,
+                   archive_query=None, archive_reason: str = None) -> dict[str, Any]:
+    """
+    Deletes the selected products with their dependent rows, batch by batch in id order, each batch is committed.
+    The products also matching archive_query are copied to ArchivedProduct (with archive_reason) in the same batch.
+    With a job name the progress is checkpointed, an interrupted job continues after the last committed batch.
+    dry_run only reports the rows that would be deleted.
+    Returns the report: rows per table, batches count and ids of the promotions that lost products.
+    """
+    config = settings.PRODUCT_PRUNING
+    cache = caches["default"]
+    batch_size = config["BATCH_SIZE"]
+
+    report = {
+        "rows": {"products_archivedproduct": 0, **{step[0]: 0 for step in PRUNING_STEPS}},
+        "batches": 0,
+        "promotion_ids": [],
+        "dry_run": dry_run
+    }
+    last_product_id = ""
+    if job and not dry_run:
+        checkpoint = cache.get(checkpoint_key(job))
+        if checkpoint:
+            report, last_product_id = checkpoint["report"], checkpoint["last_product_id"]
+            logging.info("Pruning %s continues after %s" % (job, last_product_id))
+
+    products = Product.objects.filter(id__in=products_query.values('id')).order_by('id')
+    while limit is None or report["rows"]["products_product"] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report["rows"]["products_product"])
+        product_ids = list(products.filter(id__gt=last_product_id).values_list('id', flat=True)[:size])
+        if not product_ids:
+            break
+
+        if not dry_run:
+            wait_for_replicas(config["MAX_REPLICATION_LAG_SECONDS"], config["MAX_LAG_WAIT_SECONDS"])
+
+        archive_ids = None
+        if archive_query is not None:
+            archive_ids = list(archive_query.filter(id__in=product_ids).values_list('id', flat=True))
+
+        rows, promotion_ids = prune_batch(product_ids, dry_run=dry_run, archive_ids=archive_ids,
+                                          archive_reason=archive_reason)
+        for table, count in rows.items():
+            report["rows"][table] = report["rows"].get(table, 0) + count
+        report["promotion_ids"] = sorted(set(report["promotion_ids"]) | promotion_ids)
+        report["batches"] += 1
+        last_product_id = product_ids[-1]
+
+        if job and not dry_run:
+            cache.set(checkpoint_key(job), {"report": report, "last_product_id": last_product_id},
+                      timeout=config["CHECKPOINT_SECONDS"])
+        if config["BATCH_SLEEP_SECONDS"] and not dry_run:
+            time.sleep(config["BATCH_SLEEP_SECONDS"])
+
+    if job and not dry_run:
+        cache.delete(checkpoint_key(job))
+
+    logging.info("Pruning %s%s: %s" % (job or "products", " (dry run)" if dry_run else "", report["rows"]))
+    return report
@@ -0,0 +1,83 @@
+import logging
+from typing import Iterator
+
+from django.conf import settings
+from django.db import connection
+
+from .models import ArchivedProduct, Category, Product, RetentionPolicy
+from .pruning import prune_products
+
+
+# the lowest value products of the category first: stale, inactive and never ordered.
+# ORDER BY with LIMIT keeps only the top of the category in memory instead of sorting it all
+EVICTION_CANDIDATES_SQL = """
+SELECT product.id, EXISTS(SELECT 1 FROM orders_receipt AS receipt WHERE receipt.product_code = product.id) AS ordered
+FROM products_product AS product
+JOIN products_product_categories AS category ON category.product_id = product.id
+WHERE category.category_id = %(category_id)s
+ORDER BY
+    EXTRACT(EPOCH FROM NOW() - product.modified_at) / 86400 * %(stale_day)s
+    + CASE WHEN product.is_active THEN 0 ELSE %(inactive)s END
+    + CASE WHEN EXISTS(SELECT 1 FROM orders_receipt AS receipt WHERE receipt.product_code = product.id)
+        THEN 0 ELSE %(no_orders)s END
+    DESC,
+    product.id
+LIMIT %(limit)s
+"""
+
+
+def category_quotas(site: str) -> Iterator[tuple[Category, int]]:
+    """
+    the max products of every active level 1 category of the site,
+    the category policy wins over the site policy, the site policy falls back to SITE_MAX_PRODUCTS
+    """
+    config = settings.PRODUCT_RETENTION
+    categories = Category.objects.filter(level=1, deactivated=False, id__startswith=site)
+    policies = {policy.category_id: policy.max_products for policy in RetentionPolicy.objects.filter(site=site)}
+    site_max_products = policies.get(None, config["SITE_MAX_PRODUCTS"].get(site))
+
+    shared = [category for category in categories if category.id not in policies]
+    for category in categories:
+        if category.id in policies:
+            yield category, policies[category.id]
+        elif site_max_products is not None:
+            yield category, site_max_products // len(shared)
+
+
+def eviction_candidates(category_id: str, limit: int) -> list[tuple[str, bool]]:
+    """
+    (product id, ordered) of the limit products with the highest eviction score
+    """
+    weights = settings.PRODUCT_RETENTION["WEIGHTS"]
+    with connection.cursor() as cursor:
+        cursor.execute(EVICTION_CANDIDATES_SQL, {
+            "category_id": category_id,
+            "stale_day": weights["STALE_DAY"],
+            "inactive": weights["INACTIVE"],
+            "no_orders": weights["NO_ORDERS"],
+            "limit": limit
+        })
+        return cursor.fetchall()
+
+
+def evict_category_chunk(category_id: str, max_products: int) -> tuple[dict, int]:
+    """
+    Evicts one chunk of the category excess, the ordered products are archived instead of being just deleted.
+    Returns the pruning report and the excess left for the next chunks.
+    """
+    excess = Product.objects.filter(categories__id=category_id).count() - max_products
+    if excess <= 0:
+        return {"rows": {"products_product": 0}, "promotion_ids": []}, 0
+
+    candidates = eviction_candidates(category_id, min(excess, settings.PRODUCT_RETENTION["CHUNK_SIZE"]))
+    ordered_ids = [product_id for product_id, ordered in candidates if ordered]
+    report = prune_products(
+        Product.objects.filter(id__in=[product_id for product_id, _ in candidates]),
+        archive_query=Product.objects.filter(id__in=ordered_ids),
+        archive_reason=ArchivedProduct.Reason.evicted
+    )
+    evicted = report["rows"]["products_product"]
+    logging.info("Retention of %s: %s products evicted, %s archived" % (
+        category_id, evicted, report["rows"]["products_archivedproduct"]
+    ))
+    return report, excess - evicted
@@ -4,6 +4,7 @@ from rest_framework import serializers
 from service.serializers import ConversionField
 from service.utils import get_currency_by_id, get_currencies_price_per, convert_price, increase_price, check_to_json
 
+from .images import image_set
 from .models import Category, Product, ProductInventory, ProductReview, ProductImage
 
 
@@ -13,13 +14,18 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'level', 'parent_id')
 
 
+def storage_url_builder(request):
+    return lambda name: request.build_absolute_uri(default_storage.url(name))
+
+
 class ShortProductSerializer(serializers.ModelSerializer):
     prices = serializers.SerializerMethodField(read_only=True)
     image = serializers.SerializerMethodField(read_only=True)
+    image_set = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'avg_rating', 'reviews_count', 'prices', "image")
+        fields = ('id', 'name', 'avg_rating', 'reviews_count', 'prices', "image", "image_set")
 
     def get_prices(self, instance):
         if isinstance(instance, dict):
@@ -52,19 +58,30 @@ class ShortProductSerializer(serializers.ModelSerializer):
 
         return {"price": price, "sale_price": sale_price}
 
-    def get_image(self, instance):
-        request = self.context['request']
+    @staticmethod
+    def first_image(instance) -> dict:
         if isinstance(instance, dict):
-            image_obj = check_to_json(instance, "image_info") or {}
-        else:
-            image = instance.images.only("url", "image").first()
-            image_obj = {"image": image.image, "url": image.url} if image else {}
+            return check_to_json(instance, "image_info") or {}
+
+        # image and image_set share the query
+        if not hasattr(instance, "_first_image"):
+            image = instance.images.only("url", "image", "derivatives").first()
+            instance._first_image = {
+                "image": image.image, "url": image.url, "derivatives": image.derivatives
+            } if image else {}
+        return instance._first_image
 
+    def get_image(self, instance):
+        request = self.context['request']
+        image_obj = self.first_image(instance)
         filepath = image_obj.get("image")
         if filepath:
             return request.build_absolute_uri(default_storage.url(filepath))
         return image_obj.get('url') or None
 
+    def get_image_set(self, instance):
+        return image_set(self.first_image(instance).get("derivatives"), storage_url_builder(self.context['request']))
+
 
 class ProductInventorySerializer(serializers.ModelSerializer):
     price = ConversionField()
@@ -128,15 +145,21 @@ class ProductInventorySerializer(serializers.ModelSerializer):
             data["product"] = {
                 "id": instance.product.id,
                 "name": instance.product.name,
-                "image": image_url
+                "image": image_url,
+                "image_set": image_set(image.derivatives, storage_url_builder(request)) if image else None
             }
         return data
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_set = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = ProductImage
-        fields = ('image', 'url')
+        fields = ('image', 'url', 'image_set')
+
+    def get_image_set(self, instance):
+        return image_set(instance.derivatives, storage_url_builder(self.context['request']))
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -1,8 +1,18 @@
-from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
 
-from .models import Category, ProductReview
-from .tasks import update_product_reviews_data, delete_category_products, category_cache_clear
+from service.dispatchers import dispatch_once
+
+from .models import Category, Product, ProductImage, ProductInventory, ProductReview, clear_products_content_hash
+from .tasks import (
+    update_products_reviews_data, delete_categories_products, category_cache_clear, generate_images_derivatives
+)
+from .utils import apply_review_change
+
+
+def clear_category_cache():
+    dispatch_once(category_cache_clear, "category-cache-clear", settings.DISPATCH_WINDOWS["CATEGORY_CACHE_CLEAR"])
 
 
 @receiver(post_save, sender=Category)
@@ -11,21 +21,80 @@ def on_save_category(sender, instance, created, **kwargs):
         return
 
     if instance.deactivated:
-        delete_category_products.delay(instance.id)
+        dispatch_once(
+            delete_categories_products,
+            "delete-categories-products",
+            settings.DISPATCH_WINDOWS["CATEGORY_PRODUCTS_DELETE"],
+            args=[instance.id]
+        )
 
-    category_cache_clear.delay()
+    clear_category_cache()
 
 
 @receiver(post_delete, sender=Category)
 def on_delete_category(sender, instance, **kwargs):
-    category_cache_clear.delay()
+    clear_category_cache()
+
+
+def schedule_reviews_update(product_ids):
+    dispatch_once(
+        update_products_reviews_data,
+        "products-reviews-data",
+        settings.DISPATCH_WINDOWS["REVIEWS_DATA"],
+        args=product_ids
+    )
 
 
 @receiver(post_save, sender=ProductReview)
-def on_save_product_review(sender, instance, **kwargs):
-    update_product_reviews_data.delay(instance.product.id)
+def on_save_product_review(sender, instance, created, **kwargs):
+    old_state, new_state = None if created else instance._aggregate_state, instance.aggregate_state
+    if created or old_state:
+        apply_review_change(old_state, new_state)
+
+    instance.remember_aggregate_state()
+    # the coalesced exact recomputation catches concurrent changes made from stale instances
+    schedule_reviews_update({state[0] for state in (old_state, new_state) if state})
 
 
 @receiver(post_delete, sender=ProductReview)
 def on_delete_product_review(sender, instance, **kwargs):
-    update_product_reviews_data.delay(instance.product.id)
+    old_state = instance._aggregate_state
+    if old_state:
+        apply_review_change(old_state, None)
+
+    schedule_reviews_update({instance.product_id})
+
+
+def schedule_image_derivatives(image_ids):
+    # bulk_create sends no post_save, the bulk uploads call it directly
+    dispatch_once(
+        generate_images_derivatives,
+        "images-derivatives",
+        settings.DISPATCH_WINDOWS["IMAGE_DERIVATIVES"],
+        args=image_ids
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+def on_save_product_image(sender, instance, **kwargs):
+    if instance.image:
+        schedule_image_derivatives([instance.id])
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductInventory)
+def on_delete_product_row(sender, instance, **kwargs):
+    clear_products_content_hash([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def on_change_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        clear_products_content_hash(pk_set or [] if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=ProductInventory.tags.through)
+def on_change_inventory_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        inventories = ProductInventory.objects.filter(id__in=pk_set or []) if reverse else [instance]
+        clear_products_content_hash({inventory.product_id for inventory in inventories})
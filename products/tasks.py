@@ -1,19 +1,26 @@
 import logging
-import time
 
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Avg, F
+from django.conf import settings
 
 from kaimon.celery import app
+from service.dispatchers import CoalescedTask, dispatch_once
 from service.enums import Site
-from service.utils import get_translated_text, is_japanese_char
 
-from .models import Product, ProductInventory, Tag, Category
-from .utils import delete_products
+from promotions.utils import (
+    ActivePromotionIndex, update_sale_prices, rebuild_promotion_feeds, get_products_promotion_ids
+)
+
+from .archive import archive_inactive
+from .fetching import fetch_rakuten_products
+from .images import generate_derivatives
+from .models import Product
+from .pruning import prune_products
+from .retention import category_quotas, evict_category_chunk
+from .utils import recompute_reviews_aggregates, reconcile_reviews_aggregates, translate_tag_groups
 from .views import CategoryViewSet, ProductsViewSet
 
 
-@app.task()
+@app.task(base=CoalescedTask)
 def category_cache_clear():
     CategoryViewSet.cache_clear()
 
@@ -25,85 +32,118 @@ def products_cache_clear():
 
 @app.task()
 def update_product_reviews_data(product_id):
-    product = Product.objects.prefetch_related('reviews').get(id=product_id)
-    product.reviews_count = product.reviews.filter(moderated=True).count()
-    product.avg_rating = product.reviews.filter(moderated=True).aggregate(Avg('rating'))['rating__avg']
-    product.save()
+    recompute_reviews_aggregates([product_id])
 
 
-@app.task()
-def update_product_sale_price(product_id: int):
-    product = Product.objects.get(id=product_id)
-    inventories = product.inventories.all()
-    update_inventories = []
+@app.task(base=CoalescedTask, batch=True)
+def update_products_reviews_data(product_ids: list[str]):
+    recompute_reviews_aggregates(product_ids)
 
-    promotion = product.promotions.active_promotions().first()
-    if not promotion:
-        inventories.update(sale_price=None)
-        return
 
-    try:
-        discount = promotion.discount
-    except ObjectDoesNotExist:
-        inventories.update(sale_price=None)
-        return
+@app.task()
+def reconcile_product_reviews_data():
+    updated = reconcile_reviews_aggregates()
+    logging.info("Reviews aggregates of %s products fixed" % updated)
 
-    for inventory in inventories:
-        inventory.sale_price = None
-        if inventory.price and inventory.price > 0:
-            inventory.sale_price = discount.calc_price(product.price)
-        update_inventories.append(inventory)
 
-    if update_inventories:
-        ProductInventory.objects.bulk_update(update_inventories, fields={'sale_price'})
+@app.task()
+def update_product_sale_price(product_id: str):
+    # deprecated: kept for the already queued messages, promotions.tasks.recompute_sale_prices replaces it
+    update_sale_prices([product_id])
 
 
 @app.task()
 def translated_tag_group(group_id):
-    group = Tag.objects.get(id=group_id)
-    select_lang, target_lang = 'ja', 'en'
-    group.name = get_translated_text(select_lang, target_lang, group.name)
-    group.save()
-
-    updated_tags = []
+    # deprecated: kept for the callers of the single group task, the groups are translated in coalesced batches
+    dispatch_once(translated_tag_groups, "translate-tag-groups", settings.DISPATCH_WINDOWS["TAG_TRANSLATION"],
+                  args=[group_id])
 
-    for tag in group.children.all():
-        if not is_japanese_char(tag.name):
-            continue
 
-        try:
-            tag.name = get_translated_text(select_lang, target_lang, tag.name)
-        except Exception as e:
-            logging.error(e)
-            time.sleep(10)
-            continue
+@app.task(base=CoalescedTask, batch=True)
+def translated_tag_groups(group_ids: list[str]):
+    # the groups of the new tags (see products.ingestion), the recurring names are in the translation memory
+    renamed = translate_tag_groups(group_ids)
+    logging.info("Tags translated: %s of %s groups" % (renamed, len(group_ids)))
 
-        updated_tags.append(tag)
 
-    if updated_tags:
-        Tag.objects.bulk_update(updated_tags, fields=("name",))
+def products_pruned(report):
+    if report["promotion_ids"]:
+        ActivePromotionIndex.invalidate()
+        rebuild_promotion_feeds(report["promotion_ids"])
+    if report["rows"]["products_product"]:
+        ProductsViewSet.cache_clear()
 
 
 @app.task()
 def delete_category_products(category_id):
-    category = Category.objects.get(id=category_id)
-    delete_products(category.products.only("id"))
+    # deprecated: kept for the already queued messages, the signals dispatch delete_categories_products
+    delete_categories_products([category_id])
+
+
+@app.task(base=CoalescedTask, batch=True)
+def delete_categories_products(category_ids: list[str]):
+    report = prune_products(
+        Product.objects.filter(categories__id__in=category_ids),
+        job="categories:%s" % ",".join(sorted(category_ids))
+    )
+    products_pruned(report)
+
+
+@app.task()
+def products_activity_changed(product_ids: list[str]):
+    # promotion feeds only list the active products
+    rebuild_promotion_feeds(get_products_promotion_ids(product_ids))
+    ProductsViewSet.cache_clear()
 
 
 @app.task()
 def rakuten_clear_products():
-    categories = Category.objects.filter(level=1, deactivated=False, id__startswith=Site.rakuten.value)
-    categories_count = categories.count()
+    # deprecated: kept for the already queued messages, enforce_catalog_retention replaces it
+    enforce_catalog_retention(Site.rakuten.value)
 
-    Product.objects.filter(is_active=False)
 
-    products_limit = 1_000_000 // categories_count
+@app.task()
+def enforce_catalog_retention(site: str = None):
+    """
+    keeps the level 1 categories within their retention quotas, the categories are evicted in parallel
+    """
+    sites = [site] if site else [item.value for item in Site]
+    for site in sites:
+        for category, max_products in category_quotas(site):
+            evict_category_products.delay(category.id, max_products)
 
-    for category in categories:
-        products = category.products.only("id")
-        products_count = products.count()
 
-        if products_count <= products_limit:
-            continue
+@app.task()
+def evict_category_products(category_id: str, max_products: int):
+    report, excess = evict_category_chunk(category_id, max_products)
+    products_pruned(report)
+    # one chunk per run, the next chunk is rescored with the current data
+    if excess > 0 and report["rows"]["products_product"]:
+        evict_category_products.delay(category_id, max_products)
+
+
+@app.task()
+def archive_inactive_products():
+    products_pruned(archive_inactive())
+
 
-        delete_products(products.order_by(F("is_active").asc(), F("modified_at").asc()), products_count=products_count)
+@app.task()
+def fetch_rakuten_genres(genre_ids: list[str] = None, restart: bool = False):
+    # long running: a walk of all the leaf genres takes hours within the app id quota, a rerun resumes it
+    report = fetch_rakuten_products(genre_ids, restart=restart)
+    if report["new"] or report["changed"]:
+        ProductsViewSet.cache_clear()
+
+
+@app.task(base=CoalescedTask, batch=True)
+def generate_images_derivatives(image_ids: list[int]):
+    generate_derivatives(image_ids, limit=len(image_ids))
+
+
+@app.task()
+def generate_missing_derivatives():
+    # the images missed by the signals, the crawled ones too with FETCH_REMOTE
+    config = settings.IMAGE_DERIVATIVES
+    for _ in range(config["SWEEP_BATCHES"]):
+        if generate_derivatives()["images"] < config["BATCH_SIZE"]:
+            break
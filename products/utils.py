@@ -1,16 +1,165 @@
-import logging
+from typing import Iterable
 
-from products.models import Product
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
 
+from products.models import Category, Product, Tag
+from service.translation import translate_texts
 
-def delete_products(products_query, products_count: int = None, delete_limit: int = 20_000):
-    products = products_query
-    count = products_count or products.count()
 
-    remaining_count = count
-    while remaining_count > 0:
-        delete_count = min(remaining_count, delete_limit)
-        product_ids = products[:delete_count].values_list("id", flat=True)
-        Product.objects.filter(id__in=product_ids).delete()
-        logging.info("DELETED products %s" % delete_count)
-        remaining_count -= delete_count
+# exact moderated reviews aggregates of the chunk products, only the drifted rows are updated
+REVIEWS_AGGREGATES_SQL = """
+WITH chunk AS (
+    SELECT unnest(%(product_ids)s::varchar[]) AS product_id
+),
+aggregates AS (
+    SELECT chunk.product_id, COUNT(review.id) AS reviews_count, COALESCE(SUM(review.rating), 0) AS rating_sum
+    FROM chunk
+    LEFT JOIN products_productreview AS review ON review.product_id = chunk.product_id AND review.moderated
+    GROUP BY chunk.product_id
+)
+UPDATE products_product AS product
+SET reviews_count = aggregates.reviews_count,
+    reviews_rating_sum = aggregates.rating_sum,
+    avg_rating = CASE WHEN aggregates.reviews_count > 0 THEN aggregates.rating_sum / aggregates.reviews_count ELSE 0 END
+FROM aggregates
+WHERE product.id = aggregates.product_id AND (
+    product.reviews_count <> aggregates.reviews_count
+    OR product.reviews_rating_sum <> aggregates.rating_sum
+    OR product.avg_rating <> CASE
+        WHEN aggregates.reviews_count > 0 THEN aggregates.rating_sum / aggregates.reviews_count ELSE 0
+    END
+)
+"""
+
+REVIEWED_PRODUCTS_CHUNK_SQL = """
+SELECT product_id FROM (
+    SELECT product_id FROM products_productreview
+    UNION
+    SELECT id FROM products_product WHERE reviews_count > 0
+) AS reviewed
+WHERE product_id > %s
+ORDER BY product_id
+LIMIT %s
+"""
+
+
+def apply_reviews_delta(product_id: str, count_delta: int, rating_delta: float) -> None:
+    """
+    moves the product aggregates by the difference in a single UPDATE, nothing is read beforehand
+    """
+    if not count_delta and not rating_delta:
+        return
+
+    reviews_count = F('reviews_count') + count_delta
+    rating_sum = F('reviews_rating_sum') + rating_delta
+    has_reviews = GreaterThan(reviews_count, 0)
+    Product.objects.filter(id=product_id).update(
+        reviews_count=Greatest(reviews_count, 0),
+        reviews_rating_sum=Case(When(has_reviews, then=rating_sum), default=Value(0.0), output_field=FloatField()),
+        avg_rating=Case(
+            When(has_reviews, then=rating_sum / reviews_count),
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+    )
+
+
+def apply_review_change(old_state: tuple | None, new_state: tuple | None) -> None:
+    """
+    states are ProductReview.aggregate_state: (product id, counted, rating), None when the review doesn't exist
+    """
+    deltas = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state:
+            product_id, count, rating = state
+            count_delta, rating_delta = deltas.get(product_id, (0, 0))
+            deltas[product_id] = count_delta + sign * count, rating_delta + sign * rating
+
+    for product_id, (count_delta, rating_delta) in deltas.items():
+        apply_reviews_delta(product_id, count_delta, rating_delta)
+
+
+def recompute_reviews_aggregates(product_ids: Iterable[str], chunk_size: int = None) -> int:
+    """
+    exact recomputation from the reviews table, returns the number of drifted products
+    """
+    chunk_size = chunk_size or settings.PRODUCT_REVIEWS_AGGREGATES["CHUNK_SIZE"]
+    product_ids = sorted(set(product_ids))
+    updated = 0
+    for start in range(0, len(product_ids), chunk_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(REVIEWS_AGGREGATES_SQL, {"product_ids": product_ids[start:start + chunk_size]})
+            updated += cursor.rowcount
+    return updated
+
+
+def reconcile_reviews_aggregates(chunk_size: int = None) -> int:
+    chunk_size = chunk_size or settings.PRODUCT_REVIEWS_AGGREGATES["CHUNK_SIZE"]
+    last_product_id = ""
+    updated = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(REVIEWED_PRODUCTS_CHUNK_SQL, [last_product_id, chunk_size])
+            product_ids = [row[0] for row in cursor.fetchall()]
+
+        if not product_ids:
+            break
+
+        updated += recompute_reviews_aggregates(product_ids, chunk_size)
+        last_product_id = product_ids[-1]
+    return updated
+
+
+def set_reviews_moderated(reviews_query, moderated: bool) -> int:
+    """
+    bulk moderation: one UPDATE of the reviews and one aggregates recomputation of their products
+    """
+    reviews = reviews_query.exclude(moderated=moderated)
+    with transaction.atomic():
+        product_ids = set(reviews.values_list('product_id', flat=True))
+        updated = reviews.update(moderated=moderated)
+        recompute_reviews_aggregates(product_ids)
+    return updated
+
+
+def set_products_active(products_query, is_active: bool) -> list[str]:
+    """
+    bulk activation in one UPDATE, returns the ids of the changed products
+    """
+    product_ids = list(set(products_query.exclude(is_active=is_active).values_list('id', flat=True)))
+    if product_ids:
+        # the crawled activity is written again by the next crawl, unchanged or not
+        Product.objects.filter(id__in=product_ids).update(is_active=is_active, modified_at=timezone.now(),
+                                                          content_hash='')
+    return product_ids
+
+
+def set_categories_deactivated(categories_query, deactivated: bool) -> list[str]:
+    category_ids = list(set(categories_query.exclude(deactivated=deactivated).values_list('id', flat=True)))
+    if category_ids:
+        Category.objects.filter(id__in=category_ids).update(deactivated=deactivated)
+    return category_ids
+
+
+def translate_tag_groups(group_ids: Iterable[str]) -> int:
+    """
+    translates the groups with their tags, every distinct name once, returns the count of the renamed tags
+    """
+    group_ids = list(group_ids)
+    tags = list(Tag.objects.filter(Q(id__in=group_ids) | Q(group_id__in=group_ids)).only('id', 'name'))
+    translations = translate_texts(tag.name for tag in tags)
+
+    name_length = Tag._meta.get_field('name').max_length
+    renamed = []
+    for tag in tags:
+        name = translations.get(tag.name, tag.name)[:name_length]
+        if name != tag.name:
+            tag.name = name
+            renamed.append(tag)
+    Tag.objects.bulk_update(renamed, fields=("name",), batch_size=1000)
+    return len(renamed)
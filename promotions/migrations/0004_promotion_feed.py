@@ -0,0 +1,45 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_remove_product_tags'),
+        ('promotions', '0003_banner_link_banner_type_alter_banner_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotion',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromotionFeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('avg_rating', models.FloatField(default=0)),
+                ('reviews_count', models.PositiveIntegerField(default=0)),
+                ('image', models.CharField(blank=True, max_length=700, null=True)),
+                ('image_url', models.URLField(blank=True, max_length=700, null=True)),
+                ('discount', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('prices', models.JSONField(default=dict)),
+                ('sort_key', models.DateTimeField()),
+                ('is_primary', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promotion_feed_items', to='products.product')),
+                ('promotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='promotions.promotion')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['promotion', '-sort_key', '-id'], name='promotion_feed_sort_idx'), models.Index(condition=models.Q(('discount__isnull', False), ('is_primary', True)), fields=['-sort_key', '-id'], name='discount_feed_sort_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='promotionfeeditem',
+            constraint=models.UniqueConstraint(fields=('promotion', 'product'), name='promotion_feed_item_unique'),
+        ),
+    ]
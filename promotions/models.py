@@ -3,7 +3,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 from products.models import Product
-from promotions.querysets import PromotionQueryset
+from promotions.querysets import PromotionQueryset, PromotionFeedQueryset
 from service.enums import Site
 
 
@@ -39,6 +39,8 @@ class Promotion(models.Model):
     )
     deactivated = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # active products in the feed, maintained by the feed rebuild
+    products_count = models.PositiveIntegerField(default=0)
 
 
 class Discount(models.Model):
@@ -56,3 +58,38 @@ class Discount(models.Model):
 
     def __str__(self):
         return str(self.percentage)
+
+
+class PromotionFeedItem(models.Model):
+    """
+    denormalized listing row of an active product in an active promotion, prices are precomputed per currency
+    """
+    objects = PromotionFeedQueryset.as_manager()
+
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='feed_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='promotion_feed_items')
+    site = models.CharField(max_length=20)
+    name = models.CharField(max_length=255)
+    avg_rating = models.FloatField(default=0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    image = models.CharField(max_length=700, blank=True, null=True)
+    image_url = models.URLField(max_length=700, blank=True, null=True)
+    discount = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    # {currency: {"price": ..., "sale_price": ...}}
+    prices = models.JSONField(default=dict)
+    sort_key = models.DateTimeField()
+    # the row of the promotion that sets the product sale price, used by the discount products listing
+    is_primary = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=("promotion", "product"), name="promotion_feed_item_unique"),
+        )
+        indexes = (
+            models.Index(fields=("promotion", "-sort_key", "-id"), name="promotion_feed_sort_idx"),
+            models.Index(
+                fields=("-sort_key", "-id"),
+                name="discount_feed_sort_idx",
+                condition=models.Q(is_primary=True, discount__isnull=False)
+            ),
+        )
@@ -11,3 +11,11 @@ class PromotionQueryset(models.QuerySet):
 
     def active_promotions(self):
         return self.filter(deactivated=False)
+
+
+class PromotionFeedQueryset(models.QuerySet):
+    def filter_by_site(self, site: str):
+        return self.filter(site=site)
+
+    def discounted(self):
+        return self.filter(is_primary=True, discount__isnull=False)
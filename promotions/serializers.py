@@ -1,7 +1,8 @@
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
-from .models import Banner, Promotion
+from .models import Banner, Promotion, PromotionFeedItem
 
 
 class BannerSerializer(serializers.ModelSerializer):
@@ -13,11 +14,11 @@ class BannerSerializer(serializers.ModelSerializer):
 class PromotionSerializer(serializers.ModelSerializer):
     banner = BannerSerializer(many=False, read_only=True)
     discount = serializers.SerializerMethodField(read_only=True)
-    products_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Promotion
         fields = ('id', 'banner', 'discount', 'created_at', 'products_count')
+        read_only_fields = ('products_count',)
 
     def get_discount(self, instance):
         try:
@@ -25,5 +26,20 @@ class PromotionSerializer(serializers.ModelSerializer):
         except ObjectDoesNotExist:
             return None
 
-    def get_products_count(self, instance) -> int:
-        return instance.products.filter(is_active=True).count()
+
+class PromotionFeedItemSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source='product_id', read_only=True)
+    prices = serializers.SerializerMethodField(read_only=True)
+    image = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = PromotionFeedItem
+        fields = ('id', 'name', 'avg_rating', 'reviews_count', 'prices', 'image', 'discount')
+
+    def get_prices(self, instance):
+        return instance.prices.get(self.context.get('currency', 'yen')) or {"price": 0.0, "sale_price": 0.0}
+
+    def get_image(self, instance):
+        if instance.image:
+            return self.context['request'].build_absolute_uri(default_storage.url(instance.image))
+        return instance.image_url or None
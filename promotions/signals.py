@@ -1,19 +1,65 @@
-from django.db.models.signals import post_save, pre_delete
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
 
-from promotions.models import Discount
-from products.tasks import update_product_sale_price
+from promotions.models import Discount, Promotion
+from promotions.tasks import recompute_sale_prices_batch, rebuild_all_promotion_feeds
+from promotions.utils import ActivePromotionIndex
+from service.dispatchers import dispatch_once
+from service.models import Conversion
+
+
+def recompute_on_commit(promotion_id: int = None, product_ids: list[str] = None):
+    transaction.on_commit(ActivePromotionIndex.invalidate)
+    changes = [["product", product_id] for product_id in product_ids or ()]
+    if promotion_id is not None:
+        changes.append(["promotion", promotion_id])
+    # a promotion edit in the admin saves the promotion, its discount and products: one recomputation
+    dispatch_once(recompute_sale_prices_batch, "promotions-sale-prices", settings.DISPATCH_WINDOWS["SALE_PRICES"],
+                  args=changes)
 
 
 @receiver(post_save, sender=Discount)
 def update_products_sale_prices(sender, instance, created, **kwargs):
-    product_ids = instance.promotion.products.filter(is_active=True).values_list('id', flat=True)
-    for product_id in product_ids:
-        update_product_sale_price.delay(product_id)
+    recompute_on_commit(promotion_id=instance.promotion_id)
 
 
 @receiver(pre_delete, sender=Discount)
 def update_product_average_rank_on_delete(sender, instance, **kwargs):
-    product_ids = instance.promotion.products.filter(is_active=True).values_list('id', flat=True)
-    for product_id in product_ids:
-        update_product_sale_price.delay(product_id)
+    recompute_on_commit(promotion_id=instance.promotion_id)
+
+
+@receiver(post_save, sender=Promotion)
+def update_sale_prices_on_promotion_save(sender, instance, created, **kwargs):
+    if not created:
+        recompute_on_commit(promotion_id=instance.id)
+
+
+@receiver(pre_delete, sender=Promotion)
+def update_sale_prices_on_promotion_delete(sender, instance, **kwargs):
+    # the promotion products are gone after the deletion, only their ids are passed
+    recompute_on_commit(product_ids=list(instance.products.values_list('id', flat=True)))
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+def update_sale_prices_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # product.promotions changed
+        if action in ("post_add", "post_remove", "post_clear"):
+            recompute_on_commit(product_ids=[instance.id])
+        return
+
+    match action:
+        case "post_add":
+            recompute_on_commit(promotion_id=instance.id)
+        case "post_remove":
+            recompute_on_commit(product_ids=list(pk_set))
+        case "pre_clear":
+            recompute_on_commit(product_ids=list(instance.products.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Conversion)
+def rebuild_promotion_feeds_on_conversion_change(sender, instance, **kwargs):
+    # feed prices are precomputed in every currency
+    transaction.on_commit(rebuild_all_promotion_feeds.delay)
@@ -0,0 +1,46 @@
+from kaimon.celery import app
+from products.views import ProductsViewSet
+from service.dispatchers import CoalescedTask
+
+from .utils import (
+    recompute_promotion_sale_prices, recompute_products_sale_prices, rebuild_promotion_feeds, get_products_promotion_ids
+)
+
+
+def recompute_promotions(promotion_ids: set[int], product_ids: list[str]):
+    """
+    sale prices of the promotions and of the removed products, then the feeds,
+    the product pages cache is cleared once at the end
+    """
+    updated = 0
+    promotion_ids = set(promotion_ids)
+    for promotion_id in promotion_ids.copy():
+        updated += recompute_promotion_sale_prices(promotion_id)
+    if product_ids:
+        updated += recompute_products_sale_prices(product_ids)
+        promotion_ids.update(get_products_promotion_ids(product_ids))
+
+    rebuild_promotion_feeds(promotion_ids)
+    if updated or promotion_ids:
+        ProductsViewSet.cache_clear()
+
+
+@app.task()
+def recompute_sale_prices(promotion_id: int = None, product_ids: list[str] = None):
+    recompute_promotions({promotion_id} if promotion_id is not None else set(), product_ids)
+
+
+@app.task(base=CoalescedTask, batch=True)
+def recompute_sale_prices_batch(changes: list[list]):
+    """
+    changes: coalesced ["promotion", promotion id] and ["product", product id] items of the signals
+    """
+    promotion_ids = {value for kind, value in changes if kind == "promotion"}
+    product_ids = [value for kind, value in changes if kind == "product"]
+    recompute_promotions(promotion_ids, product_ids)
+
+
+@app.task()
+def rebuild_all_promotion_feeds():
+    rebuild_promotion_feeds()
+    ProductsViewSet.cache_clear()
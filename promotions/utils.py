@@ -0,0 +1,297 @@
+import logging
+import time
+from decimal import Decimal
+from threading import Lock
+from typing import Iterable
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+
+from products.models import Product, ProductImage, ProductInventory
+from promotions.models import Promotion, PromotionFeedItem
+from service.models import Currencies
+from service.utils import convert_price, get_currencies_price_per, get_currency_by_id, get_site_from_id, increase_price
+
+
+# The best active discount of every chunk product:
+# the highest percentage wins, the newest promotion wins between equal percentages.
+BEST_DISCOUNT_CTE = """
+WITH chunk AS (
+    SELECT unnest(%(product_ids)s::varchar[]) AS product_id
+),
+best_discount AS (
+    SELECT DISTINCT ON (promotion_products.product_id)
+        promotion_products.product_id,
+        promotion.id AS promotion_id,
+        discount.percentage
+    FROM promotions_promotion_products AS promotion_products
+    JOIN promotions_promotion AS promotion
+        ON promotion.id = promotion_products.promotion_id AND promotion.deactivated = false
+    JOIN promotions_discount AS discount ON discount.promotion_id = promotion.id
+    WHERE promotion_products.product_id = ANY(%(product_ids)s)
+    ORDER BY promotion_products.product_id, discount.percentage DESC, promotion.created_at DESC, promotion.id DESC
+)
+"""
+
+# Products without an active discount get their sale price reset.
+SALE_PRICES_SQL = BEST_DISCOUNT_CTE + """
+UPDATE products_productinventory AS inventory
+SET sale_price = CASE
+    WHEN best_discount.percentage IS NULL OR inventory.site_price <= 0 THEN NULL
+    ELSE ROUND(
+        (inventory.site_price + inventory.site_price * GREATEST(inventory.increase_per, 0)::numeric / 100)
+        * (100 - best_discount.percentage) / 100,
+        2
+    )
+END
+FROM chunk
+LEFT JOIN best_discount ON best_discount.product_id = chunk.product_id
+WHERE inventory.product_id = chunk.product_id
+"""
+
+FEED_PRIMARY_SQL = BEST_DISCOUNT_CTE + """
+UPDATE promotions_promotionfeeditem AS item
+SET is_primary = COALESCE(item.promotion_id = best_discount.promotion_id, false)
+FROM chunk
+LEFT JOIN best_discount ON best_discount.product_id = chunk.product_id
+WHERE item.product_id = chunk.product_id
+"""
+
+PROMOTION_PRODUCTS_CHUNK_SQL = """
+SELECT product_id FROM promotions_promotion_products
+WHERE promotion_id = %s AND product_id > %s
+ORDER BY product_id
+LIMIT %s
+"""
+
+
+def update_sale_prices(product_ids: list[str]) -> int:
+    if not product_ids:
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SALE_PRICES_SQL, {"product_ids": list(product_ids)})
+        return cursor.rowcount
+
+
+def chunked(product_ids: Iterable[str], chunk_size: int) -> Iterable[list[str]]:
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), chunk_size):
+        yield product_ids[start:start + chunk_size]
+
+
+def recompute_promotion_sale_prices(promotion_id: int, chunk_size: int = None) -> int:
+    """
+    walks the promotion products by id ranges, every chunk is a single UPDATE in its own transaction
+    """
+    chunk_size = chunk_size or settings.PROMOTION_SALE_PRICES_CHUNK_SIZE
+    last_product_id = ""
+    updated = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(PROMOTION_PRODUCTS_CHUNK_SQL, [promotion_id, last_product_id, chunk_size])
+            product_ids = [row[0] for row in cursor.fetchall()]
+
+        if not product_ids:
+            break
+
+        updated += update_sale_prices(product_ids)
+        last_product_id = product_ids[-1]
+
+    logging.info("Promotion %s: %s inventories sale prices updated" % (promotion_id, updated))
+    return updated
+
+
+def recompute_products_sale_prices(product_ids: Iterable[str], chunk_size: int = None) -> int:
+    chunk_size = chunk_size or settings.PROMOTION_SALE_PRICES_CHUNK_SIZE
+    return sum(update_sale_prices(chunk) for chunk in chunked(product_ids, chunk_size))
+
+
+def feed_prices(product_id: str, inventory: ProductInventory | None) -> dict[str, dict[str, float | None]]:
+    """
+    the prices of ShortProductSerializer in every currency
+    """
+    if not inventory:
+        return {currency.value: {"price": 0.0, "sale_price": 0.0} for currency in Currencies}
+
+    site_price, sale_price = inventory.site_price, inventory.sale_price
+    price = site_price if inventory.increase_per <= 0 else increase_price(site_price, inventory.increase_per)
+    product_currency = get_currency_by_id(product_id)
+
+    prices = {}
+    for currency in Currencies:
+        currency_price, currency_sale_price = price, sale_price
+        if currency != product_currency:
+            price_per = get_currencies_price_per(currency_from=product_currency, currency_to=currency)
+            currency_price = convert_price(price, price_per) if price_per else 0.0
+            currency_sale_price = convert_price(sale_price, price_per) if sale_price and price_per else None
+
+        prices[currency.value] = {
+            "price": round(float(currency_price), 2),
+            "sale_price": round(float(currency_sale_price), 2) if currency_sale_price is not None else None
+        }
+    return prices
+
+
+def build_feed_items(promotion: Promotion, discount, products: list[Product]) -> list[PromotionFeedItem]:
+    product_ids = [product.id for product in products]
+    inventories = {
+        inventory.product_id: inventory
+        for inventory in ProductInventory.objects.filter(product_id__in=product_ids)
+                                                 .order_by('product_id', 'id')
+                                                 .distinct('product_id')
+                                                 .only('product_id', 'site_price', 'sale_price', 'increase_per')
+    }
+    images = {
+        image.product_id: image
+        for image in ProductImage.objects.filter(product_id__in=product_ids)
+                                         .order_by('product_id', 'id')
+                                         .distinct('product_id')
+    }
+    feed_items = []
+    for product in products:
+        image = images.get(product.id)
+        feed_items.append(
+            PromotionFeedItem(
+                promotion=promotion,
+                product_id=product.id,
+                site=get_site_from_id(product.id),
+                name=product.name,
+                avg_rating=product.avg_rating or 0,
+                reviews_count=product.reviews_count,
+                image=image.image.name if image and image.image else None,
+                image_url=image.url if image else None,
+                discount=discount,
+                prices=feed_prices(product.id, inventories.get(product.id)),
+                sort_key=product.created_at
+            )
+        )
+    return feed_items
+
+
+def update_feed_primary_items(product_ids: Iterable[str], chunk_size: int = None) -> None:
+    chunk_size = chunk_size or settings.PROMOTION_SALE_PRICES_CHUNK_SIZE
+    for chunk in chunked(product_ids, chunk_size):
+        with connection.cursor() as cursor:
+            cursor.execute(FEED_PRIMARY_SQL, {"product_ids": chunk})
+
+
+def rebuild_promotion_feed(promotion_id: int, chunk_size: int = None) -> int:
+    """
+    replaces the feed rows of the promotion and its products counter
+    """
+    chunk_size = chunk_size or settings.PROMOTION_SALE_PRICES_CHUNK_SIZE
+    promotion = Promotion.objects.filter(id=promotion_id).first()
+    if not promotion:
+        return 0
+
+    try:
+        discount = promotion.discount.percentage
+    except ObjectDoesNotExist:
+        discount = None
+
+    product_ids = set(PromotionFeedItem.objects.filter(promotion_id=promotion_id).values_list('product_id', flat=True))
+    products_count = 0
+    with transaction.atomic():
+        PromotionFeedItem.objects.filter(promotion_id=promotion_id).delete()
+        if not promotion.deactivated:
+            products = promotion.products.filter(is_active=True).order_by('id')
+            last_product_id = ""
+            while chunk := list(products.filter(id__gt=last_product_id)[:chunk_size]):
+                PromotionFeedItem.objects.bulk_create(build_feed_items(promotion, discount, chunk))
+                product_ids.update(product.id for product in chunk)
+                products_count += len(chunk)
+                last_product_id = chunk[-1].id
+
+        Promotion.objects.filter(id=promotion_id).update(products_count=products_count)
+        update_feed_primary_items(product_ids, chunk_size)
+    return products_count
+
+
+def rebuild_promotion_feeds(promotion_ids: Iterable[int] = None) -> None:
+    # conversions could be changed by another process
+    get_currencies_price_per.cache_clear()
+    if promotion_ids is None:
+        promotion_ids = Promotion.objects.values_list('id', flat=True)
+
+    for promotion_id in list(promotion_ids):
+        count = rebuild_promotion_feed(promotion_id)
+        logging.info("Promotion %s feed: %s products" % (promotion_id, count))
+
+
+def get_products_promotion_ids(product_ids: list[str]) -> set[int]:
+    return set(
+        Promotion.products.through.objects.filter(product_id__in=product_ids).values_list('promotion_id', flat=True)
+    ) | set(
+        PromotionFeedItem.objects.filter(product_id__in=product_ids).values_list('promotion_id', flat=True)
+    )
+
+
+class ActivePromotionIndex:
+    """
+    product id -> (promotion id, discount percentage) of the best active discount (same precedence as the
+    sale prices), loaded once per process and reloaded when the shared version key changes
+    """
+    VERSION_KEY = "active_promotion_index_version"
+
+    def __init__(self):
+        self._discounts: dict[str, tuple[int, Decimal]] = {}
+        self._version = None
+        self._checked_at = 0
+        self._lock = Lock()
+
+    @classmethod
+    def invalidate(cls) -> None:
+        caches["default"].set(cls.VERSION_KEY, uuid4().hex, timeout=None)
+
+    def _current_version(self) -> str:
+        cache = caches["default"]
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, uuid4().hex, timeout=None)
+            version = cache.get(self.VERSION_KEY)
+        return version
+
+    def _load(self) -> dict[str, tuple[int, Decimal]]:
+        promotion_products = Promotion.products.through.objects.filter(
+            promotion__deactivated=False,
+            promotion__discount__isnull=False
+        )
+        rows = (
+            promotion_products.order_by('product_id', '-promotion__discount__percentage', '-promotion__created_at',
+                                        '-promotion_id')
+                              .distinct('product_id')
+                              .values_list('product_id', 'promotion_id', 'promotion__discount__percentage')
+        )
+        return {product_id: (promotion_id, percentage) for product_id, promotion_id, percentage in rows}
+
+    def _refresh(self) -> None:
+        # the version is checked at most once per PROMOTION_INDEX_CHECK_SECONDS
+        if time.monotonic() - self._checked_at < settings.PROMOTION_INDEX_CHECK_SECONDS:
+            return
+
+        with self._lock:
+            version = self._current_version()
+            if version != self._version:
+                self._discounts = self._load()
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, product_id: str) -> tuple[int, Decimal] | None:
+        self._refresh()
+        return self._discounts.get(product_id)
+
+    def get_many(self, product_ids: Iterable[str]) -> dict[str, tuple[int, Decimal]]:
+        self._refresh()
+        discounts = self._discounts
+        return {product_id: discounts[product_id] for product_id in product_ids if product_id in discounts}
+
+    def discount(self, product_id: str) -> Decimal | None:
+        promotion = self.get(product_id)
+        return promotion[1] if promotion else None
+
+
+active_promotion_index = ActivePromotionIndex()
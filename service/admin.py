@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
-from .models import Conversion
+from .models import Conversion, TranslationMemory
 
 
 @admin.register(Conversion)
@@ -11,3 +11,13 @@ class ConversionAdmin(admin.ModelAdmin):
     search_fields = ('id',)
     search_help_text = _('Search by ID')
     list_filter = ('currency_from', 'created_at')
+
+
+@admin.register(TranslationMemory)
+class TranslationMemoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source_text', 'translated_text', 'source_lang', 'target_lang', 'created_at')
+    list_display_links = ('id', 'source_text')
+    search_fields = ('source_text', 'translated_text')
+    search_help_text = _('Search by text or translation')
+    list_filter = ('source_lang', 'target_lang')
+    readonly_fields = ('source_hash',)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'service'
+
+    def ready(self):
+        import service.signals
+        from service.clients.base import configure_transport
+        configure_transport(**settings.HTTP_CLIENTS)
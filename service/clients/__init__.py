@@ -1,3 +1,5 @@
+from .base import shared_client
 from .fedex import FedexAPIClient
-from .paybox import PayboxAPI
-from .rakuten import RakutenClient
+from .paybox import PayboxAPI, AsyncPayboxAPI
+from .rakuten import RakutenClient, AsyncRakutenClient, RakutenBulkFetcher
+from .translate import GoogleTranslateClient, AsyncGoogleTranslateClient
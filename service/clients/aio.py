@@ -0,0 +1,139 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Iterable
+from urllib.parse import urljoin, urlsplit
+from weakref import WeakKeyDictionary
+
+import httpx
+from requests import Request
+
+
+# connection pools, semaphores and locks can't outlive the event loop they were created in
+_loop_states: WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, Any]] = WeakKeyDictionary()
+
+
+def loop_local(key: tuple, factory: Callable[[], Any]) -> Any:
+    state = _loop_states.setdefault(asyncio.get_running_loop(), {})
+    if key not in state:
+        state[key] = factory()
+    return state[key]
+
+
+async def close_pools() -> None:
+    state = _loop_states.pop(asyncio.get_running_loop(), {})
+    for value in state.values():
+        if isinstance(value, httpx.AsyncClient):
+            await value.aclose()
+
+
+def run(coroutine: Coroutine) -> Any:
+    """
+    runs a coroutine from sync code (celery tasks, commands) and closes the pools it opened
+    """
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_pools()
+
+    return asyncio.run(main())
+
+
+class TokenBucket:
+    """
+    Rate limiter of the coroutines sharing a quota: rate tokens per second, up to capacity in a burst.
+    pause() holds every caller back, ex: the provider answered 429.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # the waiters are served in turn, a late coroutine can't take the token of an earlier one
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class AsyncClientMixin:
+    """
+    Turns a BaseAPIClient subclass into an asyncio client: payload building, signing and parsing
+    are inherited as is, only the transport differs, so every API method returns a coroutine.
+    Requests go through a connection pool and a semaphore shared by the provider clients of the loop.
+    """
+
+    def _pool_key(self) -> tuple[str, str]:
+        url = urlsplit(self.base_url)
+        return self.__class__.__name__, "%s://%s" % (url.scheme, url.netloc)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        config = self.transport_config()
+        return loop_local(
+            ("client", *self._pool_key()),
+            lambda: httpx.AsyncClient(
+                timeout=httpx.Timeout(config["READ_TIMEOUT"], connect=config["CONNECT_TIMEOUT"]),
+                limits=httpx.Limits(
+                    max_connections=config["POOL_MAXSIZE"],
+                    max_keepalive_connections=config["POOL_MAXSIZE"]
+                ),
+                # retries failed connections only, statuses are retried in _send_async
+                transport=httpx.AsyncHTTPTransport(retries=config["RETRIES"] or 0)
+            )
+        )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        config = self.transport_config()
+        return loop_local(("semaphore", self.__class__.__name__), lambda: asyncio.Semaphore(config["CONCURRENCY"]))
+
+    async def _send_async(self, request: Request) -> httpx.Response:
+        prepared = request.prepare()
+        config = self.transport_config()
+        retries = (config["RETRIES"] or 0) if prepared.method in self.IDEMPOTENT_METHODS else 0
+        client = self._get_async_client()
+
+        async with self._get_semaphore():
+            for attempt in range(retries + 1):
+                response = await client.request(
+                    prepared.method,
+                    prepared.url,
+                    headers=dict(prepared.headers),
+                    content=prepared.body
+                )
+                if response.status_code not in self.RETRIES_STATUSES or attempt == retries:
+                    return response
+                await asyncio.sleep(config["BACKOFF_FACTOR"] * 2 ** attempt)
+
+    async def _request(self, method: str, path: str, **kwargs):
+        request = Request(method, urljoin(self.base_url, path), **kwargs)
+        self.process_request(request)
+        response = await self._send_async(request)
+        return self.process_response(response)
+
+    @staticmethod
+    async def gather(calls: Iterable[Awaitable], return_exceptions: bool = True) -> list[Any]:
+        return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+    async def map(self, method: Callable[..., Awaitable], items: Iterable[dict[str, Any]], **kwargs) -> list[Any]:
+        """
+        calls the API method once per kwargs item, results (or exceptions) are in the items order
+        """
+        return await self.gather((method(**item) for item in items), **kwargs)
@@ -1,14 +1,78 @@
 import logging
+import os
 from json import JSONDecodeError
+from threading import RLock
 from typing import Any
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 
 from requests import Session, Request, Response, HTTPError
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# transport defaults, overridden from settings.HTTP_CLIENTS on startup (see service.apps)
+TRANSPORT_CONFIG = {
+    "POOL_CONNECTIONS": 10,
+    "POOL_MAXSIZE": 10,
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 30,
+    "RETRIES": 2,
+    "BACKOFF_FACTOR": 0.3,
+    # simultaneous requests per provider of the asyncio clients
+    "CONCURRENCY": 10,
+    "CLIENTS": {}
+}
+
+_sessions: dict[tuple[str, str], Session] = {}
+_clients: dict[tuple, "BaseAPIClient"] = {}
+_registry_lock = RLock()
+
+
+def configure_transport(**options) -> None:
+    TRANSPORT_CONFIG.update(options)
+    reset_transport()
+
+
+def reset_transport() -> None:
+    with _registry_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _clients.clear()
+
+    for session in sessions:
+        session.close()
+
+
+def _forget_transport() -> None:
+    # sockets are not shared with the forked children, every worker process opens its own pools
+    _sessions.clear()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_transport)
+
+
+def shared_client(client_class: type["BaseAPIClient"], **kwargs) -> "BaseAPIClient":
+    """
+    process-wide clients registry, one client per class and init kwargs
+    """
+    key = (client_class, tuple(sorted(kwargs.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = client_class(**kwargs)
+    return client
 
 
 class BaseAPIClient:
     RETRIES: int = None
+    RETRIES_STATUSES: list[int] = [502, 503, 504]
+    IDEMPOTENT_METHODS = frozenset({"HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE"})
+    CONNECT_TIMEOUT: float = None
+    READ_TIMEOUT: float = None
     LOG_FORMAT: str = "'%(asctime)s %(name)s %(levelname)s: %(message)s'"
     BASE_URL: str = None
     ERROR_STATUSES = []
@@ -17,25 +81,76 @@ class BaseAPIClient:
         if not base_url:
             assert self.BASE_URL
         self.base_url = base_url or self.BASE_URL
-        self.session = Session()
         self.logger = logging.getLogger(self.__class__.__name__)
-        self._setup_session()
+        self.session = self._get_session()
         self._setup_logger()
 
+    @classmethod
+    def transport_config(cls) -> dict[str, Any]:
+        config = {key: value for key, value in TRANSPORT_CONFIG.items() if key != "CLIENTS"}
+        # the async variants share the options of the clients they extend
+        for klass in reversed(cls.__mro__):
+            config.update(TRANSPORT_CONFIG["CLIENTS"].get(klass.__name__, {}))
+        for key in ("RETRIES", "CONNECT_TIMEOUT", "READ_TIMEOUT"):
+            if getattr(cls, key) is not None:
+                config[key] = getattr(cls, key)
+        return config
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        config = self.transport_config()
+        return config["CONNECT_TIMEOUT"], config["READ_TIMEOUT"]
+
     def _setup_logger(self):
+        if self.logger.handlers:
+            return
+
         formatter = logging.Formatter(self.LOG_FORMAT)
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
         self.logger.addHandler(console_handler)
 
-    def _setup_session(self):
-        if isinstance(self.RETRIES, int) and self.RETRIES > 1:
-            self.session.mount('http://', HTTPAdapter(max_retries=self.RETRIES))
+    def _get_session(self) -> Session:
+        # the session and its connection pool are shared by all clients of the same class and host
+        url = urlsplit(self.base_url)
+        key = (self.__class__.__name__, "%s://%s" % (url.scheme, url.netloc))
+        session = _sessions.get(key)
+        if session is None:
+            with _registry_lock:
+                session = _sessions.get(key)
+                if session is None:
+                    session = Session()
+                    self._setup_session(session)
+                    _sessions[key] = session
+        return session
+
+    def _setup_session(self, session: Session):
+        config = self.transport_config()
+        retries = config["RETRIES"] or 0
+        adapter = HTTPAdapter(
+            pool_connections=config["POOL_CONNECTIONS"],
+            pool_maxsize=config["POOL_MAXSIZE"],
+            max_retries=Retry(
+                total=retries,
+                connect=retries,
+                read=retries,
+                status=retries,
+                backoff_factor=config["BACKOFF_FACTOR"],
+                status_forcelist=self.RETRIES_STATUSES,
+                allowed_methods=self.IDEMPOTENT_METHODS,
+                raise_on_status=False
+            )
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def _send(self, request: Request) -> Response:
+        return self.session.send(request.prepare(), timeout=self.timeout)
 
     def _request(self, method: str, path: str, **kwargs):
         request = Request(method, urljoin(self.base_url, path), **kwargs)
         self.process_request(request)
-        response = self.session.send(request.prepare())
+        response = self._send(request)
         return self.process_response(response)
 
     def process_request(self, request: Request) -> None:
@@ -70,4 +185,3 @@ class BaseAPIClient:
 
     def delete(self, path: str) -> Any:
         return self._request('DELETE', path)
-    
\ No newline at end of file
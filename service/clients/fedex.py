@@ -1,6 +1,7 @@
 from dataclasses import dataclass, asdict
 from datetime import timedelta, datetime
 from enum import Enum
+from threading import Lock
 from typing import Literal, Iterable, Any
 from urllib.parse import urljoin
 
@@ -150,33 +151,93 @@ class FedexCommodity:
         return payload
 
 
+class FedexTokenStore:
+    """
+    in-process token store, the default one of FedexAPIClient
+    """
+
+    def __init__(self):
+        self._token = None
+        self._token_exp = None
+        self._lock = Lock()
+
+    def get(self) -> str | None:
+        if self._token_exp and datetime.utcnow() < self._token_exp:
+            return self._token
+
+    def set(self, token: str, timeout: int) -> None:
+        self._token = token
+        self._token_exp = datetime.utcnow() + timedelta(seconds=timeout)
+
+    def lock(self):
+        return self._lock
+
+
+class FedexCacheTokenStore(FedexTokenStore):
+    """
+    token store shared between processes, cache is a redis backed django cache (get, set and lock are used)
+    """
+    LOCK_SECONDS = 30
+
+    def __init__(self, cache, key: str):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, FedexCacheTokenStore) and self.key == other.key
+
+    def __hash__(self):
+        return hash((self.__class__, self.key))
+
+    def get(self) -> str | None:
+        return self.cache.get(self.key)
+
+    def set(self, token: str, timeout: int) -> None:
+        self.cache.set(self.key, token, timeout=timeout)
+
+    def lock(self):
+        return self.cache.lock(self.key + ":lock", timeout=self.LOCK_SECONDS, blocking_timeout=self.LOCK_SECONDS)
+
+
 class FedexAPIClient(BaseAPIClient):
     BASE_URL = 'https://apis.fedex.com'
     TEST_URL = 'https://apis-sandbox.fedex.com'
     ERROR_STATUSES = [400, 401, 500, 503]
     SECONDS_TO_SUBSTRACT = 5
 
-    def __init__(self, client_id: str, client_secret: str, account_number: str = None, use_test: bool = False):
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        account_number: str = None,
+        use_test: bool = False,
+        token_store: FedexTokenStore = None
+    ):
         super().__init__(self.BASE_URL if use_test is False else self.TEST_URL)
         self.account_number = account_number
         self._client_id = client_id
         self._client_secret = client_secret
-        self._token = None
-        self._token_exp = None
+        self.token_store = token_store or FedexTokenStore()
 
     def token_expired(self) -> bool:
-        return not self._token_exp or datetime.utcnow() < self._token_exp
+        return self.token_store.get() is None
 
     def process_request(self, request) -> None:
-        if not self._token or self.token_expired():
-            self.auth()
-
-        request.headers['Authorization'] = self._token
+        token = self.token_store.get()
+        if not token:
+            with self.token_store.lock():
+                # another worker could refresh it while this one was waiting for the lock
+                token = self.token_store.get() or self.auth()
+        self._set_headers(request, token)
+
+    def _set_headers(self, request, token: str) -> None:
+        request.headers['Authorization'] = token
         request.headers['x-locale'] = 'en_US'
         request.headers['Content-Type'] = 'application/json'
 
-    def auth(self) -> None:
-        request = Request(
+    def _auth_request(self) -> Request:
+        return Request(
             method="POST",
             url=urljoin(self.base_url, '/oauth/token'),
             data={
@@ -186,10 +247,16 @@ class FedexAPIClient(BaseAPIClient):
             },
             headers={"Content-Type": "application/x-www-form-urlencoded"}
         )
-        response = self.session.send(request.prepare())
-        response_data = self.process_response(response)
-        self._token = "%s %s" % (response_data['token_type'].title(), response_data['access_token'])
-        self._token_exp = datetime.utcnow() + timedelta(seconds=response_data['expires_in'] - self.SECONDS_TO_SUBSTRACT)
+
+    def _set_token(self, response_data: dict[str, Any]) -> str:
+        token = "%s %s" % (response_data['token_type'].title(), response_data['access_token'])
+        # refreshed a few seconds before the real expiration
+        self.token_store.set(token, timeout=response_data['expires_in'] - self.SECONDS_TO_SUBSTRACT)
+        return token
+
+    def auth(self) -> str:
+        response = self._send(self._auth_request())
+        return self._set_token(self.process_response(response))
 
     def international_rate_quotes(
         self,
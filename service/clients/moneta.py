@@ -1,53 +1,91 @@
 import hashlib
 import json
-from functools import cached_property
+from threading import Lock
 from typing import Literal
 
 from ecdsa import SigningKey, SECP256k1
 from ecdsa.util import sigencode_der_canonize, sigdecode_der
 from requests import Request
 
+from service.clients.aio import AsyncClientMixin
 from service.clients.base import BaseAPIClient
 
 
-class MonetaAPI(BaseAPIClient):
-    ERROR_STATUSES = [400, 404, 500]
-
-    def __init__(self, merchant_id: str, private_key: str):
-        super().__init__(base_url="https://moneta.today/api/v1/")
-        self.merchant_id = merchant_id
+class MonetaSigner:
+    def __init__(self, private_key: str):
         self._private_key = private_key
+        self._signing_key = SigningKey.from_string(bytes.fromhex(private_key), curve=SECP256k1)
+        self.verifying_key = self._signing_key.verifying_key
+        self.verifying_key.precompute()
+        self.public_key = self.verifying_key.to_string("compressed").hex()
 
-    @cached_property
-    def _key_pair(self) -> SigningKey:
-        return SigningKey.from_string(bytes.fromhex(self._private_key), curve=SECP256k1)
-
-    @property
-    def _verifying_key(self):
-        return self._key_pair.verifying_key
-
-    def _make_signature(self, data: dict | list):
-        signed_string = json.dumps(data, separators=(',', ':')).encode()
-        signature = self._key_pair.sign_deterministic(
+    def sign(self, signed_string: bytes, verify: bool = False) -> str:
+        signature = self._signing_key.sign_deterministic(
             signed_string,
             sigencode=sigencode_der_canonize,
             hashfunc=hashlib.sha256
         )
-        # wrong verifying
-        assert self._verifying_key.verify(
+        if verify:
+            self.verify(signature, signed_string)
+        return signature.hex()
+
+    def verify(self, signature: bytes, signed_string: bytes) -> None:
+        assert self.verifying_key.verify(
             signature,
             signed_string,
             sigdecode=sigdecode_der,
             hashfunc=hashlib.sha256
         ), "Wrong signature!"
-        return signature.hex()
+
+    def self_check(self) -> None:
+        self.sign(b'{"self_check":true}', verify=True)
+
+    def has_key(self, private_key: str) -> bool:
+        return self._private_key == private_key
+
+
+_signers: dict[str, MonetaSigner] = {}
+_signers_lock = Lock()
+
+
+def get_signer(merchant_id: str, private_key: str) -> MonetaSigner:
+    """
+    process-wide signers cache, parsing and checking the SECP256k1 key is done once per merchant
+    """
+    signer = _signers.get(merchant_id)
+    if signer is None or not signer.has_key(private_key):
+        with _signers_lock:
+            signer = _signers.get(merchant_id)
+            if signer is None or not signer.has_key(private_key):
+                signer = MonetaSigner(private_key)
+                signer.self_check()
+                _signers[merchant_id] = signer
+    return signer
+
+
+class MonetaAPI(BaseAPIClient):
+    ERROR_STATUSES = [400, 404, 500]
+
+    def __init__(self, merchant_id: str, private_key: str, verify_signatures: bool = False):
+        super().__init__(base_url="https://moneta.today/api/v1/")
+        self.merchant_id = merchant_id
+        self.verify_signatures = verify_signatures
+        self._signer = get_signer(merchant_id, private_key)
+
+    def self_check(self) -> None:
+        self._signer.self_check()
 
     def process_request(self, request: Request) -> None:
         request.headers["x-merchant-id"] = self.merchant_id
 
         if request.method == "POST":
-            request.headers["x-public-key"] = self._verifying_key.to_string("compressed").hex()
-            request.headers["x-request-sign"] = self._make_signature(request.json)
+            # the body is serialized once and sent exactly as it was signed
+            signed_string = json.dumps(request.json, separators=(',', ':')).encode()
+            request.json = None
+            request.data = signed_string
+            request.headers["Content-Type"] = "application/json"
+            request.headers["x-public-key"] = self._signer.public_key
+            request.headers["x-request-sign"] = self._signer.sign(signed_string, verify=self.verify_signatures)
 
     def invoice(self, amount: float | int, meta: dict = None, coin: Literal["MONETA", "HEALTH"] = "HEALTH"):
         return self.post(
@@ -66,6 +104,10 @@ class MonetaAPI(BaseAPIClient):
         return self.get("coins/health/price")
 
 
+class AsyncMonetaAPI(AsyncClientMixin, MonetaAPI):
+    pass
+
+
 if __name__ == "__main__":
     from pprint import pprint
 
@@ -4,6 +4,7 @@ from typing import Literal, Any
 import xmltodict
 from requests import Response
 
+from service.clients.aio import AsyncClientMixin
 from service.clients.base import BaseAPIClient
 
 
@@ -71,3 +72,7 @@ class PayboxAPI(BaseAPIClient):
         }
         payload["pg_sig"] = self._make_signature("get_status3.php", payload)
         return self.post("/get_status3.php", json=payload)
+
+
+class AsyncPayboxAPI(AsyncClientMixin, PayboxAPI):
+    pass
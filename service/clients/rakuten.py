@@ -1,8 +1,12 @@
+import asyncio
 import json
+from dataclasses import dataclass
 from enum import Enum
+from typing import Any, Callable, Iterable, Iterator, Mapping
 
-from requests import Request
+from requests import Request, HTTPError
 
+from service.clients.aio import AsyncClientMixin, TokenBucket, close_pools, loop_local
 from service.clients.base import BaseAPIClient
 
 
@@ -43,9 +47,9 @@ class RakutenClient(BaseAPIClient):
         self.partner_id = partner_id
         super().__init__(**kwargs)
 
-    def _setup_session(self):
-        super()._setup_session()
-        self.session.headers.update({'Content-Type': "application/json"})
+    def _setup_session(self, session):
+        super()._setup_session(session)
+        session.headers.update({'Content-Type': "application/json"})
 
     def process_request(self, request: Request) -> None:
         request.params['applicationId'] = self.app_id
@@ -161,6 +165,135 @@ class RakutenClient(BaseAPIClient):
         return self.get(self.ITEM_SEARCH_PATH, params)
 
 
+class AsyncRakutenClient(AsyncClientMixin, RakutenClient):
+    async def genres_search_many(self, genre_ids: list[int]) -> list[dict | Exception]:
+        return await self.map(self.genres_search, [{"genre_id": genre_id} for genre_id in genre_ids])
+
+    async def item_search_pages(self, pages: list[int], **params) -> list[dict | Exception]:
+        return await self.map(self.item_search, [{**params, "page": page} for page in pages])
+
+
+# cursor of a genre with all the pages fetched
+FINISHED = -1
+
+
+@dataclass
+class GenrePage:
+    genre_id: int | str
+    page: int
+    page_count: int
+    items: list[dict[str, Any]]
+
+    @property
+    def cursor(self) -> int:
+        # the next page of the genre
+        return FINISHED if self.page >= self.page_count else self.page + 1
+
+
+class RakutenBulkFetcher:
+    """
+    Streams the items of many genres: the genres are walked concurrently, page by page,
+    all the requests share the token bucket of the app id (the quota is per application id).
+    429 and 503 pause the bucket with an exponential backoff, then the page is retried.
+    The cursors map the genre ids to the next page, the FINISHED genres are skipped:
+    the caller stores page.cursor once the page items are saved, an interrupted walk continues from there.
+    """
+    THROTTLE_STATUSES = (429, 503)
+    # the item search doesn't go further
+    MAX_PAGES = 100
+
+    def __init__(
+        self,
+        client: AsyncRakutenClient,
+        requests_per_second: float = None,
+        concurrency: int = 4,
+        retries: int = 5,
+        backoff: float = 1,
+        on_throttled: Callable[[], Any] = None,
+        **search_params
+    ):
+        self.client = client
+        self.rate = requests_per_second or 1 / client.DELAY
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.on_throttled = on_throttled
+        self.search_params = search_params
+        # genre id: error of the genres given up, their cursors stay where they failed
+        self.failed: dict[int | str, str] = {}
+
+    def _get_bucket(self) -> TokenBucket:
+        return loop_local(("rate", self.client.app_id), lambda: TokenBucket(self.rate))
+
+    async def fetch_page(self, genre_id: int | str, page: int) -> GenrePage:
+        for attempt in range(self.retries + 1):
+            await self._get_bucket().acquire()
+            try:
+                data = await self.client.item_search(genre_id=genre_id, page=page, **self.search_params)
+            except HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status == 404:
+                    # no items in the genre
+                    return GenrePage(genre_id, page, 0, [])
+                if status not in self.THROTTLE_STATUSES or attempt == self.retries:
+                    raise
+                if status == 429 and self.on_throttled:
+                    self.on_throttled()
+                self._get_bucket().pause(self.backoff * 2 ** attempt)
+                continue
+
+            page_count = min(data.get("pageCount") or 0, self.MAX_PAGES)
+            return GenrePage(genre_id, page, page_count, data.get("Items") or [])
+
+    async def _walk(self, genres: asyncio.Queue, pages: asyncio.Queue) -> None:
+        while not genres.empty():
+            genre_id, page = genres.get_nowait()
+            try:
+                while True:
+                    fetched = await self.fetch_page(genre_id, page)
+                    await pages.put(fetched)
+                    if fetched.cursor == FINISHED:
+                        break
+                    page = fetched.cursor
+            except Exception as e:
+                self.client.logger.error("Genre %s is given up at page %s: %s" % (genre_id, page, e))
+                self.failed[genre_id] = str(e)
+
+    async def _produce(self, genres: asyncio.Queue, pages: asyncio.Queue) -> None:
+        try:
+            await asyncio.gather(*(self._walk(genres, pages) for _ in range(self.concurrency)))
+        finally:
+            await pages.put(None)
+
+    def iter_pages(
+        self,
+        genre_ids: Iterable[int | str],
+        cursors: Mapping[int | str, int] = None
+    ) -> Iterator[GenrePage]:
+        """
+        the fetched pages in their order within every genre, the fetching waits while the consumer works
+        """
+        cursors = cursors or {}
+        genres = asyncio.Queue()
+        for genre_id in genre_ids:
+            page = cursors.get(genre_id, 1)
+            if page != FINISHED:
+                genres.put_nowait((genre_id, page))
+
+        loop = asyncio.new_event_loop()
+        pages = asyncio.Queue(maxsize=self.concurrency * 2)
+        producer = loop.create_task(self._produce(genres, pages))
+        try:
+            while (page := loop.run_until_complete(pages.get())) is not None:
+                yield page
+            loop.run_until_complete(producer)
+        finally:
+            producer.cancel()
+            loop.run_until_complete(asyncio.gather(producer, return_exceptions=True))
+            loop.run_until_complete(close_pools())
+            loop.close()
+
+
 if __name__ == '__main__':
     from pprint import pprint
 
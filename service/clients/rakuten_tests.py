@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .rakuten import AsyncRakutenClient, RakutenBulkFetcher, FINISHED
+
+
+class FakeRakuten(BaseHTTPRequestHandler):
+    # genre id: pages count, the genres missing here answer 404 like the real API
+    genres = {"100": 3, "200": 1, "300": 2}
+    # genre id: 429 answers before the first success
+    throttled = {}
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+        genre_id, page = params["genreId"], int(params.get("page", 1))
+        with self.lock:
+            self.requests.append((genre_id, page, time.monotonic()))
+            throttled = self.throttled.get(genre_id, 0)
+            if throttled:
+                self.throttled[genre_id] = throttled - 1
+
+        if throttled:
+            return self.answer(429, {"error": "too_many_requests"})
+        if genre_id not in self.genres:
+            return self.answer(404, {"error": "not_found"})
+        items = [{"itemCode": "shop:%s-%s-%s" % (genre_id, page, index)} for index in range(2)]
+        self.answer(200, {"page": page, "pageCount": self.genres[genre_id], "Items": items})
+
+    def answer(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRakutenBulkFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRakuten)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.client = AsyncRakutenClient(app_id="test", base_url="http://127.0.0.1:%s/" % cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeRakuten.requests = []
+        FakeRakuten.throttled = {}
+
+    def fetcher(self, **kwargs):
+        return RakutenBulkFetcher(self.client, **{"requests_per_second": 200, "backoff": 0.05, **kwargs})
+
+    def test_all_pages(self):
+        pages = list(self.fetcher().iter_pages(["100", "200", "300", "404"]))
+        fetched = {(page.genre_id, page.page) for page in pages}
+        self.assertEqual(fetched, {("100", 1), ("100", 2), ("100", 3), ("200", 1), ("300", 1), ("300", 2), ("404", 1)})
+        self.assertEqual(sum(len(page.items) for page in pages), 12)
+        # the pages of a genre are in order, the last one finishes the genre
+        self.assertEqual([page.page for page in pages if page.genre_id == "100"], [1, 2, 3])
+        self.assertEqual([page.cursor for page in pages if page.genre_id == "100"], [2, 3, FINISHED])
+
+    def test_resume_from_cursors(self):
+        pages = list(self.fetcher().iter_pages(["100", "200", "300"], cursors={"100": 3, "200": FINISHED}))
+        self.assertEqual({(page.genre_id, page.page) for page in pages}, {("100", 3), ("300", 1), ("300", 2)})
+
+    def test_throttling_backoff(self):
+        FakeRakuten.throttled = {"200": 2}
+        throttled = []
+        fetcher = self.fetcher(on_throttled=lambda: throttled.append(1))
+        pages = list(fetcher.iter_pages(["200"]))
+
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(throttled), 2)
+        # 0.05 then 0.1 seconds of backoff
+        times = [request[2] for request in FakeRakuten.requests]
+        self.assertGreaterEqual(times[-1] - times[0], 0.14)
+
+    def test_given_up_genre(self):
+        FakeRakuten.throttled = {"200": 10}
+        fetcher = self.fetcher(retries=1)
+        pages = list(fetcher.iter_pages(["200", "300"]))
+
+        self.assertEqual({page.genre_id for page in pages}, {"300"})
+        self.assertIn("200", fetcher.failed)
+
+    def test_rate_limit(self):
+        started_at = time.monotonic()
+        list(self.fetcher(requests_per_second=20, concurrency=3).iter_pages(["100", "200", "300"]))
+        # 6 requests: the first token is there, 5 are waited for
+        self.assertEqual(len(FakeRakuten.requests), 6)
+        self.assertGreaterEqual(time.monotonic() - started_at, 5 / 20)
+
+    def test_consumer_stops(self):
+        pages = self.fetcher().iter_pages(["100", "300"])
+        next(pages)
+        pages.close()
+        self.assertLess(len(FakeRakuten.requests), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+from typing import Any
+
+from service.clients.aio import AsyncClientMixin
+from service.clients.base import BaseAPIClient
+
+
+class GoogleTranslateClient(BaseAPIClient):
+    BASE_URL = "https://translate.googleapis.com/"
+    TRANSLATE_PATH = "translate_a/single"
+    RETRIES_STATUSES = [429, 500, 502, 503, 504]
+    ERROR_STATUSES = [400, 403, 429, 500, 502, 503, 504]
+    # the joined texts come back line by line
+    SEPARATOR = "\n"
+
+    def translate(self, text: str, source_lang: str, target_lang: str):
+        return self.get(self.TRANSLATE_PATH, dict(client="gtx", dt="t", sl=source_lang, tl=target_lang, q=text))
+
+    @staticmethod
+    def translated_text(data: Any) -> str:
+        # the translation is split in sentences: [[["Hello\n", "こんにちは\n", ...], ["World", "世界", ...]], ...]
+        return "".join(segment[0] for segment in data[0] or [] if segment and segment[0])
+
+
+class AsyncGoogleTranslateClient(AsyncClientMixin, GoogleTranslateClient):
+    async def translate_batch(self, texts: list[str], source_lang: str, target_lang: str) -> list[str]:
+        """
+        one request for the texts joined by lines (they must be single line),
+        the texts are translated one by one when the translated lines don't match them
+        """
+        data = await self.translate(self.SEPARATOR.join(texts), source_lang, target_lang)
+        translations = self.translated_text(data).split(self.SEPARATOR)
+        if len(translations) != len(texts):
+            self.logger.warning("Translated lines mismatch: %s of %s" % (len(translations), len(texts)))
+            results = await self.map(
+                self.translate,
+                [dict(text=text, source_lang=source_lang, target_lang=target_lang) for text in texts],
+                return_exceptions=False
+            )
+            translations = [self.translated_text(data) for data in results]
+        return [translation.strip() for translation in translations]
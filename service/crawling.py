@@ -0,0 +1,276 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, DateTimeField, F, Sum
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+
+from .enums import Spider
+from .models import CrawlJob, CrawlTarget
+
+
+# (site, target kind): the spider and its argument with the comma separated target ids
+CRAWL_SPIDERS = {
+    ("rakuten", CrawlTarget.Kind.category): (Spider.rakuten, "category_ids"),
+    ("rakuten", CrawlTarget.Kind.product): (Spider.rakuten_check_products, "product_ids"),
+}
+
+BACKOFF_KEY = "crawl_backoff:%s"
+
+# the refresh interval goes geometrically from MAX_INTERVAL (no popularity) to MIN_INTERVAL (HOT_POPULARITY and more)
+INTERVAL_SQL = """
+ROUND(%(max_interval)s * POWER(%(min_interval)s::float / %(max_interval)s, LEAST(popularity / %(hot_popularity)s, 1)))
+"""
+
+PRODUCT_TARGETS_SQL = """
+WITH popularity AS (
+    SELECT product.id, split_part(product.id, '_', 1) AS site,
+           %(reviews_weight)s * LN(1 + GREATEST(product.site_reviews_count, 0))
+           + %(orders_weight)s * LN(1 + COALESCE(ordered.orders, 0)) AS popularity
+    FROM products_product AS product
+    LEFT JOIN (
+        SELECT product_code, COUNT(*) AS orders FROM orders_receipt GROUP BY product_code
+    ) AS ordered ON ordered.product_code = product.id
+    WHERE product.is_active AND split_part(product.id, '_', 1) = ANY(%(sites)s)
+)
+INSERT INTO service_crawltarget AS target (kind, target_id, site, popularity, interval, due_at)
+SELECT 'product', id, site, popularity, {interval}, NOW() FROM popularity
+ON CONFLICT (kind, target_id) DO UPDATE SET
+    popularity = EXCLUDED.popularity,
+    interval = EXCLUDED.interval,
+    due_at = COALESCE(target.checked_at + EXCLUDED.interval * INTERVAL '1 second', NOW())
+"""
+
+CATEGORY_TARGETS_SQL = """
+WITH popularity AS (
+    SELECT category.id, split_part(category.id, '_', 1) AS site,
+           %(reviews_weight)s * LN(1 + COALESCE(SUM(GREATEST(product.site_reviews_count, 0)), 0))
+           + %(orders_weight)s * LN(1 + COUNT(receipt.id)) AS popularity
+    FROM products_category AS category
+    LEFT JOIN products_product_categories AS product_category ON product_category.category_id = category.id
+    LEFT JOIN products_product AS product ON product.id = product_category.product_id AND product.is_active
+    LEFT JOIN orders_receipt AS receipt ON receipt.product_code = product.id
+    WHERE NOT category.deactivated AND category.level > 0 AND split_part(category.id, '_', 1) = ANY(%(sites)s)
+    GROUP BY category.id
+)
+INSERT INTO service_crawltarget AS target (kind, target_id, site, popularity, interval, due_at)
+SELECT 'category', id, site, popularity, {interval}, NOW() FROM popularity
+ON CONFLICT (kind, target_id) DO UPDATE SET
+    popularity = EXCLUDED.popularity,
+    interval = EXCLUDED.interval,
+    due_at = COALESCE(target.checked_at + EXCLUDED.interval * INTERVAL '1 second', NOW())
+"""
+
+STALE_TARGETS_SQL = """
+DELETE FROM service_crawltarget AS target
+WHERE (kind = 'product' AND NOT EXISTS(
+          SELECT 1 FROM products_product AS product WHERE product.id = target.target_id AND product.is_active
+      ))
+   OR (kind = 'category' AND NOT EXISTS(
+          SELECT 1 FROM products_category AS category WHERE category.id = target.target_id AND NOT category.deactivated
+      ))
+"""
+
+# the most overdue targets relative to their interval first
+DUE_TARGETS_SQL = """
+SELECT target_id FROM service_crawltarget
+WHERE site = %(site)s AND kind = %(kind)s AND due_at <= NOW() AND scheduled_at IS NULL
+ORDER BY EXTRACT(EPOCH FROM NOW() - COALESCE(checked_at, '-infinity')) / interval DESC, target_id
+LIMIT %(limit)s
+"""
+
+
+def crawl_sites() -> list[str]:
+    return sorted({site for site, _ in CRAWL_SPIDERS})
+
+
+def refresh_targets() -> None:
+    """
+    recomputes the popularity and interval of every product and category target, the removed ones are dropped
+    """
+    config = settings.CRAWL_SCHEDULER
+    interval_sql = INTERVAL_SQL % {
+        "max_interval": int(config["MAX_INTERVAL_SECONDS"]),
+        "min_interval": int(config["MIN_INTERVAL_SECONDS"]),
+        "hot_popularity": float(config["HOT_POPULARITY"])
+    }
+    params = {
+        "reviews_weight": config["WEIGHTS"]["REVIEWS"],
+        "orders_weight": config["WEIGHTS"]["ORDERS"],
+        "sites": crawl_sites()
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PRODUCT_TARGETS_SQL.format(interval=interval_sql), params)
+        cursor.execute(CATEGORY_TARGETS_SQL.format(interval=interval_sql), params)
+        cursor.execute(STALE_TARGETS_SQL)
+
+
+def backoff_until(site: str) -> float | None:
+    backoff = caches["default"].get(BACKOFF_KEY % site)
+    if backoff and backoff["until"] > timezone.now().timestamp():
+        return backoff["until"]
+    return None
+
+
+def register_throttling(site: str) -> float:
+    """
+    429 responses of the site: no new jobs for a while, the pause doubles while the throttling goes on
+    """
+    config = settings.CRAWL_SCHEDULER
+    cache = caches["default"]
+    backoff = cache.get(BACKOFF_KEY % site)
+    seconds = config["BACKOFF_SECONDS"]
+    if backoff:
+        seconds = min(backoff["seconds"] * 2, config["MAX_BACKOFF_SECONDS"])
+
+    until = timezone.now().timestamp() + seconds
+    # the pause resets once the site is quiet for a whole max backoff
+    cache.set(BACKOFF_KEY % site, {"until": until, "seconds": seconds}, timeout=seconds + config["MAX_BACKOFF_SECONDS"])
+    logging.warning("Crawling of %s is throttled, paused for %ss" % (site, seconds))
+    return until
+
+
+def due_targets(site: str, kind: str, limit: int) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(DUE_TARGETS_SQL, {"site": site, "kind": kind, "limit": limit})
+        return [row[0] for row in cursor.fetchall()]
+
+
+def used_requests(site: str) -> int:
+    """
+    requests of the site jobs started within the last hour, the planned ones until the crawler reports
+    """
+    jobs = CrawlJob.objects.filter(site=site, created_at__gte=timezone.now() - timedelta(hours=1))
+    return jobs.aggregate(used=Sum(Greatest('planned_requests', 'requests_count')))["used"] or 0
+
+
+def release_targets(job: CrawlJob, checked: bool) -> None:
+    targets = CrawlTarget.objects.filter(kind=job.kind, target_id__in=job.target_ids)
+    if checked:
+        targets.update(
+            checked_at=Now(),
+            due_at=ExpressionWrapper(Now() + F('interval') * timedelta(seconds=1), output_field=DateTimeField()),
+            scheduled_at=None
+        )
+    else:
+        targets.update(scheduled_at=None)
+
+
+def launch_job(scrapyd, site: str, kind: str, target_ids: list[str]) -> CrawlJob:
+    config = settings.CRAWL_SCHEDULER
+    spider, argument = CRAWL_SPIDERS[(site, kind)]
+    job = CrawlJob.objects.create(
+        spider=spider.value,
+        site=site,
+        kind=kind,
+        target_ids=target_ids,
+        planned_requests=len(target_ids) * config["REQUESTS_PER_TARGET"][kind]
+    )
+    CrawlTarget.objects.filter(kind=kind, target_id__in=target_ids).update(scheduled_at=Now())
+
+    try:
+        job.scrapyd_job_id = scrapyd.schedule(
+            config["PROJECT"], spider.value, crawl_job_id=str(job.id), **{argument: ",".join(target_ids)}
+        )
+    except Exception as e:
+        logging.error("Crawl job %s is not scheduled: %s" % (job.id, e))
+        # nothing was sent, the planned requests don't take the budget of the hour
+        job.status, job.error, job.finished_at = CrawlJob.Status.failed, str(e), timezone.now()
+        job.planned_requests = 0
+        job.save(update_fields=("status", "error", "finished_at", "planned_requests"))
+        release_targets(job, checked=False)
+        return job
+
+    job.status, job.started_at = CrawlJob.Status.running, timezone.now()
+    job.save(update_fields=("scrapyd_job_id", "status", "started_at"))
+    return job
+
+
+def finish_job(job: CrawlJob, status: str, error: str = None) -> None:
+    """
+    only a finished job counts as a check of its targets, the targets of the other ones are due again
+    """
+    with transaction.atomic():
+        updated = CrawlJob.objects.filter(id=job.id, status__in=(CrawlJob.Status.pending, CrawlJob.Status.running)) \
+                                  .update(status=status, error=error, finished_at=Now())
+        if updated:
+            release_targets(job, checked=status == CrawlJob.Status.finished)
+
+
+def report_job(job: CrawlJob, items: int, requests: int, throttled: int, error: str = None) -> None:
+    """
+    counters sent by the crawler at the end of the job, the 429 responses pause the site
+    """
+    CrawlJob.objects.filter(id=job.id).update(items_count=items, requests_count=requests, throttled_count=throttled)
+    if throttled:
+        register_throttling(job.site)
+        status = CrawlJob.Status.throttled
+    else:
+        status = CrawlJob.Status.failed if error else CrawlJob.Status.finished
+    finish_job(job, status, error=error)
+
+
+def sync_jobs(scrapyd) -> None:
+    """
+    the jobs finished without a report (ex: the crawler crashed) and the jobs lost by scrapyd
+    """
+    config = settings.CRAWL_SCHEDULER
+    active_jobs = list(CrawlJob.objects.filter(status=CrawlJob.Status.running))
+    if not active_jobs:
+        return
+
+    states = scrapyd.list_jobs(config["PROJECT"])
+    finished = {job["id"] for job in states.get("finished", [])}
+    known = finished | {job["id"] for state in ("pending", "running") for job in states.get(state, [])}
+    lost_before = timezone.now() - timedelta(seconds=config["JOB_TIMEOUT_SECONDS"])
+    for job in active_jobs:
+        if job.scrapyd_job_id in finished:
+            finish_job(job, CrawlJob.Status.finished)
+        elif job.scrapyd_job_id not in known or job.started_at < lost_before:
+            finish_job(job, CrawlJob.Status.failed, error="lost by scrapyd or timed out")
+
+
+def schedule_crawl(scrapyd) -> list[CrawlJob]:
+    """
+    Launches the shards of the most overdue targets of every site,
+    within the concurrent jobs limit and the hourly requests budget, nothing while the site is throttled.
+    """
+    config = settings.CRAWL_SCHEDULER
+    sync_jobs(scrapyd)
+
+    launched = []
+    for site in crawl_sites():
+        if backoff_until(site):
+            continue
+
+        active = CrawlJob.objects.filter(
+            site=site, status__in=(CrawlJob.Status.pending, CrawlJob.Status.running)
+        ).count()
+        slots = config["MAX_CONCURRENT_JOBS"] - active
+        budget = config["REQUESTS_PER_HOUR"] - used_requests(site)
+
+        # the categories bring the new products, they go first
+        for kind in (CrawlTarget.Kind.category, CrawlTarget.Kind.product):
+            if (site, kind) not in CRAWL_SPIDERS:
+                continue
+
+            cost = config["REQUESTS_PER_TARGET"][kind]
+            shard_size = config["SHARD_SIZE"][kind]
+            limit = min(slots * shard_size, budget // cost)
+            if limit <= 0:
+                continue
+
+            target_ids = due_targets(site, kind, limit)
+            for start in range(0, len(target_ids), shard_size):
+                job = launch_job(scrapyd, site, kind, target_ids[start:start + shard_size])
+                launched.append(job)
+                if job.status == CrawlJob.Status.running:
+                    slots -= 1
+                    budget -= job.planned_requests
+
+    logging.info("Crawl jobs launched: %s" % len(launched))
+    return launched
+
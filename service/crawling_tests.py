@@ -0,0 +1,140 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .crawling import schedule_crawl, report_job, backoff_until
+from .enums import Spider
+from .models import CrawlJob, CrawlTarget
+from .tasks import crawl_scheduled_targets
+
+
+class StubScrapyd:
+    """
+    stands in for scrapyd_api.ScrapydAPI: records the scheduled jobs, the states are set by the test
+    """
+    def __init__(self):
+        self.scheduled = []
+        self.finished = set()
+        self.fail = False
+
+    def schedule(self, project, spider, **kwargs):
+        if self.fail:
+            raise ConnectionError("scrapyd is down")
+        job_id = "scrapyd-%s" % len(self.scheduled)
+        self.scheduled.append((project, spider, kwargs))
+        return job_id
+
+    def list_jobs(self, project):
+        scheduled = ["scrapyd-%s" % index for index in range(len(self.scheduled))]
+        return {
+            "pending": [],
+            "running": [{"id": job_id} for job_id in scheduled if job_id not in self.finished],
+            "finished": [{"id": job_id} for job_id in scheduled if job_id in self.finished]
+        }
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CRAWL_SCHEDULER={
+        "PROJECT": "default",
+        "REQUESTS_PER_HOUR": 100,
+        "REQUESTS_PER_TARGET": {"product": 1, "category": 30},
+        "MAX_CONCURRENT_JOBS": 2,
+        "SHARD_SIZE": {"product": 10, "category": 2},
+        "MIN_INTERVAL_SECONDS": 60 * 60,
+        "MAX_INTERVAL_SECONDS": 7 * 24 * 60 * 60,
+        "HOT_POPULARITY": 10,
+        "WEIGHTS": {"REVIEWS": 1, "ORDERS": 3},
+        "BACKOFF_SECONDS": 5 * 60,
+        "MAX_BACKOFF_SECONDS": 60 * 60,
+        "JOB_TIMEOUT_SECONDS": 6 * 60 * 60,
+        "LOCK_SECONDS": 60,
+    }
+)
+class TestCrawlScheduler(TestCase):
+    def setUp(self):
+        # the site backoffs of the other tests
+        caches["default"].clear()
+        self.scrapyd = StubScrapyd()
+        now = timezone.now()
+        for index in range(50):
+            # the higher index the longer overdue relative to the interval
+            CrawlTarget.objects.create(
+                kind=CrawlTarget.Kind.product,
+                target_id="rakuten_product_%02d" % index,
+                site="rakuten",
+                interval=60 * 60,
+                checked_at=now - timedelta(hours=1 + index),
+                due_at=now - timedelta(hours=index)
+            )
+
+    def test_shards_within_concurrency(self):
+        jobs = schedule_crawl(self.scrapyd)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(len(self.scrapyd.scheduled), 2)
+        self.assertTrue(all(len(job.target_ids) == 10 for job in jobs))
+        # the most overdue first
+        self.assertEqual(jobs[0].target_ids[0], "rakuten_product_49")
+        _, spider, kwargs = self.scrapyd.scheduled[0]
+        self.assertEqual(spider, Spider.rakuten_check_products.value)
+        self.assertEqual(kwargs["product_ids"].split(","), jobs[0].target_ids)
+        self.assertEqual(CrawlTarget.objects.filter(scheduled_at__isnull=False).count(), 20)
+
+        # no free slots until scrapyd finishes a job
+        self.assertEqual(schedule_crawl(self.scrapyd), [])
+
+    def test_finished_job_checks_targets(self):
+        jobs = schedule_crawl(self.scrapyd)
+        self.scrapyd.finished.add(jobs[0].scrapyd_job_id)
+        schedule_crawl(self.scrapyd)
+
+        jobs[0].refresh_from_db()
+        self.assertEqual(jobs[0].status, CrawlJob.Status.finished)
+        target = CrawlTarget.objects.get(target_id=jobs[0].target_ids[0])
+        self.assertIsNone(target.scheduled_at)
+        self.assertGreater(target.due_at, timezone.now() + timedelta(minutes=59))
+
+    def test_requests_budget(self):
+        CrawlJob.objects.create(spider=Spider.rakuten_check_products.value, site="rakuten", kind="product",
+                                target_ids=[], status=CrawlJob.Status.finished, requests_count=95)
+        jobs = schedule_crawl(self.scrapyd)
+        self.assertEqual(sum(len(job.target_ids) for job in jobs), 5)
+
+    def test_throttled_site_is_paused(self):
+        job = schedule_crawl(self.scrapyd)[0]
+        report_job(job, items=3, requests=10, throttled=4)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.throttled)
+        self.assertIsNotNone(backoff_until("rakuten"))
+        # the throttled targets are not checked, they stay due
+        self.assertFalse(CrawlTarget.objects.filter(target_id__in=job.target_ids, checked_at__gt=job.created_at))
+        self.scrapyd.finished.add(job.scrapyd_job_id)
+        self.assertEqual(schedule_crawl(self.scrapyd), [])
+
+    def test_unscheduled_job_releases_targets(self):
+        self.scrapyd.fail = True
+        jobs = schedule_crawl(self.scrapyd)
+        self.assertTrue(all(job.status == CrawlJob.Status.failed for job in jobs))
+        self.assertFalse(CrawlTarget.objects.filter(scheduled_at__isnull=False).exists())
+
+        # the failed launches don't use the requests budget
+        for _ in range(5):
+            schedule_crawl(self.scrapyd)
+        self.scrapyd.fail = False
+        jobs = schedule_crawl(self.scrapyd)
+        self.assertEqual(sum(len(job.target_ids) for job in jobs), 20)
+
+    def test_one_scheduler_run_at_a_time(self):
+        with mock.patch("service.tasks.scrapyd", self.scrapyd):
+            caches["default"].add("crawl_scheduler", 1)
+            crawl_scheduled_targets()
+            self.assertEqual(self.scrapyd.scheduled, [])
+
+            caches["default"].delete("crawl_scheduler")
+            crawl_scheduled_targets()
+            self.assertEqual(len(self.scrapyd.scheduled), 2)
+            self.assertIsNone(caches["default"].get("crawl_scheduler"))
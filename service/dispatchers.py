@@ -0,0 +1,79 @@
+import json
+import logging
+from typing import Any, Iterable
+
+from celery import Task
+from django.db import transaction
+from django_redis import get_redis_connection
+
+
+PENDING_KEY = "dispatch:pending:%s"
+ARGS_KEY = "dispatch:args:%s"
+METRICS_KEY = "dispatch:metrics"
+# merged args of a lost run are picked up by the next dispatch of the key
+ARGS_TIMEOUT = 24 * 60 * 60
+
+
+def get_connection():
+    return get_redis_connection("default")
+
+
+def dispatch_once(task: "CoalescedTask", key: str, window: float, args: Iterable[Any] = None) -> None:
+    """
+    Schedules a single run of the task per key within the window, after the current transaction commit.
+    The calls made while a run is pending are redundant and only counted, except their args:
+    for batchable tasks (batch=True) the args of all these calls are merged and passed to the run as one list.
+    """
+    args = list(args) if args is not None else None
+    transaction.on_commit(lambda: _dispatch(task, key, window, args))
+
+
+def _dispatch(task: "CoalescedTask", key: str, window: float, args: list[Any] | None) -> None:
+    connection = get_connection()
+    if args:
+        # the args must be stored before the pending mark is checked, the run releases them in reverse order
+        connection.pipeline().sadd(ARGS_KEY % key, *(json.dumps(arg) for arg in args)) \
+                             .expire(ARGS_KEY % key, ARGS_TIMEOUT) \
+                             .execute()
+
+    # the mark outlives the countdown, a run that never starts doesn't block the key forever
+    if connection.set(PENDING_KEY % key, 1, nx=True, ex=max(int(window * 2), 60)):
+        task.apply_async(kwargs={"dispatch_key": key}, countdown=window)
+        connection.hincrby(METRICS_KEY, "%s:dispatched" % task.name, 1)
+    else:
+        connection.hincrby(METRICS_KEY, "%s:coalesced" % task.name, 1)
+
+
+def release(key: str) -> list[Any]:
+    """
+    clears the pending mark of the key and returns the merged args
+    """
+    connection = get_connection()
+    connection.delete(PENDING_KEY % key)
+    args, _ = connection.pipeline().smembers(ARGS_KEY % key).delete(ARGS_KEY % key).execute()
+    return [json.loads(arg) for arg in args]
+
+
+def dispatch_metrics() -> dict[str, int]:
+    return {name.decode(): int(value) for name, value in get_connection().hgetall(METRICS_KEY).items()}
+
+
+class CoalescedTask(Task):
+    """
+    Base of the tasks scheduled with dispatch_once, ex: @app.task(base=CoalescedTask, batch=True).
+    The run releases its key when it starts, so the changes made during the run schedule the next one.
+    Batchable tasks take the merged args list as the first argument, they can still be called directly.
+    """
+    batch = False
+    # dispatch_key is not in the signature of the task functions
+    typing = False
+
+    def __call__(self, *args, dispatch_key: str = None, **kwargs):
+        if dispatch_key is not None:
+            merged_args = release(dispatch_key)
+            if self.batch:
+                if not merged_args:
+                    logging.info("%s: nothing to do for %s" % (self.name, dispatch_key))
+                    return None
+                args = (merged_args, *args)
+        return super().__call__(*args, **kwargs)
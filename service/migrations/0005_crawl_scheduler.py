@@ -0,0 +1,64 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:46
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0004_rate_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('spider', models.CharField(max_length=100)),
+                ('site', models.CharField(max_length=50)),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('category', 'Category')], max_length=20)),
+                ('target_ids', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), size=None)),
+                ('scrapyd_job_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed'), ('throttled', 'Throttled')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('planned_requests', models.PositiveIntegerField(default=0)),
+                ('requests_count', models.PositiveIntegerField(default=0)),
+                ('items_count', models.PositiveIntegerField(default=0)),
+                ('throttled_count', models.PositiveIntegerField(default=0, help_text='429 responses')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CrawlTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('category', 'Category')], max_length=20)),
+                ('target_id', models.CharField(max_length=100)),
+                ('site', models.CharField(max_length=50)),
+                ('popularity', models.FloatField(default=0)),
+                ('interval', models.PositiveIntegerField(help_text='refresh interval, seconds')),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('due_at', models.DateTimeField()),
+                ('scheduled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['site', 'kind', 'due_at'], name='service_cra_site_533487_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='crawltarget',
+            constraint=models.UniqueConstraint(fields=('kind', 'target_id'), name='unique_crawl_target'),
+        ),
+        migrations.AddIndex(
+            model_name='crawljob',
+            index=models.Index(fields=['site', 'created_at'], name='service_cra_site_f39576_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crawljob',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'running'))), fields=['status'], name='crawl_job_active_idx'),
+        ),
+    ]
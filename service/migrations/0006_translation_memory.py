@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0005_crawl_scheduler'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_lang', models.CharField(max_length=10)),
+                ('target_lang', models.CharField(max_length=10)),
+                ('source_hash', models.CharField(max_length=32)),
+                ('source_text', models.TextField()),
+                ('translated_text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Translation memory',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='translationmemory',
+            constraint=models.UniqueConstraint(fields=('source_lang', 'target_lang', 'source_hash'), name='unique_translation'),
+        ),
+    ]
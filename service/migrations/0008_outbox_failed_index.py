@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0007_outbox_redispatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('failed_at__isnull', False)), fields=['failed_at'], name='outbox_failed_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
+import uuid
 from decimal import Decimal
 
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.template.defaultfilters import truncatechars
 from django.utils.translation import gettext_lazy as _
 
 
@@ -41,3 +44,147 @@ class Conversion(models.Model):
         if not isinstance(current_price, Decimal):
             current_price = Decimal(current_price)
         return round(current_price * self.price_per, 2)
+
+
+class RateSnapshot(models.Model):
+    """
+    immutable copy of all conversions, a new one is taken when a conversion changes
+    """
+    objects = models.Manager()
+
+    # {currency_from: {currency_to: price_per}}
+    rates = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class OutboxEvent(models.Model):
+    """
+    a celery task call written in the transaction of the change that causes it (see service.outbox)
+    """
+    objects = models.Manager()
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # sends of the event, it is dead-lettered (failed_at) once they are exhausted
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # a worker runs the task, an old claim is of a dead worker
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("created_at",), condition=models.Q(dispatched_at__isnull=True),
+                         name="outbox_pending_idx"),
+            models.Index(fields=("dispatched_at",),
+                         condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+                         name="outbox_unprocessed_idx"),
+            models.Index(fields=("failed_at",), condition=models.Q(failed_at__isnull=False),
+                         name="outbox_failed_idx"),
+            models.Index(fields=("processed_at",), condition=models.Q(processed_at__isnull=False),
+                         name="outbox_processed_idx"),
+        )
+
+
+class CrawlTarget(models.Model):
+    """
+    freshness of a crawled product or category (see service.crawling):
+    the popular targets get a short refresh interval, the score is the time since the check over the interval
+    """
+    objects = models.Manager()
+
+    class Kind(models.TextChoices):
+        product = 'product', _('Product')
+        category = 'category', _('Category')
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    target_id = models.CharField(max_length=100)
+    site = models.CharField(max_length=50)
+    popularity = models.FloatField(default=0)
+    interval = models.PositiveIntegerField(help_text=_('refresh interval, seconds'))
+    checked_at = models.DateTimeField(null=True, blank=True)
+    due_at = models.DateTimeField()
+    # set while a job crawls the target
+    scheduled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=("kind", "target_id"), name="unique_crawl_target"),
+        )
+        indexes = (
+            models.Index(fields=("site", "kind", "due_at")),
+        )
+
+
+class CrawlJob(models.Model):
+    """
+    one shard of targets crawled by a scrapyd job, the crawler reports the counters (see service.crawling)
+    """
+    objects = models.Manager()
+
+    class Status(models.TextChoices):
+        pending = 'pending', _('Pending')
+        running = 'running', _('Running')
+        finished = 'finished', _('Finished')
+        failed = 'failed', _('Failed')
+        throttled = 'throttled', _('Throttled')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    spider = models.CharField(max_length=100)
+    site = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20, choices=CrawlTarget.Kind.choices)
+    target_ids = ArrayField(models.CharField(max_length=100))
+    scrapyd_job_id = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.pending)
+    error = models.TextField(blank=True, null=True)
+
+    planned_requests = models.PositiveIntegerField(default=0)
+    requests_count = models.PositiveIntegerField(default=0)
+    items_count = models.PositiveIntegerField(default=0)
+    throttled_count = models.PositiveIntegerField(default=0, help_text=_('429 responses'))
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("site", "created_at")),
+            models.Index(fields=("status",), condition=models.Q(status__in=("pending", "running")),
+                         name="crawl_job_active_idx"),
+        )
+
+    @property
+    def throughput(self) -> float | None:
+        # items per second
+        if not self.started_at or not self.finished_at:
+            return None
+        seconds = (self.finished_at - self.started_at).total_seconds()
+        return round(self.items_count / seconds, 2) if seconds > 0 else None
+
+
+class TranslationMemory(models.Model):
+    """
+    translated texts, looked up by the hash of the text within the languages pair (see service.translation)
+    """
+    objects = models.Manager()
+
+    source_lang = models.CharField(max_length=10)
+    target_lang = models.CharField(max_length=10)
+    source_hash = models.CharField(max_length=32)
+    source_text = models.TextField()
+    translated_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = _('Translation memory')
+        constraints = (
+            models.UniqueConstraint(fields=("source_lang", "target_lang", "source_hash"), name="unique_translation"),
+        )
+
+    def __str__(self):
+        return "%s (%s-%s)" % (truncatechars(self.source_text, 30), self.source_lang, self.target_lang)
@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable
+from uuid import UUID
+
+from celery import Task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from kaimon.celery import app
+
+from .models import OutboxEvent
+
+
+def publish(task: "OutboxTask", *args, **kwargs) -> OutboxEvent:
+    """
+    Records the task call in the current transaction, it is sent to celery once the transaction commits.
+    A process crash between the commit and the sending is covered by the sweeper (relay_pending_events),
+    so is a broker error: it is logged by the robust hook, the request doesn't fail once committed.
+    """
+    event = OutboxEvent.objects.create(task=task.name, args=list(args), kwargs=kwargs)
+    transaction.on_commit(lambda: relay([event.id]), robust=True)
+    return event
+
+
+def send(event: OutboxEvent) -> None:
+    # the event id is the celery task id, duplicates are dropped by OutboxTask
+    app.tasks[event.task].apply_async(
+        args=event.args,
+        kwargs={**event.kwargs, "outbox_event_id": str(event.id)},
+        task_id=str(event.id)
+    )
+
+
+def dispatch(events: list[OutboxEvent]) -> None:
+    """
+    sends the locked events, the events of an unknown task or out of attempts are dead-lettered (failed_at)
+    """
+    now = timezone.now()
+    sent, failed = [], []
+    for event in events:
+        if event.task not in app.tasks:
+            logging.error("Outbox event %s: unknown task %s" % (event.id, event.task))
+            failed.append(event.id)
+        elif event.attempts >= settings.OUTBOX["MAX_ATTEMPTS"]:
+            logging.error("Outbox event %s: %s is not processed after %s attempts" % (
+                event.id, event.task, event.attempts
+            ))
+            failed.append(event.id)
+        else:
+            send(event)
+            sent.append(event.id)
+    OutboxEvent.objects.filter(id__in=sent).update(dispatched_at=now, attempts=F('attempts') + 1)
+    OutboxEvent.objects.filter(id__in=failed).update(failed_at=now)
+
+
+def relay(event_ids: Iterable[UUID] = None, batch_size: int = None, created_before: datetime = None) -> int:
+    """
+    sends the not yet dispatched events (the oldest first), the events locked by another relay are skipped
+    """
+    events = OutboxEvent.objects.filter(dispatched_at__isnull=True, failed_at__isnull=True)
+    if event_ids is not None:
+        events = events.filter(id__in=list(event_ids))
+    if created_before is not None:
+        events = events.filter(created_at__lt=created_before)
+
+    with transaction.atomic():
+        events = list(events.select_for_update(skip_locked=True).order_by('created_at')[:batch_size])
+        dispatch(events)
+    return len(events)
+
+
+def redispatch(before: datetime, batch_size: int) -> int:
+    """
+    sends again the dispatched events not processed since before: the message is lost, the worker died
+    with the claim or the celery retries are exhausted
+    """
+    events = OutboxEvent.objects.filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=before),
+        dispatched_at__lt=before,
+        processed_at__isnull=True,
+        failed_at__isnull=True
+    )
+    with transaction.atomic():
+        events = list(events.select_for_update(skip_locked=True).order_by('dispatched_at')[:batch_size])
+        dispatch(events)
+    return len(events)
+
+
+def relay_pending_events() -> int:
+    """
+    sweeper: events missed by the commit hook, stale dispatched events,
+    the old processed and dead-lettered events are removed.
+    A batch shorter than BATCH_SIZE is the last one, the rows locked by another relay are skipped, not waited for.
+    """
+    config = settings.OUTBOX
+    now = timezone.now()
+    kept_since = now - timedelta(days=config["KEEP_DAYS"])
+    OutboxEvent.objects.filter(processed_at__lt=kept_since).delete()
+    OutboxEvent.objects.filter(failed_at__lt=kept_since).delete()
+
+    relayed = 0
+    created_before = now - timedelta(seconds=config["SWEEP_AFTER_SECONDS"])
+    while True:
+        sent = relay(batch_size=config["BATCH_SIZE"], created_before=created_before)
+        relayed += sent
+        if sent < config["BATCH_SIZE"]:
+            break
+    while True:
+        sent = redispatch(now - timedelta(seconds=config["REDISPATCH_AFTER_SECONDS"]), config["BATCH_SIZE"])
+        relayed += sent
+        if sent < config["BATCH_SIZE"]:
+            break
+    return relayed
+
+
+class OutboxTask(Task):
+    """
+    Base of the tasks published through the outbox, ex: @app.task(base=OutboxTask).
+    A run claims its event, so a relayed twice event is processed once, the event is processed when the run ends.
+    The claim is released when the task fails, for the celery retries, a claim older than REDISPATCH_AFTER_SECONDS
+    is of a dead worker and is taken over.
+    """
+    # outbox_event_id is not in the signature of the task functions
+    typing = False
+
+    def __call__(self, *args, outbox_event_id: str = None, **kwargs):
+        # run, not super().__call__: Task.__call__ pushes a new request, the worker one (id, retries) would be lost
+        if outbox_event_id is None:
+            return self.run(*args, **kwargs)
+
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.OUTBOX["REDISPATCH_AFTER_SECONDS"])
+        claimed = OutboxEvent.objects.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale),
+                                             id=outbox_event_id, processed_at__isnull=True) \
+                                     .update(claimed_at=now)
+        if not claimed:
+            logging.info("%s: outbox event %s is already processed or running" % (self.name, outbox_event_id))
+            return None
+
+        try:
+            result = self.run(*args, **kwargs)
+        except Exception:
+            OutboxEvent.objects.filter(id=outbox_event_id).update(claimed_at=None)
+            raise
+        OutboxEvent.objects.filter(id=outbox_event_id).update(processed_at=timezone.now())
+        return result
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from kaimon.celery import app
+
+from .models import OutboxEvent
+from .outbox import OutboxTask, publish, relay_pending_events
+
+
+calls = []
+requests = []
+
+
+@app.task(base=OutboxTask, bind=True)
+def record_call(self, value):
+    calls.append(value)
+    requests.append((self.request.id, self.request.retries))
+    if value == "fail":
+        raise ValueError("the task failed")
+
+
+@override_settings(OUTBOX={
+    "SWEEP_AFTER_SECONDS": 60,
+    "REDISPATCH_AFTER_SECONDS": 30 * 60,
+    "MAX_ATTEMPTS": 3,
+    "BATCH_SIZE": 2,
+    "KEEP_DAYS": 7,
+})
+class TestOutbox(TestCase):
+    def setUp(self):
+        calls.clear()
+        requests.clear()
+        # stands in for the broker: the sent events are recorded, the test runs them
+        self.sent = []
+        patcher = mock.patch("service.outbox.send", side_effect=self.sent.append)
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def event(self, value, age, **fields):
+        event = OutboxEvent.objects.create(task=record_call.name, args=[value], **fields)
+        OutboxEvent.objects.filter(id=event.id).update(created_at=timezone.now() - age)
+        return event
+
+    def run_event(self, event):
+        return record_call(*event.args, outbox_event_id=str(event.id))
+
+    def test_broker_error_after_commit(self):
+        self.send.side_effect = ConnectionError("the broker is down")
+        with self.captureOnCommitCallbacks(execute=True):
+            event = publish(record_call, "a")
+
+        event.refresh_from_db()
+        self.assertIsNone(event.dispatched_at)
+        self.assertEqual(event.attempts, 0)
+
+    def test_sweeper_relays_missed_events(self):
+        events = [self.event(value, timedelta(minutes=5)) for value in "abcde"]
+        unknown = OutboxEvent.objects.create(task="removed.task", args=[])
+        OutboxEvent.objects.filter(id=unknown.id).update(created_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(relay_pending_events(), 6)
+        self.assertEqual([event.id for event in self.sent], [event.id for event in events])
+        unknown.refresh_from_db()
+        self.assertIsNotNone(unknown.failed_at)
+        self.assertEqual(OutboxEvent.objects.filter(dispatched_at__isnull=False, attempts=1).count(), 5)
+
+    def test_processed_once(self):
+        event = self.event("a", timedelta(minutes=5), dispatched_at=timezone.now())
+        self.run_event(event)
+        self.run_event(event)
+
+        self.assertEqual(calls, ["a"])
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+
+    def test_stale_events_are_sent_again(self):
+        hour_ago = timezone.now() - timedelta(hours=1)
+        # the message is lost, the worker died with the claim, the retries are exhausted
+        lost = self.event("lost", timedelta(hours=2), dispatched_at=hour_ago, attempts=1)
+        killed = self.event("killed", timedelta(hours=2), dispatched_at=hour_ago, claimed_at=hour_ago, attempts=1)
+        failed = self.event("fail", timedelta(hours=2), dispatched_at=hour_ago, attempts=1)
+        with self.assertRaises(ValueError):
+            self.run_event(failed)
+        # a recent claim is running, a recent dispatch is on its way
+        running = self.event("running", timedelta(hours=2), dispatched_at=hour_ago, claimed_at=timezone.now())
+        recent = self.event("recent", timedelta(minutes=5), dispatched_at=timezone.now())
+
+        self.assertEqual(relay_pending_events(), 3)
+        self.assertEqual({event.id for event in self.sent}, {lost.id, killed.id, failed.id})
+        self.assertEqual(OutboxEvent.objects.filter(attempts=2).count(), 3)
+
+        self.run_event(killed)
+        killed.refresh_from_db()
+        self.assertIsNotNone(killed.processed_at)
+        self.run_event(running)
+        self.assertEqual(calls, ["fail", "killed"])
+        self.assertIsNone(OutboxEvent.objects.get(id=recent.id).processed_at)
+
+    def test_exhausted_attempts_are_dead_lettered(self):
+        event = self.event("fail", timedelta(hours=2), dispatched_at=timezone.now() - timedelta(hours=1), attempts=3)
+
+        relay_pending_events()
+        self.assertEqual(self.sent, [])
+        event.refresh_from_db()
+        self.assertIsNotNone(event.failed_at)
+        self.assertEqual(relay_pending_events(), 0)
+
+    def test_dead_letters_dont_stop_the_sweep(self):
+        day_ago = timezone.now() - timedelta(days=1)
+        for _ in range(3):
+            dead = OutboxEvent.objects.create(task="removed.task", args=[], failed_at=day_ago)
+            OutboxEvent.objects.filter(id=dead.id).update(created_at=timezone.now() - timedelta(hours=1))
+        pending = self.event("a", timedelta(minutes=5))
+
+        self.assertEqual(relay_pending_events(), 1)
+        self.assertEqual([event.id for event in self.sent], [pending.id])
+
+        # the dead-lettered events are removed after KEEP_DAYS
+        OutboxEvent.objects.filter(failed_at__isnull=False).update(failed_at=timezone.now() - timedelta(days=8))
+        relay_pending_events()
+        self.assertFalse(OutboxEvent.objects.filter(failed_at__isnull=False).exists())
+
+    def test_worker_request_is_kept(self):
+        event = self.event("fail", timedelta(minutes=5), dispatched_at=timezone.now())
+        result = record_call.apply(args=["fail"], kwargs={"outbox_event_id": str(event.id)}, task_id=str(event.id),
+                                   retries=2)
+
+        self.assertIsInstance(result.result, ValueError)
+        self.assertEqual(requests, [(str(event.id), 2)])
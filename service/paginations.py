@@ -1,7 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class PagePagination(PageNumberPagination):
     page_size = 20
     max_page_size = 100
     page_size_query_param = 'page_size'
+
+
+class FeedCursorPagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = ('-sort_key', '-id')
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Conversion
+from .utils import take_rate_snapshot
+
+
+@receiver(post_save, sender=Conversion)
+@receiver(post_delete, sender=Conversion)
+def take_rate_snapshot_on_conversion_change(sender, **kwargs):
+    transaction.on_commit(take_rate_snapshot)
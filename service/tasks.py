@@ -1,8 +1,10 @@
 import logging
 
 from django.conf import settings
+from django.core.cache import caches
 
 from kaimon.celery import app
+from service.crawling import CRAWL_SPIDERS, refresh_targets, schedule_crawl
 from service.enums import Spider
 
 from scrapyd_api import ScrapydAPI
@@ -14,7 +16,11 @@ scrapyd = ScrapydAPI(settings.CRAWLER_URL, auth=(settings.CRAWLER_USER, settings
 @app.task()
 def start_spider(spider_name: str = None):
     if spider_name is None:
+        # the scheduled spiders crawl their targets in shards, see crawl_scheduled_targets
+        scheduled_spiders = {spider for spider, _ in CRAWL_SPIDERS.values()}
         for spider in Spider:
+            if spider in scheduled_spiders:
+                continue
             logging.info(f'Launch scraping {spider.value}...')
             scrapyd.schedule('default', spider.value)
         return
@@ -25,3 +31,23 @@ def start_spider(spider_name: str = None):
 
     logging.info(f'Launch scraping {spider_name}...')
     scrapyd.schedule('default', spider_name.lower())
+
+
+@app.task()
+def crawl_scheduled_targets():
+    cache = caches["default"]
+    lock_key = "crawl_scheduler"
+    # two runs would launch the same due targets twice
+    if not cache.add(lock_key, 1, timeout=settings.CRAWL_SCHEDULER["LOCK_SECONDS"]):
+        logging.info("Crawl scheduler is already running")
+        return
+
+    try:
+        schedule_crawl(scrapyd)
+    finally:
+        cache.delete(lock_key)
+
+
+@app.task()
+def refresh_crawl_targets():
+    refresh_targets()
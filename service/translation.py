@@ -0,0 +1,102 @@
+import hashlib
+import logging
+from typing import Iterable, Iterator
+
+from django.conf import settings
+
+from .clients.aio import run
+from .clients.translate import AsyncGoogleTranslateClient
+from .models import TranslationMemory
+from .utils import has_japanese
+
+
+def text_hash(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def single_line(text: str) -> str:
+    # the batch texts are joined by lines
+    return " ".join(text.split())
+
+
+def text_batches(texts: list[str], max_texts: int, max_chars: int) -> Iterator[list[str]]:
+    batch, chars = [], 0
+    for text in texts:
+        if batch and (len(batch) == max_texts or chars + len(text) > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(text)
+        chars += len(text) + 1
+    if batch:
+        yield batch
+
+
+def remembered(texts: set[str], source_lang: str, target_lang: str) -> dict[str, str]:
+    memory = TranslationMemory.objects.filter(
+        source_lang=source_lang,
+        target_lang=target_lang,
+        source_hash__in=[text_hash(text) for text in texts]
+    )
+    # the texts are compared too, a hash is not unique
+    return {text: translation for text, translation in memory.values_list("source_text", "translated_text")
+            if text in texts}
+
+
+async def translate_missing(texts: list[str], source_lang: str, target_lang: str) -> dict[str, str]:
+    """
+    the batches are sent concurrently, the client bounds the concurrency and retries 429 and 5xx with a backoff
+    """
+    config = settings.TRANSLATION
+    client = AsyncGoogleTranslateClient(base_url=config["BASE_URL"])
+    batches = list(text_batches(texts, config["BATCH_MAX_TEXTS"], config["BATCH_MAX_CHARS"]))
+    results = await client.gather(
+        client.translate_batch([single_line(text) for text in batch], source_lang, target_lang) for batch in batches
+    )
+
+    translations = {}
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logging.error("Translation of %s texts failed: %s" % (len(batch), result))
+            continue
+        translations.update((text, translation) for text, translation in zip(batch, result) if translation)
+    return translations
+
+
+def translate_texts(texts: Iterable[str], source_lang: str = "ja", target_lang: str = "en") -> dict[str, str]:
+    """
+    Translations of the distinct texts: the translation memory first, then the missing texts are translated
+    in batches (many texts per request) and remembered.
+    Japanese texts without japanese characters are kept as they are, the texts of the failed batches are missing.
+    """
+    texts = {text for text in texts if text and text.strip()}
+    translations = {}
+    if source_lang == "ja":
+        translations = {text: text for text in texts if not has_japanese(text)}
+
+    pending = texts - translations.keys()
+    if pending:
+        translations.update(remembered(pending, source_lang, target_lang))
+
+    missing = sorted(pending - translations.keys())
+    translated = {}
+    if missing:
+        translated = run(translate_missing(missing, source_lang, target_lang))
+        TranslationMemory.objects.bulk_create(
+            [
+                TranslationMemory(
+                    source_lang=source_lang,
+                    target_lang=target_lang,
+                    source_hash=text_hash(text),
+                    source_text=text,
+                    translated_text=translation
+                )
+                for text, translation in translated.items()
+            ],
+            ignore_conflicts=True
+        )
+        translations.update(translated)
+
+    logging.info("Translation %s-%s: %s texts, %s remembered, %s translated of %s" % (
+        source_lang, target_lang, len(texts), len(pending) - len(missing), len(translated), len(missing)
+    ))
+    return translations
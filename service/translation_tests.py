@@ -0,0 +1,109 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.test import TestCase, override_settings
+
+from .models import TranslationMemory
+from .translation import translate_texts
+from .utils import has_japanese, is_japanese_char
+
+
+class FakeTranslator(BaseHTTPRequestHandler):
+    """
+    stands in for the translate_a/single endpoint: every line becomes "en:<line>" in its own sentence
+    """
+    requests = []
+    # 429 answers before the first success
+    throttled = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        text = parse_qs(urlsplit(self.path).query)["q"][0]
+        with self.lock:
+            self.requests.append(text)
+            throttled, FakeTranslator.throttled = self.throttled, max(self.throttled - 1, 0)
+
+        if throttled:
+            return self.answer(429, {})
+        lines = text.split("\n")
+        sentences = [["en:%s%s" % (line, "\n" if index < len(lines) - 1 else ""), line]
+                     for index, line in enumerate(lines)]
+        self.answer(200, [sentences, None, "ja"])
+
+    def answer(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestJapaneseDetector(TestCase):
+    def test_detector(self):
+        self.assertTrue(has_japanese("Tシャツ"))
+        self.assertTrue(has_japanese("ﾚｯﾄﾞ"))
+        self.assertTrue(has_japanese("赤"))
+        self.assertFalse(has_japanese("XL 42cm"))
+        self.assertFalse(has_japanese(""))
+        self.assertTrue(is_japanese_char("あ"))
+        self.assertFalse(is_japanese_char("a"))
+
+
+class TestTranslation(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTranslator)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeTranslator.requests = []
+        FakeTranslator.throttled = 0
+        config = {
+            "BASE_URL": "http://127.0.0.1:%s/" % self.server.server_port,
+            "BATCH_MAX_TEXTS": 3,
+            "BATCH_MAX_CHARS": 600,
+        }
+        self.settings_override = override_settings(TRANSLATION=config)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_batches_and_memory(self):
+        texts = ["赤", "青", "黒", "白", "赤", "XL", "サイズ\nS"]
+        translations = translate_texts(texts)
+
+        self.assertEqual(translations["赤"], "en:赤")
+        self.assertEqual(translations["XL"], "XL")
+        self.assertEqual(translations["サイズ\nS"], "en:サイズ S")
+        # 5 distinct japanese texts, 3 per request
+        self.assertEqual(len(FakeTranslator.requests), 2)
+        self.assertEqual(TranslationMemory.objects.count(), 5)
+
+        translations = translate_texts(["赤", "緑"])
+        self.assertEqual(translations, {"赤": "en:赤", "緑": "en:緑"})
+        self.assertEqual(FakeTranslator.requests[-1], "緑")
+        self.assertEqual(len(FakeTranslator.requests), 3)
+
+    def test_throttling_retried(self):
+        FakeTranslator.throttled = 1
+        self.assertEqual(translate_texts(["赤"]), {"赤": "en:赤"})
+        self.assertEqual(len(FakeTranslator.requests), 2)
+
+    def test_failed_batch_is_not_remembered(self):
+        FakeTranslator.throttled = 100
+        self.assertEqual(translate_texts(["赤", "XL"]), {"XL": "XL"})
+        self.assertFalse(TranslationMemory.objects.exists())
@@ -1,4 +1,5 @@
 import json
+import re
 import unicodedata
 import uuid
 import time
@@ -12,7 +13,11 @@ from django.db import connection, reset_queries
 
 
 from .enums import Site, SiteCurrency
-from .models import Conversion, Currencies
+from .models import Conversion, Currencies, RateSnapshot
+
+
+# Hiragana, Katakana (and the half-width ones), CJK ideographs with the extension A
+JAPANESE_RE = re.compile(r"[\u3040-\u30ff\uff66-\uff9f\u3400-\u4dbf\u4e00-\u9fff]")
 
 
 def query_debugger(func):
@@ -126,6 +131,44 @@ def get_currencies_price_per(currency_from, currency_to) -> Decimal | None:
         return conversion.price_per
 
 
+def current_rates() -> dict[str, dict[str, float]]:
+    rates = {}
+    for currency_from, currency_to, price_per in Conversion.objects.values_list(
+        'currency_from', 'currency_to', 'price_per'
+    ):
+        rates.setdefault(currency_from, {})[currency_to] = float(price_per)
+    return rates
+
+
+def take_rate_snapshot() -> RateSnapshot:
+    rates = current_rates()
+    snapshot = RateSnapshot.objects.order_by('-id').first()
+    if snapshot and snapshot.rates == rates:
+        return snapshot
+    return RateSnapshot.objects.create(rates=rates)
+
+
+def current_rate_snapshot_id() -> int:
+    snapshot_id = RateSnapshot.objects.order_by('-id').values_list('id', flat=True).first()
+    return snapshot_id or take_rate_snapshot().id
+
+
+@lru_cache(maxsize=256)
+def get_rate_snapshot(snapshot_id: int) -> dict[str, dict[str, Decimal]]:
+    # snapshots never change, every process keeps the matrices it has read
+    rates = RateSnapshot.objects.values_list('rates', flat=True).get(id=snapshot_id)
+    return {
+        currency_from: {currency_to: Decimal(str(price_per)) for currency_to, price_per in prices.items()}
+        for currency_from, prices in rates.items()
+    }
+
+
+def snapshot_price_per(snapshot_id: int, currency_from: str, currency_to: str) -> Decimal | None:
+    if currency_from == currency_to:
+        return None
+    return get_rate_snapshot(snapshot_id).get(currency_from, {}).get(currency_to)
+
+
 def convert_price(current_price: float | Decimal | int, price_per: Decimal, divide: bool = False):
     if not isinstance(current_price, Decimal):
         current_price = Decimal(current_price)
@@ -156,25 +199,12 @@ def get_translated_text(select_lang, target_lang, text: str):
 
 
 def is_japanese_char(char):
-    # Normalize the character to NFKC form to handle different representations
-    normalized_char = unicodedata.normalize('NFKC', char)
-
-    # Check if the normalized character is a Japanese character
-    # Hiragana: U+3040 to U+309F
-    # Katakana: U+30A0 to U+30FF
-    # Kanji: U+4E00 to U+9FFF
-    japanese_ranges = [
-        (0x3040, 0x309F),
-        (0x30A0, 0x30FF),
-        (0x4E00, 0x9FFF)
-    ]
-
-    for start, end in japanese_ranges:
-        for code_point in range(start, end + 1):
-            if normalized_char == chr(code_point):
-                return True
-
-    return False
+    # NFKC handles the different representations of a character
+    return JAPANESE_RE.fullmatch(unicodedata.normalize('NFKC', char)) is not None
+
+
+def has_japanese(text: str) -> bool:
+    return bool(text) and JAPANESE_RE.search(text) is not None
 
 
 def get_tuple_from_query_param(param_value: str) -> tuple[str]: